@@ -0,0 +1,95 @@
+"""AIMD concurrency limit driven by observed upstream latency.
+
+``AIMDLimit`` keeps a no-load latency baseline (a low percentile of the last
+``baseline_window`` successful samples, so one unusually fast call does not
+become the yardstick and a permanently slower upstream is followed once it
+fills the window) and treats a call as congested when it fails with an
+overload status or, once ``min_samples`` successes have been seen, takes
+longer than ``baseline * latency_tolerance``:
+
+- congested: ``limit = max(min_limit, floor(limit * backoff_ratio))``, at
+  most once per baseline interval so a burst of slow calls that were all in
+  flight together counts as one signal;
+- otherwise, while at least half the limit is in use: ``limit += 1``.
+
+The caller applies ``limit`` to whatever gates the calls (here the edge
+function ``FairScheduler``) and should only feed latencies that are
+comparable: drops, and successes timed over the same amount of work.
+"""
+
+from __future__ import annotations
+
+import math
+import time
+from collections import deque
+
+from metrics import REGISTRY
+
+CONCURRENCY_LIMIT = REGISTRY.gauge(
+    "shopify_edge_concurrency_limit",
+    "Current adaptive limit on concurrent edge function calls.",
+)
+LATENCY_BASELINE_SECONDS = REGISTRY.gauge(
+    "shopify_edge_latency_baseline_seconds",
+    "No-load latency baseline the adaptive limit compares samples against.",
+)
+LIMIT_ADJUSTMENTS = REGISTRY.counter(
+    "shopify_edge_limit_adjustments_total",
+    "Adaptive limit changes, by direction (increase, decrease).",
+    ("direction",),
+)
+
+
+class AIMDLimit:
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int,
+        max_limit: int,
+        latency_tolerance: float = 2.0,
+        backoff_ratio: float = 0.75,
+        baseline_window: int = 100,
+        baseline_percentile: float = 0.1,
+        min_samples: int = 10,
+        clock=time.monotonic,
+    ):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, initial_limit))
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+        self.baseline_percentile = baseline_percentile
+        self.min_samples = min_samples
+        self.baseline: float | None = None
+        self._samples: deque[float] = deque(maxlen=max(1, baseline_window))
+        self._clock = clock
+        self._last_decrease = float("-inf")
+        CONCURRENCY_LIMIT.set(self.limit)
+
+    def on_sample(self, latency: float, dropped: bool, in_flight: int) -> int:
+        """Feed one finished call; ``dropped`` marks timeouts and overload responses."""
+        if not dropped:
+            self._samples.append(latency)
+            ordered = sorted(self._samples)
+            self.baseline = ordered[min(len(ordered) - 1, int(len(ordered) * self.baseline_percentile))]
+            LATENCY_BASELINE_SECONDS.set(self.baseline)
+        warmed_up = len(self._samples) >= self.min_samples
+        congested = dropped or (warmed_up and latency > self.baseline * self.latency_tolerance)
+        if congested:
+            self._decrease()
+        elif in_flight * 2 >= self.limit and self.limit < self.max_limit:
+            self.limit += 1
+            LIMIT_ADJUSTMENTS.inc(direction="increase")
+            CONCURRENCY_LIMIT.set(self.limit)
+        return self.limit
+
+    def _decrease(self) -> None:
+        now = self._clock()
+        if now - self._last_decrease < (self.baseline or 0.0):
+            return
+        self._last_decrease = now
+        reduced = max(self.min_limit, math.floor(self.limit * self.backoff_ratio))
+        if reduced < self.limit:
+            self.limit = reduced
+            LIMIT_ADJUSTMENTS.inc(direction="decrease")
+            CONCURRENCY_LIMIT.set(self.limit)
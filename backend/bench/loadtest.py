@@ -0,0 +1,270 @@
+"""Offline load test for ``shopify_app``.
+
+Starts the upstream stand-ins (``bench.mock_upstreams``) and the Shopify app
+under uvicorn as separate processes, drives concurrent signed traffic at a
+weighted mix of endpoints, and writes throughput plus p50/p95/p99 latency per
+endpoint to a JSON report so runs can be compared.
+
+    cd backend
+    python -m bench.loadtest --duration 30 --concurrency 50 --out bench_results/run.json
+    python -m bench.loadtest --profile '{"optimize_listing": {"latency_ms": 8000, "throttle_rate": 0.1}}'
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+import jwt
+
+from bench.mock_upstreams import MockProfile
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+API_KEY = "loadtest-api-key"
+API_SECRET = "loadtest-api-secret"
+# Shaped like a JWT so supabase-py accepts it; the stand-ins never check it.
+SERVICE_KEY = "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJpc3MiOiJsb2FkdGVzdCJ9.c2ln"
+
+
+@dataclass(frozen=True)
+class Scenario:
+    name: str
+    method: str
+    path: str
+    weight: int
+    body: dict | None = None
+
+
+def default_scenarios(image_bytes: int = 400_000) -> list[Scenario]:
+    image = "data:image/jpeg;base64," + base64.b64encode(os.urandom(image_bytes)).decode("ascii")
+    return [
+        Scenario("health", "GET", "/shopify/health", 5),
+        Scenario("products", "GET", "/shopify/products?limit=25", 30),
+        Scenario("product_images", "GET", "/shopify/products/1001/images", 20),
+        Scenario("billing_active", "GET", "/shopify/billing/active", 15),
+        Scenario("optimize_listing", "POST", "/shopify/optimize-listing", 20, {"imageBase64": image, "mode": "image"}),
+        Scenario(
+            "product_image_upload",
+            "POST",
+            "/shopify/products/1001/images?make_primary=1",
+            10,
+            {"image_base64": image, "filename": "loadtest.jpg"},
+        ),
+    ]
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile; ``values`` need not be sorted."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(pct / 100.0 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def session_token(shop: str, now: int | None = None) -> str:
+    now = now or int(time.time())
+    payload = {
+        "iss": f"https://{shop}/admin",
+        "dest": f"https://{shop}",
+        "aud": API_KEY,
+        "sub": "1",
+        "iat": now,
+        "nbf": now,
+        "exp": now + 3600,
+    }
+    return jwt.encode(payload, API_SECRET, algorithm="HS256")
+
+
+def summarize(samples: dict[str, list[tuple[float, int]]], elapsed: float) -> dict:
+    endpoints = {}
+    total = 0
+    for name, entries in sorted(samples.items()):
+        latencies = [latency * 1000.0 for latency, _ in entries]
+        statuses: dict[str, int] = defaultdict(int)
+        for _, status in entries:
+            statuses[str(status)] += 1
+        errors = sum(count for status, count in statuses.items() if status == "error" or int(status) >= 500)
+        total += len(entries)
+        endpoints[name] = {
+            "requests": len(entries),
+            "throughput_rps": round(len(entries) / elapsed, 2) if elapsed else 0.0,
+            "errors": errors,
+            "statuses": dict(sorted(statuses.items())),
+            "latency_ms": {
+                "p50": round(percentile(latencies, 50), 2),
+                "p95": round(percentile(latencies, 95), 2),
+                "p99": round(percentile(latencies, 99), 2),
+                "max": round(max(latencies), 2) if latencies else 0.0,
+            },
+        }
+    return {
+        "duration_s": round(elapsed, 2),
+        "requests": total,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+async def drive(
+    base_url: str,
+    scenarios: list[Scenario],
+    duration: float,
+    concurrency: int,
+    shops: list[str],
+    seed: int | None = None,
+) -> dict:
+    rng = random.Random(seed)
+    weights = [scenario.weight for scenario in scenarios]
+    samples: dict[str, list[tuple[float, int | str]]] = defaultdict(list)
+    tokens = {shop: session_token(shop) for shop in shops}
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=200.0, limits=limits) as client:
+
+        async def worker() -> None:
+            while time.perf_counter() < deadline:
+                scenario = rng.choices(scenarios, weights=weights)[0]
+                shop = rng.choice(shops)
+                headers = {"Authorization": f"Bearer {tokens[shop]}"}
+                started = time.perf_counter()
+                try:
+                    response = await client.request(scenario.method, scenario.path, json=scenario.body, headers=headers)
+                    status: int | str = response.status_code
+                except httpx.HTTPError:
+                    status = "error"
+                samples[scenario.name].append((time.perf_counter() - started, status))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return summarize(samples, elapsed)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _wait_ready(url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Process for {url} exited with {process.returncode}")
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Timed out waiting for {url}")
+
+
+def run(args: argparse.Namespace) -> dict:
+    profile = MockProfile.from_dict(json.loads(args.profile))
+    mock_port = _free_port()
+    app_port = _free_port()
+    mock_url = f"http://127.0.0.1:{mock_port}"
+    app_url = f"http://127.0.0.1:{app_port}"
+    app_env = {
+        **os.environ,
+        "SUPABASE_URL": mock_url,
+        "SUPABASE_SERVICE_KEY": SERVICE_KEY,
+        "SHOPIFY_ADMIN_BASE_URL": mock_url,
+        "SHOPIFY_API_KEY": API_KEY,
+        "SHOPIFY_API_SECRET": API_SECRET,
+        "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING"),
+    }
+    processes = []
+    try:
+        mock = subprocess.Popen(
+            [sys.executable, "-m", "bench.mock_upstreams", "--port", str(mock_port), "--profile", json.dumps(profile.to_dict())],
+            cwd=BACKEND_DIR,
+        )
+        processes.append(mock)
+        _wait_ready(f"{mock_url}/_mock/calls", mock)
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "shopify_app:app",
+                "--port",
+                str(app_port),
+                "--workers",
+                str(args.workers),
+                "--log-level",
+                "warning",
+            ],
+            cwd=BACKEND_DIR,
+            env=app_env,
+        )
+        processes.append(server)
+        _wait_ready(f"{app_url}/shopify/health", server)
+
+        shops = [f"loadtest-{index}.myshopify.com" for index in range(args.shops)]
+        report = asyncio.run(
+            drive(app_url, default_scenarios(args.image_bytes), args.duration, args.concurrency, shops, args.seed)
+        )
+        report["upstream_calls"] = httpx.get(f"{mock_url}/_mock/calls").json()
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    report["config"] = {
+        "concurrency": args.concurrency,
+        "workers": args.workers,
+        "shops": args.shops,
+        "image_bytes": args.image_bytes,
+        "mock_profile": profile.to_dict(),
+    }
+    report["started_at"] = datetime.now(timezone.utc).isoformat()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds of traffic to drive")
+    parser.add_argument("--concurrency", type=int, default=25, help="Concurrent simulated clients")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the app under test")
+    parser.add_argument("--shops", type=int, default=10, help="Distinct shops to spread traffic over")
+    parser.add_argument("--image-bytes", type=int, default=400_000, help="Size of uploaded test images")
+    parser.add_argument("--profile", default="{}", help="JSON overrides for the upstream stand-ins")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--out", default="bench_results/loadtest.json", help="Where to write the JSON report")
+    args = parser.parse_args()
+
+    report = run(args)
+    out_path = Path(args.out)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    out_path.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    for name, stats in report["endpoints"].items():
+        latency = stats["latency_ms"]
+        print(
+            f"{name:<22} {stats['requests']:>6} req {stats['throughput_rps']:>8.2f} rps "
+            f"p50={latency['p50']:.1f}ms p95={latency['p95']:.1f}ms p99={latency['p99']:.1f}ms errors={stats['errors']}"
+        )
+    print(f"report written to {out_path}")
+
+
+if __name__ == "__main__":
+    main()
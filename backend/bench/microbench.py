@@ -0,0 +1,178 @@
+"""Per-call timing of the pure functions on every Shopify request.
+
+Not collected by the default ``pytest`` run (the file name does not match
+``test_*.py``); run it explicitly, offline:
+
+    cd backend
+    python -m pytest bench/microbench.py -q
+    MICROBENCH_UPDATE=1 python -m pytest bench/microbench.py -q   # re-record baselines
+
+Each benchmark is compared with ``microbench_baselines.json`` and fails when
+its per-call time exceeds the baseline by more than ``MICROBENCH_TOLERANCE``
+(a fraction, default 0.5 = +50%). Baselines are machine-specific; record
+them on the machine that runs the comparison.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import pathlib
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable
+from unittest.mock import patch
+
+import jwt
+import pytest
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+import shopify_app
+
+BASELINES_PATH = pathlib.Path(__file__).with_name("microbench_baselines.json")
+TOLERANCE = float(os.environ.get("MICROBENCH_TOLERANCE", "0.5"))
+UPDATE = os.environ.get("MICROBENCH_UPDATE", "").lower() in ("1", "true", "yes")
+
+API_KEY = "bench-api-key"
+API_SECRET = "bench-api-secret"
+SHOP = "bench-store.myshopify.com"
+
+
+def measure(fn: Callable[[], object], setup: Callable[[], None] | None = None, batch: int = 32, min_time: float = 0.3) -> float:
+    """Return the best observed per-call time in nanoseconds.
+
+    Calls run in batches of ``batch`` with ``setup`` (untimed) before each
+    batch; the fastest batch is least disturbed by scheduling noise.
+    """
+    best = float("inf")
+    spent = 0.0
+    batches = 0
+    while spent < min_time or batches < 20:
+        if setup is not None:
+            setup()
+        started = time.perf_counter_ns()
+        for _ in range(batch):
+            fn()
+        elapsed = time.perf_counter_ns() - started
+        best = min(best, elapsed / batch)
+        spent += elapsed / 1e9
+        batches += 1
+    return best
+
+
+def _session_token() -> str:
+    now = int(datetime.now(timezone.utc).timestamp())
+    payload = {
+        "iss": f"https://{SHOP}/admin",
+        "dest": f"https://{SHOP}",
+        "aud": API_KEY,
+        "sub": "74311614",
+        "exp": now + 3600,
+        "nbf": now,
+        "iat": now,
+        "jti": "4c8d2e9f-1d2b-4f0e-9a4b-0f6a3a1d2c3b",
+        "sid": "b7f2d4c1e8a94f6b9d0c1e2f3a4b5c6d",
+    }
+    return jwt.encode(payload, API_SECRET, algorithm="HS256")
+
+
+def _oauth_params() -> dict:
+    params = {
+        "code": "0907a61c0c8d55e99db179b68161bc00",
+        "host": base64.b64encode(f"admin.shopify.com/store/{SHOP.split('.')[0]}".encode()).decode(),
+        "shop": SHOP,
+        "state": "0.6784241404160823",
+        "timestamp": "1337178173",
+    }
+    params["hmac"] = hmac.new(
+        API_SECRET.encode(), shopify_app._build_hmac_message(params).encode(), hashlib.sha256
+    ).hexdigest()
+    return params
+
+
+def _webhook() -> tuple[bytes, str]:
+    body = json.dumps(
+        {
+            "shop_id": 954889,
+            "shop_domain": SHOP,
+            "orders_requested": list(range(299938, 299988)),
+            "customer": {"id": 191167, "email": "john@example.com", "phone": "555-625-1199"},
+            "data_request": {"id": 9999},
+        }
+    ).encode()
+    digest = hmac.new(API_SECRET.encode(), body, hashlib.sha256).digest()
+    return body, base64.b64encode(digest).decode()
+
+
+def _rate_limit_reset() -> None:
+    # A busy shop: 10 recent hits already in the window, 32 more per batch stays under the limit.
+    state = shopify_app._shared_state()
+    key = shopify_app._rate_limit_key(SHOP, "product_upload")
+    state.delete(key)
+    for _ in range(10):
+        state.hit_window(key, shopify_app.RATE_LIMIT_WINDOW_SECONDS, shopify_app.RATE_LIMIT_MAX_REQUESTS)
+
+
+def _benchmarks() -> dict[str, tuple[Callable[[], object], Callable[[], None] | None]]:
+    token = _session_token()
+    payload = jwt.decode(token, options={"verify_signature": False})
+    host_param = base64.b64encode(f"admin.shopify.com/store/{SHOP.split('.')[0]}".encode()).decode()
+    oauth_params = _oauth_params()
+    webhook_body, webhook_hmac = _webhook()
+    return {
+        "verify_session_token": (lambda: shopify_app._verify_session_token(token), None),
+        "shop_from_session_token": (lambda: shopify_app._shop_from_session_token(payload), None),
+        "shop_from_host_param": (lambda: shopify_app._shop_from_host_param(host_param), None),
+        "build_hmac_message": (lambda: shopify_app._build_hmac_message(oauth_params), None),
+        "verify_hmac": (lambda: shopify_app._verify_hmac(oauth_params, API_SECRET), None),
+        "verify_webhook_hmac": (lambda: shopify_app._verify_webhook_hmac(webhook_body, webhook_hmac), None),
+        # The state write that _check_rate_limit runs in a worker thread
+        "check_rate_limit": (lambda: shopify_app._rate_limit_allows(SHOP, "product_upload"), _rate_limit_reset),
+    }
+
+
+BENCHMARK_NAMES = sorted(_benchmarks())
+
+
+@pytest.fixture(scope="module")
+def baselines():
+    recorded = json.loads(BASELINES_PATH.read_text()) if BASELINES_PATH.exists() else {}
+    results: dict[str, float] = {}
+    yield recorded.get("ns_per_call", {}), results
+    if UPDATE and results:
+        document = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "ns_per_call": {**recorded.get("ns_per_call", {}), **results},
+        }
+        BASELINES_PATH.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n")
+
+
+@pytest.mark.parametrize("name", BENCHMARK_NAMES)
+def test_hot_path_per_call_time(name, baselines):
+    known, results = baselines
+    with patch.object(shopify_app, "SHOPIFY_API_KEY", API_KEY), patch.object(
+        shopify_app, "SHOPIFY_API_SECRET", API_SECRET
+    ):
+        fn, setup = _benchmarks()[name]
+        ns_per_call = measure(fn, setup)
+    results[name] = round(ns_per_call, 1)
+    baseline = known.get(name)
+    print(f"{name}: {ns_per_call:,.0f} ns/call (baseline {baseline if baseline else 'n/a'})")
+    if UPDATE:
+        return
+    if baseline is None:
+        pytest.skip(f"No baseline for {name}; record one with MICROBENCH_UPDATE=1.")
+    limit = baseline * (1 + TOLERANCE)
+    assert ns_per_call <= limit, (
+        f"{name} regressed: {ns_per_call:,.0f} ns/call vs baseline {baseline:,.0f} ns/call "
+        f"(tolerance +{TOLERANCE:.0%})"
+    )
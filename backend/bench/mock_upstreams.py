@@ -0,0 +1,289 @@
+"""Local stand-ins for every upstream the Shopify app talks to.
+
+A single FastAPI app serves:
+
+- Shopify Admin GraphQL/REST under ``/{shop}/admin/api/{version}/...``
+  (point ``SHOPIFY_ADMIN_BASE_URL`` at this server)
+- Shopify bulk operation result files under ``/_mock/bulk/{id}.jsonl``
+- Supabase PostgREST under ``/rest/v1/{table}`` and the ``optimize-listing``
+  edge function under ``/functions/v1/optimize-listing``
+  (point ``SUPABASE_URL`` at this server)
+
+Each target has its own latency, jitter, error rate and 429 rate so slow or
+flaky upstreams can be reproduced offline.
+
+    python -m bench.mock_upstreams --port 9100 --profile '{"optimize_listing": {"latency_ms": 4000}}'
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import os
+import random
+from dataclasses import asdict, dataclass, field
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+TARGETS = ("shopify_graphql", "shopify_rest", "supabase_postgrest", "optimize_listing")
+
+SUBSCRIPTION_NAME = "Nudio (Product Studio)"
+
+
+@dataclass
+class UpstreamBehavior:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after_s: float = 1.0
+
+
+@dataclass
+class MockProfile:
+    shopify_graphql: UpstreamBehavior = field(default_factory=lambda: UpstreamBehavior(latency_ms=120, jitter_ms=40))
+    shopify_rest: UpstreamBehavior = field(default_factory=lambda: UpstreamBehavior(latency_ms=150, jitter_ms=50))
+    supabase_postgrest: UpstreamBehavior = field(default_factory=lambda: UpstreamBehavior(latency_ms=30, jitter_ms=10))
+    optimize_listing: UpstreamBehavior = field(default_factory=lambda: UpstreamBehavior(latency_ms=2500, jitter_ms=800))
+    # Size of the base64 image returned by the edge function stand-in.
+    result_image_bytes: int = 1_500_000
+    # Catalog served by bulk operations, and how many status polls report RUNNING before COMPLETED.
+    catalog_products: int = 2000
+    catalog_images_per_product: int = 3
+    bulk_running_polls: int = 2
+    seed: int | None = None
+
+    @classmethod
+    def from_dict(cls, raw: dict) -> "MockProfile":
+        profile = cls()
+        for key, value in (raw or {}).items():
+            if key in TARGETS:
+                merged = {**asdict(getattr(profile, key)), **value}
+                setattr(profile, key, UpstreamBehavior(**merged))
+            elif hasattr(profile, key):
+                setattr(profile, key, value)
+            else:
+                raise ValueError(f"Unknown mock profile key: {key}")
+        return profile
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def create_mock_app(profile: MockProfile | None = None) -> FastAPI:
+    profile = profile or MockProfile()
+    rng = random.Random(profile.seed)
+    ids = itertools.count(1)
+    result_image = "data:image/png;base64," + base64.b64encode(os.urandom(profile.result_image_bytes)).decode("ascii")
+    app = FastAPI(title="Nudio upstream stand-ins")
+    app.state.profile = profile
+    app.state.calls = {target: 0 for target in TARGETS}
+    app.state.bulk_operations = {}
+
+    async def misbehave(target: str) -> JSONResponse | None:
+        behavior: UpstreamBehavior = getattr(profile, target)
+        app.state.calls[target] += 1
+        delay = behavior.latency_ms + rng.uniform(-behavior.jitter_ms, behavior.jitter_ms)
+        if delay > 0:
+            await asyncio.sleep(delay / 1000.0)
+        roll = rng.random()
+        if roll < behavior.throttle_rate:
+            return JSONResponse(
+                status_code=429,
+                content={"errors": "Exceeded rate limit"},
+                headers={"Retry-After": str(behavior.retry_after_s)},
+            )
+        if roll < behavior.throttle_rate + behavior.error_rate:
+            return JSONResponse(status_code=500, content={"errors": "Injected failure"})
+        return None
+
+    @app.post("/{shop}/admin/api/{version}/graphql.json")
+    async def shopify_graphql(shop: str, version: str, request: Request):
+        failure = await misbehave("shopify_graphql")
+        if failure is not None:
+            return failure
+        body = await request.json()
+        query = body.get("query", "")
+        if "bulkOperationRunQuery" in query:
+            operation_id = f"gid://shopify/BulkOperation/{next(ids)}"
+            app.state.bulk_operations[operation_id] = {"polls": 0, "products": profile.catalog_products}
+            return {
+                "data": {
+                    "bulkOperationRunQuery": {
+                        "bulkOperation": {"id": operation_id, "status": "CREATED"},
+                        "userErrors": [],
+                    }
+                }
+            }
+        if "BulkOperation" in query:
+            operation_id = (body.get("variables") or {}).get("id", "")
+            operation = app.state.bulk_operations.get(operation_id)
+            if operation is None:
+                return {"data": {"node": None}}
+            operation["polls"] += 1
+            if operation["polls"] <= profile.bulk_running_polls:
+                return {"data": {"node": {"id": operation_id, "status": "RUNNING", "url": None}}}
+            count = operation["products"] * (1 + profile.catalog_images_per_product)
+            url = f"{str(request.base_url).rstrip('/')}/_mock/bulk/{operation_id.rsplit('/', 1)[1]}.jsonl"
+            return {
+                "data": {
+                    "node": {
+                        "id": operation_id,
+                        "status": "COMPLETED",
+                        "errorCode": None,
+                        "objectCount": str(count),
+                        "url": url if count else None,
+                    }
+                }
+            }
+        if "appUsageRecordCreate" in query:
+            return {
+                "data": {
+                    "appUsageRecordCreate": {
+                        "appUsageRecord": {"id": f"gid://shopify/AppUsageRecord/{next(ids)}"},
+                        "userErrors": [],
+                    }
+                }
+            }
+        if "appSubscriptionCreate" in query:
+            return {
+                "data": {
+                    "appSubscriptionCreate": {
+                        "confirmationUrl": f"https://{shop}/admin/charges/confirm",
+                        "userErrors": [],
+                    }
+                }
+            }
+        if "currentAppInstallation" in query:
+            return {
+                "data": {
+                    "currentAppInstallation": {
+                        "activeSubscriptions": [
+                            {
+                                "id": "gid://shopify/AppSubscription/1",
+                                "name": SUBSCRIPTION_NAME,
+                                "status": "ACTIVE",
+                                "lineItems": [
+                                    {
+                                        "id": "gid://shopify/AppSubscriptionLineItem/1",
+                                        "plan": {
+                                            "pricingDetails": {
+                                                "__typename": "AppUsagePricing",
+                                                "terms": "8 cents per image",
+                                            }
+                                        },
+                                    }
+                                ],
+                            }
+                        ]
+                    }
+                }
+            }
+        return {"data": {}}
+
+    @app.post("/{shop}/admin/oauth/access_token")
+    async def shopify_access_token(shop: str):
+        failure = await misbehave("shopify_rest")
+        if failure is not None:
+            return failure
+        return {"access_token": f"token-{shop}", "scope": "read_products,write_products"}
+
+    @app.api_route("/{shop}/admin/api/{version}/{path:path}", methods=["GET", "POST", "PUT", "DELETE"])
+    async def shopify_rest(shop: str, version: str, path: str, request: Request):
+        failure = await misbehave("shopify_rest")
+        if failure is not None:
+            return failure
+        if path == "products.json":
+            limit = int(request.query_params.get("limit", "25"))
+            return {
+                "products": [
+                    {
+                        "id": 1000 + index,
+                        "title": f"Product {index}",
+                        "images": [{"id": 5000 + index, "src": f"https://cdn.shopify.com/s/files/{index}.jpg"}],
+                    }
+                    for index in range(limit)
+                ]
+            }
+        if path.endswith("/images.json") and request.method == "GET":
+            return {"images": [{"id": 5000, "src": "https://cdn.shopify.com/s/files/0.jpg", "position": 1}]}
+        if path.endswith("/images.json") and request.method == "POST":
+            return {"image": {"id": next(ids), "position": 2}}
+        if request.method == "PUT":
+            return {"image": (await request.json()).get("image", {})}
+        return {}
+
+    @app.api_route("/rest/v1/{table}", methods=["GET", "POST", "PATCH", "DELETE"])
+    async def supabase_postgrest(table: str, request: Request):
+        failure = await misbehave("supabase_postgrest")
+        if failure is not None:
+            return failure
+        if request.method == "GET":
+            shop = request.query_params.get("shop_domain", "").removeprefix("eq.")
+            return [{"shop_domain": shop, "access_token": f"token-{shop}", "scope": "read_products,write_products"}]
+        return JSONResponse(status_code=201, content=[])
+
+    @app.post("/functions/v1/optimize-listing")
+    async def optimize_listing():
+        failure = await misbehave("optimize_listing")
+        if failure is not None:
+            return failure
+        return {"success": True, "image": result_image, "message": "Image optimized successfully"}
+
+    @app.get("/_mock/bulk/{operation_id}.jsonl")
+    async def bulk_result(operation_id: str):
+        operation = app.state.bulk_operations[f"gid://shopify/BulkOperation/{operation_id}"]
+
+        async def lines():
+            for index in range(operation["products"]):
+                product_id = f"gid://shopify/Product/{1000 + index}"
+                product = {
+                    "id": product_id,
+                    "title": f"Product {index}",
+                    "handle": f"product-{index}",
+                    "status": "ACTIVE",
+                    "updatedAt": "2024-10-01T00:00:00Z",
+                }
+                chunk = [json.dumps(product)]
+                for image in range(profile.catalog_images_per_product):
+                    media_id = f"gid://shopify/MediaImage/{1000 + index}{image:02d}"
+                    media = {
+                        "id": media_id,
+                        "alt": f"Product {index} view {image}",
+                        "image": {
+                            "url": f"https://cdn.shopify.com/s/files/{index}-{image}.jpg",
+                            "width": 1200,
+                            "height": 1200,
+                        },
+                        "__parentId": product_id,
+                    }
+                    chunk.append(json.dumps(media))
+                yield ("\n".join(chunk) + "\n").encode("utf-8")
+
+        return StreamingResponse(lines(), media_type="application/jsonl")
+
+    @app.get("/_mock/calls")
+    async def mock_calls():
+        return app.state.calls
+
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--profile", default="{}", help="JSON overrides for MockProfile")
+    args = parser.parse_args()
+    profile = MockProfile.from_dict(json.loads(args.profile))
+    uvicorn.run(create_mock_app(profile), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Cold-start timing of the Shopify backend, measured in fresh interpreters.
+
+Like ``microbench.py`` this is not collected by the default ``pytest`` run:
+
+    cd backend
+    python -m pytest bench/startup.py -q
+    MICROBENCH_UPDATE=1 python -m pytest bench/startup.py -q   # re-record baselines
+
+Each run spawns a new Python process that imports ``shopify_app``, builds the
+app with ``create_app`` and serves one ``/shopify/health`` request (with the
+lifespan running). The median of ``STARTUP_RUNS`` runs is compared with
+``startup_baselines.json`` using the same ``MICROBENCH_TOLERANCE`` as the
+microbenchmarks.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import pathlib
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+BASELINES_PATH = pathlib.Path(__file__).with_name("startup_baselines.json")
+TOLERANCE = float(os.environ.get("MICROBENCH_TOLERANCE", "0.5"))
+UPDATE = os.environ.get("MICROBENCH_UPDATE", "").lower() in ("1", "true", "yes")
+RUNS = int(os.environ.get("STARTUP_RUNS", "7"))
+
+# Imported lazily by shopify_app; seeing them after startup means a cold-start regression.
+HEAVY_MODULES = ("supabase", "PIL", "pillow_heif")
+
+_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import shopify_app
+imported = time.perf_counter()
+app = shopify_app.create_app()
+created = time.perf_counter()
+from fastapi.testclient import TestClient
+client_ready = time.perf_counter()
+with TestClient(app) as client:
+    assert client.get("/shopify/health").status_code == 200
+served = time.perf_counter()
+print(json.dumps({
+    "import_ms": (imported - started) * 1000,
+    "create_app_ms": (created - imported) * 1000,
+    "first_request_ms": (served - client_ready) * 1000,
+    "heavy_modules": [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+
+def run_once(tmp_dir: pathlib.Path) -> dict:
+    env = {
+        **os.environ,
+        "SUPABASE_URL": "https://example.supabase.co",
+        "SUPABASE_SERVICE_KEY": "startup-bench",
+        "SHOPIFY_STATE_URL": "memory://",
+        "SHOPIFY_WEBHOOK_QUEUE_PATH": str(tmp_dir / "webhook_queue.sqlite3"),
+        "LOG_LEVEL": "WARNING",
+    }
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", _CHILD], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    # Includes interpreter start-up, which is what a scale-to-zero host pays per cold worker.
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+@pytest.fixture(scope="module")
+def startup_runs(tmp_path_factory):
+    tmp_dir = tmp_path_factory.mktemp("startup")
+    return [run_once(tmp_dir) for _ in range(RUNS)]
+
+
+def test_heavy_modules_stay_lazy(startup_runs):
+    assert all(not run["heavy_modules"] for run in startup_runs)
+
+
+def test_cold_start_time(startup_runs):
+    metrics = ("import_ms", "create_app_ms", "first_request_ms", "process_ms")
+    medians = {name: round(statistics.median(run[name] for run in startup_runs), 1) for name in metrics}
+    print(json.dumps(medians, indent=2))
+    recorded = json.loads(BASELINES_PATH.read_text()) if BASELINES_PATH.exists() else {}
+    if UPDATE:
+        document = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "median_ms": medians,
+        }
+        BASELINES_PATH.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n")
+        return
+    known = recorded.get("median_ms", {})
+    if not known:
+        pytest.skip("No startup baseline; record one with MICROBENCH_UPDATE=1.")
+    regressed = {
+        name: (value, known[name])
+        for name, value in medians.items()
+        if name in known and value > known[name] * (1 + TOLERANCE)
+    }
+    assert not regressed, f"Cold start regressed (ms, baseline): {regressed} (tolerance +{TOLERANCE:.0%})"
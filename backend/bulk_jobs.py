@@ -0,0 +1,403 @@
+"""Bulk listing jobs: optimize every row of an uploaded CSV or JSONL file.
+
+1. The upload is copied to disk in chunks (the request ends long before the
+   job does) and ``BulkJobRunner.start`` records the job in ``BulkJobStore``.
+2. A background task parses the file lazily with ``parse_rows`` and feeds a
+   bounded queue, so memory stays flat whatever the file size.
+3. ``workers`` tasks take rows off the queue and run the row processor;
+   Gemini concurrency is bounded further by the shared client.
+4. Each finished row is written straight away with a sequence number, so
+   ``results_after`` can stream results in completion order while the job is
+   still running.
+
+A row processor raises ``StopJob`` when the rest of the file cannot be
+processed (e.g. the user's quota ran out); that row fails with the message
+and the remaining rows are skipped. Jobs are not resumed after a restart:
+``close`` marks the runner's jobs ``interrupted``, and a job left ``running``
+by a crashed process stops counting as active once it has gone
+``STALE_SECONDS`` without progress.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import csv
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable, Iterator
+
+from metrics import REGISTRY
+
+BULK_JOBS = REGISTRY.counter(
+    "listing_bulk_jobs_total",
+    "Bulk listing jobs by outcome (started, completed, stopped, failed).",
+    ("outcome",),
+)
+BULK_ROWS = REGISTRY.counter(
+    "listing_bulk_rows_total",
+    "Bulk listing rows processed, by status (succeeded, failed, skipped).",
+    ("status",),
+)
+
+ACTIVE_STATUSES = ("queued", "running")
+STALE_SECONDS = 15 * 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bulk_jobs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    filename TEXT,
+    file_format TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total_rows INTEGER,
+    processed INTEGER NOT NULL DEFAULT 0,
+    succeeded INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS bulk_jobs_user ON bulk_jobs (user_id, created_at);
+CREATE TABLE IF NOT EXISTS bulk_job_results (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    row_number INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    original_description TEXT,
+    listing_id TEXT,
+    optimized_description TEXT,
+    optimized_image_url TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS bulk_job_results_job ON bulk_job_results (job_id, seq);
+"""
+
+_JOB_COLUMNS = (
+    "id",
+    "user_id",
+    "filename",
+    "file_format",
+    "status",
+    "total_rows",
+    "processed",
+    "succeeded",
+    "failed",
+    "error",
+    "created_at",
+    "updated_at",
+    "finished_at",
+)
+RESULT_COLUMNS = (
+    "seq",
+    "row_number",
+    "status",
+    "original_description",
+    "listing_id",
+    "optimized_description",
+    "optimized_image_url",
+    "error",
+)
+
+
+class BulkJobError(Exception):
+    """The upload cannot be processed (unknown format, bad header, malformed line)."""
+
+
+class JobAlreadyActive(Exception):
+    """The user already has a queued or running job."""
+
+
+class StopJob(Exception):
+    """Raised by a row processor to fail the current row and skip the rest of the file."""
+
+
+@dataclass(frozen=True)
+class BulkRow:
+    number: int
+    description: str
+    image_url: str | None = None
+
+
+def is_active(job: dict) -> bool:
+    return job["status"] in ACTIVE_STATUSES and job["updated_at"] > time.time() - STALE_SECONDS
+
+
+def file_format_for(filename: str | None, content_type: str | None = None) -> str:
+    extension = (filename or "").rsplit(".", 1)[-1].lower()
+    if extension == "csv" or (content_type or "").startswith("text/csv"):
+        return "csv"
+    if extension in ("jsonl", "ndjson") or (content_type or "") in ("application/jsonl", "application/x-ndjson"):
+        return "jsonl"
+    raise BulkJobError("Upload a .csv or .jsonl file")
+
+
+def parse_rows(path: str | os.PathLike, file_format: str) -> Iterator[BulkRow]:
+    """Yield rows one at a time; CSV needs a ``description`` column, JSONL one object per line."""
+    with open(path, newline="", encoding="utf-8-sig") as handle:
+        if file_format == "csv":
+            reader = csv.DictReader(handle)
+            columns = [(name or "").strip().lower() for name in reader.fieldnames or ()]
+            if "description" not in columns:
+                raise BulkJobError("CSV needs a description column")
+            reader.fieldnames = columns
+            for number, record in enumerate(reader, 1):
+                yield _row(number, record)
+        elif file_format == "jsonl":
+            for number, line in enumerate(handle, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    raise BulkJobError(f"Line {number} is not valid JSON") from None
+                if not isinstance(record, dict):
+                    raise BulkJobError(f"Line {number} is not a JSON object")
+                yield _row(number, record)
+        else:
+            raise BulkJobError(f"Unsupported format: {file_format}")
+
+
+def _row(number: int, record: dict) -> BulkRow:
+    description = record.get("description")
+    image_url = record.get("image_url")
+    return BulkRow(
+        number=number,
+        description=description.strip() if isinstance(description, str) else "",
+        image_url=(image_url.strip() or None) if isinstance(image_url, str) else None,
+    )
+
+
+class BulkJobStore:
+    def __init__(self, path: str | os.PathLike):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def create_job(self, user_id: str, filename: str | None, file_format: str) -> dict:
+        """Record a queued job; raises ``JobAlreadyActive`` if the user has one (checked in the same transaction)."""
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                inserted = self._conn.execute(
+                    "INSERT INTO bulk_jobs (id, user_id, filename, file_format, status, created_at, updated_at) "
+                    "SELECT ?, ?, ?, ?, 'queued', ?, ? WHERE NOT EXISTS ("
+                    "SELECT 1 FROM bulk_jobs WHERE user_id = ? AND status IN (?, ?) AND updated_at > ?)",
+                    (job_id, user_id, filename, file_format, now, now, user_id, *ACTIVE_STATUSES, now - STALE_SECONDS),
+                ).rowcount
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        if not inserted:
+            raise JobAlreadyActive(user_id)
+        return self.get_job(job_id)
+
+    def update_job(self, job_id: str, **fields) -> None:
+        fields["updated_at"] = time.time()
+        if fields.get("status") not in (None, *ACTIVE_STATUSES):
+            fields["finished_at"] = fields["updated_at"]
+        assignments = ", ".join(f"{name} = ?" for name in fields if name in _JOB_COLUMNS)
+        values = [value for name, value in fields.items() if name in _JOB_COLUMNS]
+        with self._lock:
+            self._conn.execute(f"UPDATE bulk_jobs SET {assignments} WHERE id = ?", (*values, job_id))
+
+    def get_job(self, job_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM bulk_jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(zip(_JOB_COLUMNS, row)) if row else None
+
+    def active_job(self, user_id: str) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM bulk_jobs WHERE user_id = ? AND status IN (?, ?) AND updated_at > ? "
+                "ORDER BY created_at DESC LIMIT 1",
+                (user_id, *ACTIVE_STATUSES, time.time() - STALE_SECONDS),
+            ).fetchone()
+        return dict(zip(_JOB_COLUMNS, row)) if row else None
+
+    def record_result(
+        self, job_id: str, row: BulkRow, status: str, result: dict | None = None, error: str | None = None
+    ) -> None:
+        """Store one finished row and bump the job's counters in the same transaction."""
+        result = result or {}
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO bulk_job_results (job_id, row_number, status, original_description, listing_id, "
+                    "optimized_description, optimized_image_url, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        job_id,
+                        row.number,
+                        status,
+                        row.description,
+                        result.get("listing_id"),
+                        result.get("optimized_description"),
+                        result.get("optimized_image_url"),
+                        error,
+                    ),
+                )
+                self._conn.execute(
+                    "UPDATE bulk_jobs SET processed = processed + 1, succeeded = succeeded + ?, "
+                    "failed = failed + ?, updated_at = ? WHERE id = ?",
+                    (int(status == "succeeded"), int(status != "succeeded"), time.time(), job_id),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def results_after(self, job_id: str, after_seq: int = 0, limit: int = 200) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(RESULT_COLUMNS)} FROM bulk_job_results WHERE job_id = ? AND seq > ? "
+                "ORDER BY seq LIMIT ?",
+                (job_id, after_seq, limit),
+            ).fetchall()
+        return [dict(zip(RESULT_COLUMNS, row)) for row in rows]
+
+    def interrupt(self, job_ids: list[str]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE bulk_jobs SET status = 'interrupted', updated_at = ?, finished_at = ? "
+                "WHERE id = ? AND status IN (?, ?)",
+                [(now, now, job_id, *ACTIVE_STATUSES) for job_id in job_ids],
+            )
+
+
+RowProcessor = Callable[[str, BulkRow], Awaitable[dict]]
+
+
+class BulkJobRunner:
+    """Runs jobs in the background; ``process_row(user_id, row)`` returns the row's result fields."""
+
+    def __init__(self, store: BulkJobStore, process_row: RowProcessor, workers: int = 4, max_rows: int = 1000):
+        self.store = store
+        self.process_row = process_row
+        self.workers = max(1, workers)
+        self.max_rows = max_rows
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def start(self, user_id: str, path: str | os.PathLike, file_format: str, filename: str | None = None) -> dict:
+        """Record a job for the spooled upload at ``path`` (deleted when the job ends) and begin processing it.
+
+        Raises ``JobAlreadyActive``, leaving ``path`` in place, if the user already has a job.
+        """
+        job = self.store.create_job(user_id, filename, file_format)
+        task = asyncio.create_task(self._run(job, Path(path)), name=f"bulk-job-{job['id']}")
+        self._tasks[job["id"]] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job["id"], None))
+        BULK_JOBS.inc(outcome="started")
+        logging.info("bulk_job_started job_id=%s user_id=%s format=%s", job["id"], user_id, file_format)
+        return job
+
+    def is_running(self, job_id: str) -> bool:
+        return job_id in self._tasks
+
+    async def wait(self, job_id: str) -> None:
+        task = self._tasks.get(job_id)
+        if task is not None:
+            await asyncio.shield(task)
+
+    async def close(self) -> None:
+        job_ids, tasks = list(self._tasks), list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        self.store.interrupt(job_ids)
+
+    async def _run(self, job: dict, path: Path) -> None:
+        job_id, user_id = job["id"], job["user_id"]
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        stop = asyncio.Event()
+        error = None
+        workers = [asyncio.create_task(self._work(job_id, user_id, queue, stop)) for _ in range(self.workers)]
+        try:
+            await asyncio.to_thread(self.store.update_job, job_id, status="running")
+            total, error = await self._feed(path, job["file_format"], queue, stop)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+            if stop.is_set() and error is None:
+                error = "Stopped early"
+            status = "failed" if error and total == 0 else "stopped" if error else "completed"
+            await asyncio.to_thread(self.store.update_job, job_id, status=status, total_rows=total, error=error)
+            BULK_JOBS.inc(outcome=status)
+            logging.info("bulk_job_finished job_id=%s status=%s rows=%s", job_id, status, total)
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logging.warning("bulk_job_failed job_id=%s err=%s", job_id, exc)
+            BULK_JOBS.inc(outcome="failed")
+            await asyncio.to_thread(self.store.update_job, job_id, status="failed", error=str(exc)[:500])
+        finally:
+            for worker in workers:
+                worker.cancel()
+            path.unlink(missing_ok=True)
+
+    async def _feed(self, path: Path, file_format: str, queue: asyncio.Queue, stop: asyncio.Event):
+        """Queue rows until the file ends or the job stops; returns (rows queued, error)."""
+        rows = parse_rows(path, file_format)
+        total = 0
+        try:
+            while not stop.is_set():
+                row = await asyncio.to_thread(next, rows, None)
+                if row is None:
+                    return total, None
+                if total >= self.max_rows:
+                    return total, f"Only the first {self.max_rows} rows were processed"
+                total += 1
+                await queue.put(row)
+            return total, None
+        except BulkJobError as exc:
+            return total, str(exc)
+        finally:
+            rows.close()
+
+    async def _work(self, job_id: str, user_id: str, queue: asyncio.Queue, stop: asyncio.Event) -> None:
+        while True:
+            row = await queue.get()
+            if row is None:
+                return
+            if stop.is_set():
+                await self._record(job_id, row, "skipped", error="Skipped after the job stopped")
+                continue
+            if not row.description:
+                await self._record(job_id, row, "failed", error="Missing description")
+                continue
+            try:
+                result = await self.process_row(user_id, row)
+            except StopJob as exc:
+                stop.set()
+                await self._record(job_id, row, "failed", error=str(exc))
+            except Exception as exc:
+                logging.warning("bulk_row_failed job_id=%s row=%s err=%s", job_id, row.number, exc)
+                await self._record(job_id, row, "failed", error=str(exc)[:500])
+            else:
+                await self._record(job_id, row, "succeeded", result)
+
+    async def _record(
+        self, job_id: str, row: BulkRow, status: str, result: dict | None = None, error: str | None = None
+    ) -> None:
+        await asyncio.to_thread(self.store.record_result, job_id, row, status, result, error)
+        BULK_ROWS.inc(status=status)
@@ -0,0 +1,613 @@
+"""Full catalog export through Shopify bulk operations.
+
+Paging ``/products.json`` costs one Admin API call per 250 products. A bulk
+query instead runs on Shopify's side and produces a single JSONL file:
+
+1. ``CatalogExporter.start`` submits ``bulkOperationRunQuery`` through the
+   app's GraphQL helper and records the export in ``CatalogIndex``.
+2. A background task polls the operation (backing off up to
+   ``max_poll_interval``) until it reaches a terminal status.
+3. The result file is streamed line by line and written to the index in
+   batches of ``batch_size`` rows, so memory stays flat whatever the store
+   size. Child rows (product media) carry ``__parentId`` and follow their
+   product in the file.
+4. Rows from earlier exports of the same shop that were not seen again are
+   dropped once the new export completes.
+
+The index and export records live in one SQLite file shared by every worker
+on the host. An export is worked on by the exporter holding its lease (the
+``owner`` column, renewed on every poll and batch), and every write checks
+that lease in the same transaction. An export that was claimed elsewhere or
+deleted by ``delete_shop`` stops before it writes anything. Unfinished
+exports whose lease has lapsed are claimed again by ``resume()`` after a
+restart; Shopify keeps running the bulk operation meanwhile.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Awaitable, Callable
+
+import httpx
+
+from metrics import REGISTRY
+
+CATALOG_EXPORTS = REGISTRY.counter(
+    "shopify_catalog_exports_total",
+    "Catalog exports by outcome (started, completed, failed).",
+    ("outcome",),
+)
+CATALOG_ROWS = REGISTRY.counter(
+    "shopify_catalog_export_rows_total",
+    "Rows written to the catalog index by exports, by kind (product, image).",
+    ("kind",),
+)
+
+PRODUCTS_BULK_QUERY = """
+{
+  products {
+    edges {
+      node {
+        id
+        title
+        handle
+        status
+        updatedAt
+        media {
+          edges {
+            node {
+              ... on MediaImage {
+                id
+                alt
+                image { url width height }
+              }
+            }
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+BULK_RUN_MUTATION = """
+mutation bulkOperationRunQuery($query: String!) {
+  bulkOperationRunQuery(query: $query) {
+    bulkOperation { id status }
+    userErrors { field message }
+  }
+}
+"""
+
+BULK_STATUS_QUERY = """
+query bulkOperation($id: ID!) {
+  node(id: $id) {
+    ... on BulkOperation { id status errorCode objectCount url }
+  }
+}
+"""
+
+# Export statuses kept in the index; the first three are still in progress.
+ACTIVE_STATUSES = ("submitted", "running", "downloading")
+BULK_TERMINAL_FAILURES = ("FAILED", "CANCELED", "CANCELING", "EXPIRED")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS catalog_exports (
+    id TEXT PRIMARY KEY,
+    shop TEXT NOT NULL,
+    bulk_operation_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    object_count INTEGER,
+    products INTEGER NOT NULL DEFAULT 0,
+    images INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    finished_at REAL,
+    owner TEXT,
+    lease_expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS catalog_exports_shop ON catalog_exports (shop, created_at);
+CREATE TABLE IF NOT EXISTS catalog_products (
+    shop TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    title TEXT,
+    handle TEXT,
+    status TEXT,
+    updated_at TEXT,
+    export_id TEXT NOT NULL,
+    PRIMARY KEY (shop, product_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS catalog_images (
+    shop TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    media_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    url TEXT,
+    alt TEXT,
+    width INTEGER,
+    height INTEGER,
+    export_id TEXT NOT NULL,
+    PRIMARY KEY (shop, product_id, media_id)
+) WITHOUT ROWID;
+"""
+
+_EXPORT_COLUMNS = (
+    "id",
+    "shop",
+    "bulk_operation_id",
+    "status",
+    "object_count",
+    "products",
+    "images",
+    "error",
+    "created_at",
+    "updated_at",
+    "finished_at",
+    "owner",
+    "lease_expires_at",
+)
+
+
+class CatalogExportError(Exception):
+    """Shopify refused to start the bulk operation (e.g. one is already running for the shop)."""
+
+
+class ExportLeaseLost(Exception):
+    """The export was claimed by another exporter or deleted; the holder must stop without writing."""
+
+
+class CatalogIndex:
+    def __init__(self, path: str | os.PathLike):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(catalog_exports)")}
+        # Index files written before exports were leased.
+        for column, kind in (("owner", "TEXT"), ("lease_expires_at", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE catalog_exports ADD COLUMN {column} {kind}")
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def create_export(
+        self, shop: str, bulk_operation_id: str, owner: str | None = None, lease_seconds: float = 0
+    ) -> dict:
+        now = time.time()
+        export_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO catalog_exports "
+                "(id, shop, bulk_operation_id, status, created_at, updated_at, owner, lease_expires_at) "
+                "VALUES (?, ?, ?, 'submitted', ?, ?, ?, ?)",
+                (export_id, shop, bulk_operation_id, now, now, owner, now + lease_seconds if owner else None),
+            )
+        return self.get_export(export_id)
+
+    def claim_export(self, export_id: str, owner: str, lease_seconds: float) -> bool:
+        """Take (or renew) the lease on an unfinished export; False if someone else holds it or it is gone."""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE catalog_exports SET owner = ?, lease_expires_at = ? "
+                "WHERE id = ? AND status IN (?, ?, ?) "
+                "AND (owner IS NULL OR owner = ? OR lease_expires_at IS NULL OR lease_expires_at < ?)",
+                (owner, now + lease_seconds, export_id, *ACTIVE_STATUSES, owner, now),
+            )
+        return cursor.rowcount == 1
+
+    def release_export(self, export_id: str, owner: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE catalog_exports SET owner = NULL, lease_expires_at = NULL WHERE id = ? AND owner = ?",
+                (export_id, owner),
+            )
+
+    def update_export(self, export_id: str, owner: str | None = None, **fields) -> None:
+        """Update an export; with ``owner``, raises ``ExportLeaseLost`` unless that owner still holds it."""
+        fields["updated_at"] = time.time()
+        if fields.get("status") in ("completed", "failed"):
+            fields["finished_at"] = fields["updated_at"]
+        assignments = ", ".join(f"{name} = ?" for name in fields if name in _EXPORT_COLUMNS)
+        values = [value for name, value in fields.items() if name in _EXPORT_COLUMNS]
+        with self._lock:
+            if owner is None:
+                self._conn.execute(f"UPDATE catalog_exports SET {assignments} WHERE id = ?", (*values, export_id))
+                return
+            cursor = self._conn.execute(
+                f"UPDATE catalog_exports SET {assignments} WHERE id = ? AND owner = ?", (*values, export_id, owner)
+            )
+        if cursor.rowcount != 1:
+            raise ExportLeaseLost(export_id)
+
+    def get_export(self, export_id: str) -> dict | None:
+        return self._export_row("SELECT * FROM catalog_exports WHERE id = ?", (export_id,))
+
+    def latest_export(self, shop: str) -> dict | None:
+        return self._export_row(
+            "SELECT * FROM catalog_exports WHERE shop = ? ORDER BY created_at DESC LIMIT 1", (shop,)
+        )
+
+    def active_export(self, shop: str) -> dict | None:
+        return self._export_row(
+            "SELECT * FROM catalog_exports WHERE shop = ? AND status IN (?, ?, ?) ORDER BY created_at DESC LIMIT 1",
+            (shop, *ACTIVE_STATUSES),
+        )
+
+    def unfinished_exports(self) -> list[dict]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM catalog_exports WHERE status IN (?, ?, ?) ORDER BY created_at", ACTIVE_STATUSES
+            ).fetchall()
+        return [dict(zip(_EXPORT_COLUMNS, row)) for row in rows]
+
+    def write_batch(
+        self,
+        shop: str,
+        export_id: str,
+        products: list[tuple],
+        images: list[tuple],
+        owner: str | None = None,
+        lease_seconds: float = 0,
+    ) -> None:
+        """Upsert one batch of parsed rows and bump the export's counters (and ``owner``'s lease) in one transaction."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._check_owner(export_id, owner, lease_seconds)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO catalog_products "
+                    "(shop, product_id, title, handle, status, updated_at, export_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(shop, *row, export_id) for row in products],
+                )
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO catalog_images "
+                    "(shop, product_id, media_id, position, url, alt, width, height, export_id) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(shop, *row, export_id) for row in images],
+                )
+                self._conn.execute(
+                    "UPDATE catalog_exports SET products = products + ?, images = images + ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (len(products), len(images), time.time(), export_id),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def finish_export(self, shop: str, export_id: str, object_count: int | None, owner: str | None = None) -> None:
+        """Mark the export completed and drop rows that earlier exports wrote but this one did not."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._check_owner(export_id, owner)
+                self._conn.execute(
+                    "DELETE FROM catalog_products WHERE shop = ? AND export_id != ?", (shop, export_id)
+                )
+                self._conn.execute("DELETE FROM catalog_images WHERE shop = ? AND export_id != ?", (shop, export_id))
+                self._conn.execute(
+                    "UPDATE catalog_exports SET status = 'completed', object_count = ?, updated_at = ?, "
+                    "finished_at = ? WHERE id = ?",
+                    (object_count, now, now, export_id),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def reset_export_rows(self, export_id: str, owner: str | None = None) -> None:
+        """Zero the counters before re-reading a result file from the start."""
+        self.update_export(export_id, owner=owner, products=0, images=0)
+
+    def products(self, shop: str, after: str | None = None, limit: int = 50) -> list[dict]:
+        """Indexed products ordered by id (keyset pagination on ``after``), each with its images."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT product_id, title, handle, status, updated_at FROM catalog_products "
+                "WHERE shop = ? AND product_id > ? ORDER BY product_id LIMIT ?",
+                (shop, after or "", limit),
+            ).fetchall()
+            if not rows:
+                return []
+            placeholders = ", ".join("?" for _ in rows)
+            image_rows = self._conn.execute(
+                "SELECT product_id, media_id, url, alt, width, height FROM catalog_images "
+                f"WHERE shop = ? AND product_id IN ({placeholders}) ORDER BY product_id, position",
+                (shop, *(row[0] for row in rows)),
+            ).fetchall()
+        images: dict[str, list[dict]] = {}
+        for product_id, media_id, url, alt, width, height in image_rows:
+            images.setdefault(product_id, []).append(
+                {"id": media_id, "url": url, "alt": alt, "width": width, "height": height}
+            )
+        return [
+            {
+                "id": product_id,
+                "title": title,
+                "handle": handle,
+                "status": status,
+                "updated_at": updated_at,
+                "images": images.get(product_id, []),
+            }
+            for product_id, title, handle, status, updated_at in rows
+        ]
+
+    def delete_shop(self, shop: str) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for table in ("catalog_products", "catalog_images", "catalog_exports"):
+                    self._conn.execute(f"DELETE FROM {table} WHERE shop = ?", (shop,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _check_owner(self, export_id: str, owner: str | None, lease_seconds: float = 0) -> None:
+        """Inside a write transaction: raise ``ExportLeaseLost`` unless ``owner`` still holds the export."""
+        if owner is None:
+            return
+        held = self._conn.execute(
+            "SELECT 1 FROM catalog_exports WHERE id = ? AND owner = ?", (export_id, owner)
+        ).fetchone()
+        if not held:
+            raise ExportLeaseLost(export_id)
+        if lease_seconds:
+            self._conn.execute(
+                "UPDATE catalog_exports SET lease_expires_at = ? WHERE id = ?", (time.time() + lease_seconds, export_id)
+            )
+
+    def _export_row(self, sql: str, params: tuple) -> dict | None:
+        with self._lock:
+            row = self._conn.execute(sql, params).fetchone()
+        return dict(zip(_EXPORT_COLUMNS, row)) if row else None
+
+
+GraphQLCall = Callable[..., Awaitable[dict]]
+
+
+class CatalogExporter:
+    """Runs bulk exports in background tasks on the current event loop.
+
+    ``graphql`` has the signature of the app's ``_shopify_graphql`` helper and
+    ``access_token`` resolves a shop's offline token.
+    """
+
+    def __init__(
+        self,
+        index: CatalogIndex,
+        graphql: GraphQLCall,
+        access_token: Callable[[str], Awaitable[str]],
+        poll_interval: float = 2.0,
+        max_poll_interval: float = 30.0,
+        batch_size: int = 500,
+        http_client: Callable[[], httpx.AsyncClient] | None = None,
+        lease_seconds: float = 120.0,
+    ):
+        self.index = index
+        self.graphql = graphql
+        self.access_token = access_token
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.batch_size = batch_size
+        # Polls are at most max_poll_interval apart and each renews the lease.
+        self.lease_seconds = max(lease_seconds, max_poll_interval * 3)
+        self.owner = uuid.uuid4().hex
+        self._http_client = http_client or (lambda: httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=10.0)))
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._shops: dict[str, str] = {}
+
+    async def start(self, shop: str) -> dict:
+        """Submit a bulk query for ``shop``, or return the export already in progress."""
+        active = await asyncio.to_thread(self.index.active_export, shop)
+        if active is not None:
+            return active
+        token = await self.access_token(shop)
+        data = await self.graphql(shop, token, BULK_RUN_MUTATION, {"query": PRODUCTS_BULK_QUERY}, phase="bulk_export")
+        payload = (data.get("data") or {}).get("bulkOperationRunQuery") or {}
+        errors = payload.get("userErrors") or data.get("errors")
+        operation = payload.get("bulkOperation")
+        if errors or not operation:
+            logging.warning("catalog_export_rejected shop=%s errors=%s", shop, errors)
+            raise CatalogExportError(_error_message(errors) or "Bulk operation was not created.")
+        export = await asyncio.to_thread(
+            self.index.create_export, shop, operation["id"], self.owner, self.lease_seconds
+        )
+        CATALOG_EXPORTS.inc(outcome="started")
+        logging.info("catalog_export_started shop=%s export_id=%s bulk_id=%s", shop, export["id"], operation["id"])
+        self._spawn(export)
+        return export
+
+    def resume(self) -> int:
+        """Claim and restart exports left unfinished by a previous process.
+
+        Exports whose lease another live exporter still holds are left to it, so
+        several workers starting at once each pick up different exports.
+        """
+        resumed = 0
+        for export in self.index.unfinished_exports():
+            if export["id"] in self._tasks:
+                continue
+            if self.index.claim_export(export["id"], self.owner, self.lease_seconds):
+                self._spawn(export)
+                resumed += 1
+        return resumed
+
+    def cancel_shop(self, shop: str) -> None:
+        """Stop this exporter's work for ``shop`` (e.g. before the shop's data is deleted)."""
+        for export_id, export_shop in list(self._shops.items()):
+            task = self._tasks.get(export_id)
+            if export_shop == shop and task is not None:
+                task.cancel()
+
+    async def wait(self, export_id: str) -> None:
+        task = self._tasks.get(export_id)
+        if task is not None:
+            await asyncio.shield(task)
+
+    async def close(self) -> None:
+        export_ids, tasks = list(self._tasks), list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
+        # Hand the exports back so the next process can claim them without waiting out the lease.
+        for export_id in export_ids:
+            await asyncio.to_thread(self.index.release_export, export_id, self.owner)
+
+    def _spawn(self, export: dict) -> None:
+        task = asyncio.create_task(self._run(export), name=f"catalog-export-{export['id']}")
+        self._tasks[export["id"]] = task
+        self._shops[export["id"]] = export["shop"]
+
+        def forget(_):
+            self._tasks.pop(export["id"], None)
+            self._shops.pop(export["id"], None)
+
+        task.add_done_callback(forget)
+
+    async def _run(self, export: dict) -> None:
+        shop, export_id = export["shop"], export["id"]
+        try:
+            token = await self.access_token(shop)
+            operation = await self._poll(shop, token, export)
+            if operation["status"] != "COMPLETED":
+                error_code = operation.get("errorCode") or "no error code"
+                raise RuntimeError(f"Bulk operation {operation['status']}: {error_code}")
+            object_count = _int_or_none(operation.get("objectCount"))
+            # A query that matched nothing completes without a result file.
+            if operation.get("url"):
+                await asyncio.to_thread(
+                    self.index.update_export,
+                    export_id,
+                    owner=self.owner,
+                    status="downloading",
+                    object_count=object_count,
+                    lease_expires_at=time.time() + self.lease_seconds,
+                )
+                await self._download(shop, export_id, operation["url"])
+            await asyncio.to_thread(self.index.finish_export, shop, export_id, object_count, self.owner)
+        except asyncio.CancelledError:
+            # Left as-is so resume() can pick it up in the next process.
+            raise
+        except ExportLeaseLost:
+            logging.info("catalog_export_abandoned shop=%s export_id=%s", shop, export_id)
+            return
+        except Exception as exc:
+            logging.warning("catalog_export_failed shop=%s export_id=%s err=%s", shop, export_id, exc)
+            CATALOG_EXPORTS.inc(outcome="failed")
+            try:
+                await asyncio.to_thread(
+                    self.index.update_export, export_id, owner=self.owner, status="failed", error=str(exc)[:500]
+                )
+            except ExportLeaseLost:
+                pass
+            return
+        CATALOG_EXPORTS.inc(outcome="completed")
+        logging.info("catalog_export_completed shop=%s export_id=%s", shop, export_id)
+
+    async def _poll(self, shop: str, token: str, export: dict) -> dict:
+        interval = self.poll_interval
+        while True:
+            data = await self.graphql(
+                shop, token, BULK_STATUS_QUERY, {"id": export["bulk_operation_id"]}, phase="bulk_export_poll"
+            )
+            operation = (data.get("data") or {}).get("node")
+            status = operation.get("status") if operation else None
+            if operation and status != "COMPLETED" and status not in BULK_TERMINAL_FAILURES:
+                export["status"] = "running"
+            # Renews the lease, and stops here if the export was deleted or claimed elsewhere.
+            await asyncio.to_thread(
+                self.index.update_export,
+                export["id"],
+                owner=self.owner,
+                status=export["status"],
+                lease_expires_at=time.time() + self.lease_seconds,
+            )
+            if operation:
+                if status == "COMPLETED" or status in BULK_TERMINAL_FAILURES:
+                    return operation
+            elif not data.get("errors"):
+                raise RuntimeError("Bulk operation not found.")
+            # Throttled or still running: check again later.
+            await asyncio.sleep(interval)
+            interval = min(self.max_poll_interval, interval * 1.5)
+
+    async def _download(self, shop: str, export_id: str, url: str) -> None:
+        await asyncio.to_thread(self.index.reset_export_rows, export_id, self.owner)
+        products: list[tuple] = []
+        images: list[tuple] = []
+        parent_id = None
+        position = 0
+        async with self._http_client() as client:
+            async with client.stream("GET", url) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    row = json.loads(line)
+                    parent = row.get("__parentId")
+                    if parent is None:
+                        products.append(
+                            (row["id"], row.get("title"), row.get("handle"), row.get("status"), row.get("updatedAt"))
+                        )
+                    elif row.get("id"):
+                        # Non-image media (videos, 3D models) come through as bare ``{"__parentId": ...}`` rows.
+                        position = position + 1 if parent == parent_id else 0
+                        parent_id = parent
+                        image = row.get("image") or {}
+                        images.append(
+                            (
+                                parent,
+                                row["id"],
+                                position,
+                                image.get("url"),
+                                row.get("alt"),
+                                image.get("width"),
+                                image.get("height"),
+                            )
+                        )
+                    if len(products) + len(images) >= self.batch_size:
+                        await self._flush(shop, export_id, products, images)
+                        products, images = [], []
+        await self._flush(shop, export_id, products, images)
+
+    async def _flush(self, shop: str, export_id: str, products: list[tuple], images: list[tuple]) -> None:
+        if not products and not images:
+            return
+        await asyncio.to_thread(
+            self.index.write_batch, shop, export_id, products, images, self.owner, self.lease_seconds
+        )
+        CATALOG_ROWS.inc(len(products), kind="product")
+        CATALOG_ROWS.inc(len(images), kind="image")
+
+
+def _error_message(errors) -> str:
+    if isinstance(errors, list):
+        return "; ".join(
+            error.get("message", str(error)) if isinstance(error, dict) else str(error) for error in errors
+        )
+    return str(errors) if errors else ""
+
+
+def _int_or_none(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,126 @@
+"""Micro-batching of description generations into single Gemini calls.
+
+Under load many small description requests arrive within the same moment,
+each paying full request overhead against the API quota. ``DescriptionBatcher``
+holds requests for up to ``max_wait_seconds`` (or until ``max_batch_size``
+are waiting), sends their prompts as one request with JSON structured output
+(an array of strings, one per prompt, in order), and hands each caller its
+own element.
+
+If the batched call fails or its reply is not an array of the right length,
+every request in the batch is retried on its own, so a bad batch costs
+latency, never correctness. A batch of one is sent as a plain call.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+from typing import Callable
+
+from gemini_client import GeminiClient
+from metrics import REGISTRY
+
+DESCRIPTION_BATCHES = REGISTRY.counter(
+    "listing_description_batches_total",
+    "Description generations sent to Gemini, by kind (single, batched, fallback).",
+    ("kind",),
+)
+DESCRIPTION_BATCH_SIZE = REGISTRY.histogram(
+    "listing_description_batch_size",
+    "Requests per flushed description batch.",
+    buckets=(1, 2, 4, 8, 16, 32),
+)
+
+BATCH_INSTRUCTIONS = (
+    "You will receive a JSON array of {count} independent tasks. Complete each task on its own, "
+    "following its instructions exactly. Reply with a JSON array of exactly {count} strings, "
+    "where element i is your complete answer to task i."
+)
+BATCH_GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": list[str]}
+
+
+class DescriptionBatcher:
+    def __init__(
+        self,
+        client: GeminiClient,
+        model: str,
+        prompt: Callable[[str], str],
+        max_batch_size: int = 8,
+        max_wait_seconds: float = 0.02,
+    ):
+        self.client = client
+        self.model = model
+        self.prompt = prompt
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_seconds = max_wait_seconds
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushes: set[asyncio.Task] = set()
+
+    async def generate(self, text: str) -> str:
+        """Return the generated text for ``text``, possibly as part of a batch."""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait_seconds, self._flush)
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending[: self.max_batch_size], self._pending[self.max_batch_size :]
+        if self._pending:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait_seconds, self._flush)
+        # Callers that gave up while waiting are left out of the request.
+        batch = [(text, future) for text, future in batch if not future.done()]
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._flushes.add(task)
+            task.add_done_callback(self._flushes.discard)
+
+    async def _run(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        DESCRIPTION_BATCH_SIZE.observe(len(batch))
+        if len(batch) == 1:
+            DESCRIPTION_BATCHES.inc(kind="single")
+            await self._run_single(*batch[0])
+            return
+        try:
+            texts = await self._generate_batch([text for text, _ in batch])
+        except Exception as exc:
+            logging.warning("description_batch_failed size=%s err=%s", len(batch), exc)
+            DESCRIPTION_BATCHES.inc(kind="fallback")
+            await asyncio.gather(*(self._run_single(text, future) for text, future in batch))
+            return
+        DESCRIPTION_BATCHES.inc(kind="batched")
+        for (_, future), result in zip(batch, texts):
+            if not future.done():
+                future.set_result(result)
+
+    async def _generate_batch(self, texts: list[str]) -> list[str]:
+        prompts = [self.prompt(text) for text in texts]
+        contents = BATCH_INSTRUCTIONS.format(count=len(prompts)) + "\n\n" + json.dumps(prompts, ensure_ascii=False)
+        response = await self.client.generate(self.model, contents, generation_config=BATCH_GENERATION_CONFIG)
+        results = json.loads(response.text)
+        if (
+            not isinstance(results, list)
+            or len(results) != len(texts)
+            or not all(isinstance(result, str) and result.strip() for result in results)
+        ):
+            raise ValueError(f"expected {len(texts)} non-empty strings in the batched reply")
+        return results
+
+    async def _run_single(self, text: str, future: asyncio.Future) -> None:
+        try:
+            response = await self.client.generate(self.model, self.prompt(text))
+            result = response.text
+        except Exception as exc:
+            if not future.done():
+                future.set_exception(exc)
+            return
+        if not future.done():
+            future.set_result(result)
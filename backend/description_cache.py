@@ -0,0 +1,122 @@
+"""Two-tier cache for generated listing descriptions.
+
+Keys hash the seller's text after folding whitespace and case, together with
+the model name and prompt version, so resubmitting the same description is
+a lookup while changing the model or prompt naturally misses.
+
+- Memory tier: per-process LRU bounded by ``max_entries``.
+- Persistent tier: any ``SharedState`` (by default the SQLite file), shared
+  by workers and surviving restarts; hits are promoted into memory.
+
+Both tiers expire entries after ``ttl_seconds``. Async callers use ``aget`` and
+``aset``, which answer memory hits inline and run persistent-tier I/O in a
+worker thread.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import REGISTRY
+from shared_state import SharedState
+
+DESCRIPTION_CACHE_REQUESTS = REGISTRY.counter(
+    "listing_description_cache_requests_total",
+    "Description cache lookups, by result (memory_hit, persistent_hit, miss).",
+    ("result",),
+)
+DESCRIPTION_CACHE_ENTRIES = REGISTRY.gauge(
+    "listing_description_cache_entries",
+    "Descriptions held in the in-memory tier.",
+)
+
+
+def normalize_description(text: str) -> str:
+    return " ".join((text or "").split()).casefold()
+
+
+def description_cache_key(text: str, model: str, prompt_version: str) -> str:
+    material = f"{model}\n{prompt_version}\n{normalize_description(text)}"
+    return "description:" + hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class DescriptionCache:
+    def __init__(
+        self,
+        store: SharedState | None = None,
+        max_entries: int = 1024,
+        ttl_seconds: float = 7 * 86400,
+        clock=time.time,
+    ):
+        self.store = store
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> str | None:
+        value = self._get_memory(key)
+        return value if value is not None else self._get_persistent(key)
+
+    async def aget(self, key: str) -> str | None:
+        value = self._get_memory(key)
+        if value is not None:
+            return value
+        if self.store is None:
+            return self._get_persistent(key)
+        return await asyncio.to_thread(self._get_persistent, key)
+
+    def set(self, key: str, value: str) -> None:
+        self._remember(key, value, self._clock())
+        if self.store is not None:
+            self.store.set(key, value, ttl=self.ttl_seconds)
+
+    async def aset(self, key: str, value: str) -> None:
+        self._remember(key, value, self._clock())
+        if self.store is not None:
+            await asyncio.to_thread(self.store.set, key, value, ttl=self.ttl_seconds)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _get_memory(self, key: str) -> str | None:
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                DESCRIPTION_CACHE_REQUESTS.inc(result="memory_hit")
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+        return None
+
+    def _get_persistent(self, key: str) -> str | None:
+        value = self.store.get(key) if self.store is not None else None
+        if value is None:
+            self.misses += 1
+            DESCRIPTION_CACHE_REQUESTS.inc(result="miss")
+            return None
+        # The persistent tier does not report remaining TTL; a full one here is at most one extra TTL of staleness.
+        self._remember(key, value, self._clock())
+        self.hits += 1
+        DESCRIPTION_CACHE_REQUESTS.inc(result="persistent_hit")
+        return value
+
+    def _remember(self, key: str, value: str, now: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, now + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            DESCRIPTION_CACHE_ENTRIES.set(len(self._entries))
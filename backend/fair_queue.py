@@ -0,0 +1,222 @@
+"""Per-shop weighted fair queue with admission control for expensive upstream calls.
+
+``FairScheduler`` hands out a limited number of slots (``global_limit``) and
+caps how many any one shop may hold (``shop_limit``). Waiting requests are
+ordered by start-time fair queueing: each request gets a virtual tag of
+``max(virtual_time, shop's last tag) + 1 / weight`` and the smallest tag among
+shops under their cap runs next, so a shop with a long backlog cannot starve
+a shop that only sends the occasional request.
+
+Admission is decided synchronously by ``admit()``: when the backlog (overall
+or for the shop) is full it raises ``Overloaded`` with a ``retry_after``
+estimate instead of queueing, so callers can shed load before doing any
+upstream work.
+
+State lives in the process and on its event loop; with several uvicorn
+workers every worker enforces its own limits.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Mapping
+
+from metrics import REGISTRY
+
+QUEUE_DEPTH = REGISTRY.gauge(
+    "shopify_edge_queue_depth",
+    "Requests waiting for an edge function slot, by shop.",
+    ("shop",),
+)
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "shopify_edge_queue_wait_seconds",
+    "Time spent waiting for an edge function slot, by shop.",
+    ("shop",),
+)
+IN_FLIGHT = REGISTRY.gauge(
+    "shopify_edge_in_flight",
+    "Edge function calls currently holding a slot.",
+)
+REJECTED = REGISTRY.counter(
+    "shopify_edge_rejected_total",
+    "Requests shed before reaching the edge function, by reason.",
+    ("reason",),
+)
+
+
+class Overloaded(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def parse_weights(raw: str) -> dict[str, float]:
+    """Parse ``shop=weight`` pairs, e.g. ``big-store.myshopify.com=0.5,vip.myshopify.com=2``."""
+    weights: dict[str, float] = {}
+    for part in (raw or "").split(","):
+        if "=" not in part:
+            continue
+        shop, _, value = part.partition("=")
+        try:
+            weight = float(value)
+        except ValueError:
+            continue
+        if shop.strip() and weight > 0:
+            weights[shop.strip()] = weight
+    return weights
+
+
+class Admission:
+    """One admitted request; ``async with`` waits for its slot and releases it on exit."""
+
+    def __init__(self, scheduler: "FairScheduler", shop: str, tag: float):
+        self.scheduler = scheduler
+        self.shop = shop
+        self.tag = tag
+        self.enqueued_at = time.monotonic()
+        self.granted_at: float | None = None
+        self._granted = asyncio.get_running_loop().create_future()
+        self._closed = False
+
+    @property
+    def granted(self) -> bool:
+        return self.granted_at is not None
+
+    async def __aenter__(self) -> "Admission":
+        try:
+            await asyncio.shield(self._granted)
+        except asyncio.CancelledError:
+            self.close()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Release the slot, or leave the queue if it was never granted; safe to call twice."""
+        if self._closed:
+            return
+        self._closed = True
+        self.scheduler._finish(self)
+
+    def _grant(self) -> None:
+        self.granted_at = time.monotonic()
+        if not self._granted.done():
+            self._granted.set_result(None)
+
+
+class FairScheduler:
+    def __init__(
+        self,
+        global_limit: int,
+        shop_limit: int,
+        max_queue_depth: int,
+        max_shop_queue_depth: int,
+        weights: Mapping[str, float] | None = None,
+    ):
+        self.global_limit = max(1, global_limit)
+        self.shop_limit = max(1, shop_limit)
+        self.max_queue_depth = max_queue_depth
+        self.max_shop_queue_depth = max_shop_queue_depth
+        self.weights = dict(weights or {})
+        self.in_flight = 0
+        self._shop_in_flight: dict[str, int] = {}
+        self._waiting: dict[str, deque[Admission]] = {}
+        self._waiting_count = 0
+        self._virtual_time = 0.0
+        self._last_tag: dict[str, float] = {}
+        # Smoothed slot hold time, used to estimate Retry-After.
+        self._hold_seconds = 1.0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._waiting_count
+
+    def set_global_limit(self, limit: int) -> None:
+        self.global_limit = max(1, limit)
+        self._dispatch()
+
+    def admit(self, shop: str) -> Admission:
+        """Queue a request for ``shop`` or raise ``Overloaded`` when the backlog is full."""
+        waiting = self._waiting.get(shop)
+        if self._has_capacity(shop) and not waiting:
+            admission = self._new_admission(shop)
+            self._start(admission)
+            return admission
+        if self._waiting_count >= self.max_queue_depth:
+            REJECTED.inc(reason="queue_full")
+            raise Overloaded("queue_full", self.retry_after())
+        if waiting and len(waiting) >= self.max_shop_queue_depth:
+            REJECTED.inc(reason="shop_queue_full")
+            raise Overloaded("shop_queue_full", self.retry_after(len(waiting), self.shop_limit))
+        admission = self._new_admission(shop)
+        self._waiting.setdefault(shop, deque()).append(admission)
+        self._waiting_count += 1
+        QUEUE_DEPTH.inc(shop=shop)
+        return admission
+
+    def retry_after(self, backlog: int | None = None, slots: int | None = None) -> int:
+        backlog = self._waiting_count if backlog is None else backlog
+        slots = self.global_limit if slots is None else slots
+        return min(120, max(1, math.ceil(self._hold_seconds * (backlog + 1) / slots)))
+
+    def _new_admission(self, shop: str) -> Admission:
+        weight = self.weights.get(shop, 1.0)
+        tag = max(self._virtual_time, self._last_tag.get(shop, 0.0)) + 1.0 / weight
+        self._last_tag[shop] = tag
+        return Admission(self, shop, tag)
+
+    def _has_capacity(self, shop: str) -> bool:
+        return self.in_flight < self.global_limit and self._shop_in_flight.get(shop, 0) < self.shop_limit
+
+    def _start(self, admission: Admission) -> None:
+        self.in_flight += 1
+        self._shop_in_flight[admission.shop] = self._shop_in_flight.get(admission.shop, 0) + 1
+        self._virtual_time = max(self._virtual_time, admission.tag)
+        IN_FLIGHT.set(self.in_flight)
+        QUEUE_WAIT_SECONDS.observe(time.monotonic() - admission.enqueued_at, shop=admission.shop)
+        admission._grant()
+
+    def _finish(self, admission: Admission) -> None:
+        if admission.granted:
+            self.in_flight -= 1
+            remaining = self._shop_in_flight.get(admission.shop, 1) - 1
+            if remaining:
+                self._shop_in_flight[admission.shop] = remaining
+            else:
+                self._shop_in_flight.pop(admission.shop, None)
+            IN_FLIGHT.set(self.in_flight)
+            held = time.monotonic() - admission.granted_at
+            self._hold_seconds = 0.8 * self._hold_seconds + 0.2 * held
+        else:
+            waiting = self._waiting.get(admission.shop)
+            if waiting and admission in waiting:
+                waiting.remove(admission)
+                self._waiting_count -= 1
+                QUEUE_DEPTH.dec(shop=admission.shop)
+                if not waiting:
+                    del self._waiting[admission.shop]
+        if not self._shop_in_flight.get(admission.shop) and admission.shop not in self._waiting:
+            self._last_tag.pop(admission.shop, None)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self.in_flight < self.global_limit:
+            candidates = [
+                queue[0] for shop, queue in self._waiting.items() if self._has_capacity(shop)
+            ]
+            if not candidates:
+                return
+            admission = min(candidates, key=lambda item: item.tag)
+            queue = self._waiting[admission.shop]
+            queue.popleft()
+            if not queue:
+                del self._waiting[admission.shop]
+            self._waiting_count -= 1
+            QUEUE_DEPTH.dec(shop=admission.shop)
+            self._start(admission)
@@ -0,0 +1,114 @@
+"""Shared Gemini client for the listing API.
+
+``GeminiClient`` builds each ``GenerativeModel`` once and reuses it, calls the
+async generation API so a slow generation never blocks the event loop, and
+bounds both how many generations run at once (``max_concurrency``) and how
+long a caller waits for one, queueing included (``timeout_seconds``).
+
+``stream`` yields text chunks as Gemini produces them; there the timeout
+applies to each wait for the next chunk, and the slot is held until the
+stream ends or the consumer stops iterating.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, AsyncIterator, Callable, Iterable
+
+
+def _default_factory(name: str):
+    import google.generativeai as genai
+
+    return genai.GenerativeModel(name)
+
+
+class GeminiClient:
+    def __init__(
+        self,
+        models: Iterable[str] = (),
+        max_concurrency: int = 8,
+        timeout_seconds: float = 60.0,
+        factory: Callable[[str], Any] | None = None,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.timeout_seconds = timeout_seconds
+        self._factory = factory or _default_factory
+        self._models: dict[str, Any] = {}
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        for name in models:
+            self.model(name)
+
+    def model(self, name: str):
+        """Return the registered model for ``name``, creating it on first use."""
+        model = self._models.get(name)
+        if model is None:
+            model = self._models[name] = self._factory(name)
+        return model
+
+    async def generate(self, name: str, contents: Any, timeout: float | None = None, **kwargs) -> Any:
+        """``generate_content_async`` on the named model; raises ``asyncio.TimeoutError`` past ``timeout``."""
+        timeout = self.timeout_seconds if timeout is None else timeout
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            response = await asyncio.wait_for(self._generate(name, contents, timeout, **kwargs), timeout)
+            outcome = "ok"
+            return response
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise
+        finally:
+            logging.info(
+                "gemini_generate model=%s outcome=%s seconds=%.3f", name, outcome, time.perf_counter() - started
+            )
+
+    async def _generate(self, name: str, contents: Any, timeout: float, **kwargs) -> Any:
+        async with self._semaphore:
+            request_options = {"timeout": timeout, **kwargs.pop("request_options", {})}
+            return await self.model(name).generate_content_async(contents, request_options=request_options, **kwargs)
+
+    async def stream(self, name: str, contents: Any, timeout: float | None = None, **kwargs) -> AsyncIterator[str]:
+        """Yield the text of each chunk from ``generate_content_async(stream=True)``."""
+        timeout = self.timeout_seconds if timeout is None else timeout
+        started = time.perf_counter()
+        outcome = "error"
+        chunks = 0
+        await asyncio.wait_for(self._semaphore.acquire(), timeout)
+        try:
+            request_options = {"timeout": timeout, **kwargs.pop("request_options", {})}
+            model = self.model(name)
+            response = await asyncio.wait_for(
+                model.generate_content_async(contents, stream=True, request_options=request_options, **kwargs), timeout
+            )
+            iterator = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(iterator.__anext__(), timeout)
+                except StopAsyncIteration:
+                    break
+                chunks += 1
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. a final safety or finish-reason chunk).
+                    text = ""
+                if text:
+                    yield text
+            outcome = "ok"
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            raise
+        except GeneratorExit:
+            outcome = "closed"
+            raise
+        finally:
+            self._semaphore.release()
+            logging.info(
+                "gemini_stream model=%s outcome=%s chunks=%s seconds=%.3f",
+                name,
+                outcome,
+                chunks,
+                time.perf_counter() - started,
+            )
@@ -0,0 +1,127 @@
+"""Paged listing history and on-demand listing images.
+
+History pages are newest first and keyed by ``(created_at, id)``: the cursor
+carries the last row's pair, and the next page asks for rows strictly before
+it, so listings created at the same instant are neither skipped nor repeated
+across pages. The ``listings_user_created_at_id_idx`` index serves the query
+(see ``supabase/migrations/*_listing_history.sql``).
+
+Images are left out of pages unless asked for by name; rows created before
+results moved to object storage hold a multi-megabyte data URL. Pages say
+whether a listing has an image (the generated ``has_image`` column) and
+``listing_image_response`` serves it on demand.
+
+Both entry points call the synchronous Supabase client; run them in a worker
+thread from async code.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any
+
+from fastapi.responses import RedirectResponse, Response
+
+from storage import ObjectStore, decode_data_url, is_valid_key
+
+LISTING_FIELDS = ("id", "created_at", "original_description", "optimized_description", "optimized_image_url")
+DEFAULT_LISTING_FIELDS = ("id", "created_at", "original_description", "optimized_description")
+
+
+class InvalidHistoryQuery(ValueError):
+    """The requested fields or cursor cannot be used."""
+
+
+def parse_fields(fields: str | None) -> list[str]:
+    if not fields:
+        return list(DEFAULT_LISTING_FIELDS)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = sorted(set(requested) - set(LISTING_FIELDS))
+    if unknown:
+        raise InvalidHistoryQuery(f"Unknown listing fields: {', '.join(unknown)}")
+    # The cursor is built from created_at and id, so they are always returned
+    return ["id", "created_at"] + [field for field in requested if field not in ("id", "created_at")]
+
+
+def encode_cursor(listing: dict) -> str:
+    raw = json.dumps([listing["created_at"], listing["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        created_at, listing_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        # Both values end up in a PostgREST filter, so only accept a timestamp and a UUID
+        datetime.fromisoformat(created_at)
+        uuid.UUID(listing_id)
+    except (ValueError, TypeError):
+        raise InvalidHistoryQuery("Invalid cursor") from None
+    return created_at, listing_id
+
+
+def fetch_page(
+    client: Any, user_id: str, limit: int, cursor: str | None = None, fields: str | None = None
+) -> tuple[list[dict], str | None]:
+    """Return up to ``limit`` listings older than ``cursor`` and the cursor for the next page (None on the last)."""
+    selected = parse_fields(fields)
+    query = client.table("listings").select(",".join(selected + ["has_image"])).eq("user_id", user_id)
+    if cursor:
+        created_at, listing_id = decode_cursor(cursor)
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{listing_id})')
+    rows = query.order("created_at", desc=True).order("id", desc=True).limit(limit + 1).execute().data
+
+    page = rows[:limit]
+    for row in page:
+        has_image = row.pop("has_image", False)
+        row["image_url"] = f"/api/listings/{row['id']}/image" if has_image else None
+    return page, encode_cursor(page[-1]) if len(rows) > limit else None
+
+
+def listing_image_response(
+    client: Any,
+    user_id: str,
+    listing_id: str,
+    store: ObjectStore,
+    url_ttl: int,
+    if_none_match: str | None = None,
+) -> Response:
+    """A redirect to the image's signed URL, or the bytes of a legacy data URL; raises ``LookupError``."""
+    try:
+        uuid.UUID(listing_id)
+    except ValueError:
+        raise LookupError("Listing not found") from None
+    etag = f'"{listing_id}"'
+    if if_none_match == etag:
+        # Only ever sent back for the inline bytes below, which never change; a 304 reveals nothing
+        return Response(status_code=304, headers={"ETag": etag})
+    rows = (
+        client.table("listings")
+        .select("optimized_image_url")
+        .eq("id", listing_id)
+        .eq("user_id", user_id)
+        .limit(1)
+        .execute()
+        .data
+    )
+    image = rows[0]["optimized_image_url"] if rows else None
+    if not image:
+        raise LookupError("Listing image not found")
+    if is_valid_key(image):
+        # Cached for less time than the signed URL lives
+        return RedirectResponse(
+            store.signed_url(image, url_ttl),
+            status_code=307,
+            headers={"Cache-Control": f"private, max-age={max(0, url_ttl // 2)}"},
+        )
+    if image.startswith("data:"):
+        data, content_type = decode_data_url(image)
+        # A listing's image never changes after it is created
+        return Response(
+            content=data,
+            media_type=content_type,
+            headers={"Cache-Control": "private, max-age=31536000, immutable", "ETag": etag},
+        )
+    return RedirectResponse(image, status_code=307)
@@ -0,0 +1,103 @@
+"""Listing quota backed by the ``reserve_listing_quota`` Postgres functions.
+
+A request reserves a slot before any AI work (one RPC that checks the limit
+and takes the slot under a row lock), then either saves the listing and
+commits the slot in one RPC (``save``) or refunds it if generation fails. See
+``supabase/migrations/*_listing_quota.sql`` and ``*_save_listing_with_quota.sql``.
+
+Premium users are unlimited, so their status is remembered for
+``premium_ttl_seconds`` and reserving for them skips the database; a
+downgrade takes effect within that window.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any
+
+from metrics import REGISTRY
+
+QUOTA_RESERVATIONS = REGISTRY.counter(
+    "listing_quota_reservations_total",
+    "Quota reservations, by result (reserved, premium_cached, premium, exceeded).",
+    ("result",),
+)
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, limit: int):
+        super().__init__(f"Listing limit reached ({limit})")
+        self.limit = limit
+
+
+@dataclass(frozen=True)
+class QuotaReservation:
+    user_id: str
+    # None for premium users, who hold no reservation
+    id: str | None
+    remaining: int | None
+
+    @property
+    def unlimited(self) -> bool:
+        return self.id is None
+
+
+class ListingQuota:
+    def __init__(
+        self,
+        client: Any,
+        premium_ttl_seconds: float = 60.0,
+        reservation_ttl_seconds: int = 300,
+        clock=time.monotonic,
+    ):
+        self.client = client
+        self.premium_ttl_seconds = premium_ttl_seconds
+        self.reservation_ttl_seconds = reservation_ttl_seconds
+        self._clock = clock
+        self._premium_until: dict[str, float] = {}
+
+    def reserve(self, user_id: str) -> QuotaReservation:
+        """Take a listing slot; raises ``QuotaExceeded`` when the free tier is used up."""
+        if self._premium_until.get(user_id, 0.0) > self._clock():
+            QUOTA_RESERVATIONS.inc(result="premium_cached")
+            return QuotaReservation(user_id=user_id, id=None, remaining=None)
+
+        result = self.client.rpc(
+            "reserve_listing_quota", {"p_user_id": user_id, "p_ttl_seconds": self.reservation_ttl_seconds}
+        ).execute()
+        row = result.data[0] if isinstance(result.data, list) and result.data else result.data
+        if not row:
+            raise LookupError(f"No profile for user {user_id}")
+        if row["is_premium"]:
+            self._premium_until[user_id] = self._clock() + self.premium_ttl_seconds
+            QUOTA_RESERVATIONS.inc(result="premium")
+            return QuotaReservation(user_id=user_id, id=None, remaining=None)
+        if not row["allowed"]:
+            QUOTA_RESERVATIONS.inc(result="exceeded")
+            raise QuotaExceeded(row["listings_limit"])
+        QUOTA_RESERVATIONS.inc(result="reserved")
+        return QuotaReservation(user_id=user_id, id=row["reservation_id"], remaining=row["remaining"])
+
+    def save(self, reservation: QuotaReservation, listing: dict) -> None:
+        """Insert ``listing`` and commit the reservation together; neither happens if the slot is no longer held."""
+        self.client.rpc(
+            "save_listing_with_quota",
+            {"p_user_id": reservation.user_id, "p_reservation_id": reservation.id, "p_listing": listing},
+        ).execute()
+
+    def refund(self, reservation: QuotaReservation) -> None:
+        if reservation.unlimited:
+            return
+        try:
+            self.client.rpc(
+                "refund_listing_quota", {"p_user_id": reservation.user_id, "p_reservation_id": reservation.id}
+            ).execute()
+        except Exception as exc:
+            # The reservation expires and is handed back on the user's next reserve anyway.
+            logging.error("Quota refund failed for %s: %s", reservation.id, exc)
+
+    def forget(self, user_id: str) -> None:
+        """Drop the cached premium status, e.g. after a subscription change."""
+        self._premium_until.pop(user_id, None)
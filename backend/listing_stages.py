@@ -0,0 +1,58 @@
+"""Concurrent stages of listing generation.
+
+The description and the image are independent Gemini calls, so they run side
+by side and a listing takes as long as the slower one, not the sum. A stage
+that fails does not take the other one with it: a failed description falls
+back to template text and a failed image leaves the listing without one.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable
+
+
+async def run_stages(stages: dict[str, Awaitable]) -> tuple[dict, dict[str, float]]:
+    """Run independent stages concurrently.
+
+    A stage that raises leaves its exception in the results instead of
+    discarding the others; cancelling the caller cancels every stage.
+    Returns results and elapsed milliseconds keyed by stage name.
+    """
+    timings: dict[str, float] = {}
+
+    async def timed(name: str, stage: Awaitable):
+        started = time.perf_counter()
+        try:
+            return await stage
+        finally:
+            timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+    names = list(stages)
+    outcomes = await asyncio.gather(*(timed(name, stages[name]) for name in names), return_exceptions=True)
+    return dict(zip(names, outcomes)), timings
+
+
+async def generate_listing(
+    description: str,
+    describe: Callable[[str], Awaitable[str]],
+    fallback: Callable[[str], str],
+    image_stage: Awaitable[str | None] | None = None,
+) -> tuple[str, str | None, dict[str, float]]:
+    """Run the description and image stages; return the description, the image key and per-stage timings."""
+    stages = {"description": describe(description)}
+    if image_stage is not None:
+        stages["image"] = image_stage
+    results, timings = await run_stages(stages)
+
+    optimized_description = results["description"]
+    if isinstance(optimized_description, Exception):
+        logging.error("Description stage failed: %s", optimized_description)
+        optimized_description = fallback(description)
+    optimized_image_key = results.get("image")
+    if isinstance(optimized_image_key, Exception):
+        logging.error("Image stage failed: %s", optimized_image_key)
+        optimized_image_key = None
+    return optimized_description, optimized_image_key, timings
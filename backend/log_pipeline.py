@@ -0,0 +1,155 @@
+"""Non-blocking structured logging for the backends.
+
+Records are put on a bounded queue by the calling thread (the event loop)
+and formatted/written by a ``QueueListener`` thread, so slow stderr or log
+shippers never add latency to requests. High-volume events can be sampled
+and a full queue drops records instead of blocking; both are counted.
+
+Events follow the existing ``"<event> key=value ..."`` message convention:
+the first token is the event name and ``key=value`` pairs become fields.
+"""
+
+from __future__ import annotations
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from metrics import REGISTRY
+
+DEFAULT_QUEUE_SIZE = 10_000
+# Logged on every authenticated request; keep a trickle for debugging.
+DEFAULT_SAMPLE_RATES = {"session_token_ok": 0.01}
+
+LOG_RECORDS_DROPPED = REGISTRY.counter(
+    "log_records_dropped_total",
+    "Log records discarded before being written, by reason (sampled or queue_full).",
+    ("reason",),
+)
+
+_FIELD_PATTERN = re.compile(r"(\w+)=(\S+)")
+_listener: QueueListener | None = None
+
+
+def _event_name(message: str) -> str:
+    return message.split(" ", 1)[0] if message else ""
+
+
+def parse_sample_rates(raw: str | None) -> dict[str, float]:
+    """Parse ``"event=rate,event=rate"`` into a mapping, ignoring malformed entries."""
+    rates = dict(DEFAULT_SAMPLE_RATES)
+    for item in (raw or "").split(","):
+        name, _, value = item.strip().partition("=")
+        if not name or not value:
+            continue
+        try:
+            rates[name] = min(1.0, max(0.0, float(value)))
+        except ValueError:
+            continue
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        message = record.getMessage()
+        event, _, rest = message.partition(" ")
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": event,
+        }
+        for key, value in _FIELD_PATTERN.findall(rest):
+            entry.setdefault(key, value)
+        entry["message"] = message
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack_info"] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of records for configured event names."""
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not self.rates or record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(_event_name(str(record.msg)))
+        if rate is None or rate >= 1.0:
+            return True
+        if rate > 0.0 and random.random() < rate:
+            return True
+        LOG_RECORDS_DROPPED.inc(reason="sampled")
+        return False
+
+
+class BoundedQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stdlib version formats on the calling thread and clears exc_info; only merge the
+        # arguments here (they may change after the call) and leave formatting to the listener.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc(reason="queue_full")
+
+
+def configure_logging(
+    level: str | int | None = None,
+    sample_rates: dict[str, float] | None = None,
+    queue_size: int | None = None,
+    json_output: bool | None = None,
+) -> QueueListener:
+    """Route the root logger through a bounded queue; safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = level or os.environ.get("LOG_LEVEL", "INFO").upper()
+    if sample_rates is None:
+        sample_rates = parse_sample_rates(os.environ.get("LOG_SAMPLE_RATES"))
+    if queue_size is None:
+        queue_size = int(os.environ.get("LOG_QUEUE_SIZE", DEFAULT_QUEUE_SIZE))
+    if json_output is None:
+        json_output = os.environ.get("LOG_FORMAT", "json").lower() == "json"
+
+    stream_handler = logging.StreamHandler(sys.stderr)
+    if json_output:
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+
+    log_queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+    queue_handler = BoundedQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rates))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
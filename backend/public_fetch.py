@@ -0,0 +1,61 @@
+"""HTTP transport that only connects to public internet addresses.
+
+Bulk uploads carry user-supplied image URLs, so fetching them must not reach
+the metadata service, loopback or the private network. Checking the hostname
+before the request is not enough: DNS can answer with a public address for
+the check and a private one for the connection. ``PublicAddressTransport``
+resolves the host itself, rejects the request unless every address is
+globally routable, and connects to the address it checked. TLS still
+verifies the certificate against the original hostname (sent as SNI), and
+the ``Host`` header is left unchanged.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import ipaddress
+import socket
+
+import httpx
+
+
+class BlockedAddress(httpx.RequestError):
+    """The URL's host is, or resolves to, an address that is not public."""
+
+
+def is_public_address(address: str) -> bool:
+    try:
+        return ipaddress.ip_address(address).is_global
+    except ValueError:
+        return False
+
+
+async def resolve_public_address(host: str, port: int) -> str:
+    """Return an address for ``host`` if all of its addresses are public; raises ``BlockedAddress``."""
+    if host == "localhost" or host.endswith(".localhost"):
+        raise BlockedAddress(f"{host} is not a public host")
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as exc:
+        raise httpx.ConnectError(f"Could not resolve {host}: {exc}") from exc
+    # IPv6 results carry a scope id in the sockaddr, never in the address string itself
+    addresses = [info[4][0] for info in infos]
+    if not addresses or not all(is_public_address(address) for address in addresses):
+        raise BlockedAddress(f"{host} does not resolve to a public address")
+    return addresses[0]
+
+
+class PublicAddressTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport | None = None, resolve=resolve_public_address):
+        self._transport = transport or httpx.AsyncHTTPTransport()
+        self._resolve = resolve
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        address = await self._resolve(host, request.url.port or (443 if request.url.scheme == "https" else 80))
+        request.url = request.url.copy_with(host=address)
+        request.extensions = {**request.extensions, "sni_hostname": host}
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
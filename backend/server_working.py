@@ -1,30 +1,105 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, UploadFile, Form, Header
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, UploadFile, Form, Header, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
 from dotenv import load_dotenv
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, EmailStr
-from typing import List, Optional
+from typing import Any, Awaitable, Dict, List, Optional, Tuple
+import asyncio
+import csv
+import httpx
+import io
+import hmac
+import jwt
+import json
+import time
 import uuid
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
-import base64
+from urllib.parse import urlparse
 import google.generativeai as genai
 from supabase import create_client, Client
 
+from bulk_jobs import BulkJobError, BulkJobRunner, BulkJobStore, BulkRow, JobAlreadyActive, StopJob
+from bulk_jobs import file_format_for, is_active
+from description_batcher import DescriptionBatcher
+from description_cache import DescriptionCache, description_cache_key
+from gemini_client import GeminiClient
+import listing_history
+import listing_stages
+from listing_quota import ListingQuota, QuotaExceeded, QuotaReservation
+from log_pipeline import configure_logging
+from metrics import CONTENT_TYPE_LATEST, REGISTRY
+from public_fetch import BlockedAddress, PublicAddressTransport
+from shared_state import create_state
+from storage import LocalStore, content_type_for, create_store, is_valid_key
+from supabase_auth import TokenVerifier
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
+configure_logging()
 
-# Configure Gemini
+# Configure Gemini; models are built once and shared, generations run on the async API
 genai.configure(api_key=os.environ['GEMINI_API_KEY'])
+GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-2.0-flash-exp')
+gemini = GeminiClient(
+    models=[GEMINI_MODEL],
+    max_concurrency=int(os.environ.get('GEMINI_MAX_CONCURRENCY', '8')),
+    timeout_seconds=float(os.environ.get('GEMINI_TIMEOUT_SECONDS', '60')),
+)
+
+# Generated descriptions are cached by normalized text; bump the version whenever the prompt changes
+DESCRIPTION_PROMPT_VERSION = "2024-11-v1"
+description_cache = DescriptionCache(
+    store=create_state(
+        os.environ.get('DESCRIPTION_CACHE_URL') or f"sqlite:///{ROOT_DIR / 'var' / 'description_cache.sqlite3'}"
+    ),
+    max_entries=int(os.environ.get('DESCRIPTION_CACHE_SIZE', '1024')),
+    ttl_seconds=float(os.environ.get('DESCRIPTION_CACHE_TTL_SECONDS', str(7 * 86400))),
+)
 
 # Supabase setup
 SUPABASE_URL = os.environ['SUPABASE_URL']
 SUPABASE_KEY = os.environ['SUPABASE_SERVICE_KEY']
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
 
+# Listing quota is reserved in one RPC (see supabase/migrations); premium status is cached briefly
+listing_quota = ListingQuota(
+    supabase,
+    premium_ttl_seconds=float(os.environ.get('PREMIUM_STATUS_TTL_SECONDS', '60')),
+)
+
+# Access tokens are verified locally against the JWT secret and/or the project's JWKS
+token_verifier = TokenVerifier(
+    jwt_secret=os.environ.get('SUPABASE_JWT_SECRET', ''),
+    jwks_url=os.environ.get('SUPABASE_JWKS_URL', f"{SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json"),
+    issuer=os.environ.get('SUPABASE_JWT_ISSUER') or None,
+    jwks_refresh_seconds=float(os.environ.get('SUPABASE_JWKS_REFRESH_SECONDS', '600')),
+)
+
+# Optimized images are stored by content hash; listings keep the key and responses carry signed URLs.
+# The signing secret is required and must not be another credential: anyone holding it can mint result links.
+RESULT_URL_TTL = int(os.environ.get('RESULT_URL_TTL', '3600'))
+result_store = create_store(
+    os.environ.get('RESULT_STORE_URL') or f"file://{ROOT_DIR / 'var' / 'results'}",
+    base_url=os.environ.get('RESULT_PUBLIC_BASE_URL', '/api/results'),
+    secret=os.environ['RESULT_URL_SECRET'],
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    token_verifier.start()
+    yield
+    await token_verifier.close()
+    await bulk_jobs.close()
+    await image_fetcher.aclose()
+
 # Create the main app
-app = FastAPI(title="eBai - eBay Listing Optimization Tool")
+app = FastAPI(title="eBai - eBay Listing Optimization Tool", lifespan=lifespan)
 api_router = APIRouter(prefix="/api")
 
 # Models
@@ -47,29 +122,54 @@ class OptimizedListing(BaseModel):
     optimized_description: str
     optimized_image_url: Optional[str] = None
     created_at: datetime
+    # Milliseconds per stage of the request that created the listing (not stored)
+    timings: Optional[Dict[str, float]] = None
 
-# Auth dependency
-async def get_current_user(authorization: str = Header(None)):
+class ListingPage(BaseModel):
+    listings: List[Dict[str, Any]]
+    # Pass back as ``cursor`` to get the next page; None on the last page
+    next_cursor: Optional[str] = None
+
+# Auth dependencies
+def bearer_token(authorization: Optional[str]) -> str:
     if not authorization or not authorization.startswith('Bearer '):
         raise HTTPException(status_code=401, detail="Not authenticated")
-    
-    token = authorization.replace('Bearer ', '')
-    
+    return authorization.replace('Bearer ', '')
+
+async def verify_token_locally(token: str):
     try:
-        user = supabase.auth.get_user(token)
-        if not user:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        return user
-    except Exception as e:
+        return await token_verifier.verify(token)
+    except jwt.InvalidTokenError as e:
         logging.error(f"Auth error: {e}")
         raise HTTPException(status_code=401, detail="Could not validate credentials")
 
-async def optimize_description(original_description: str) -> str:
-    """Use Gemini to create compelling eBay listing description"""
+async def verify_token_remotely(token: str):
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
-        prompt = f"""Transform this basic product description into a compelling eBay listing that sells:
+        user = await asyncio.to_thread(supabase.auth.get_user, token)
+    except Exception as e:
+        logging.error(f"Auth error: {e}")
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return user
+
+async def get_current_user(authorization: str = Header(None)):
+    """Identity from a locally verified token; Supabase is only asked when no local key can check it."""
+    token = bearer_token(authorization)
+    return await verify_token_locally(token) or await verify_token_remotely(token)
+
+async def get_current_user_checked(authorization: str = Header(None)):
+    """Like ``get_current_user``, but always confirms with Supabase so sign-outs and bans apply at once.
+
+    Used on routes that spend listing quota and AI calls; local verification
+    still rejects malformed and expired tokens without a round trip.
+    """
+    token = bearer_token(authorization)
+    await verify_token_locally(token)
+    return await verify_token_remotely(token)
+
+def description_prompt(original_description: str) -> str:
+    return f"""Transform this basic product description into a compelling eBay listing that sells:
 
 ORIGINAL: {original_description}
 
@@ -83,17 +183,49 @@ Create a persuasive eBay listing description that:
 
 Format it professionally for eBay with proper formatting and bullet points where appropriate."""
 
-        response = model.generate_content(prompt)
-        return response.text
+def description_cache_key_for(original_description: str) -> str:
+    return description_cache_key(original_description, GEMINI_MODEL, DESCRIPTION_PROMPT_VERSION)
+
+# Opt-in: concurrent description requests share one structured-output Gemini call
+description_batcher = DescriptionBatcher(
+    gemini,
+    GEMINI_MODEL,
+    description_prompt,
+    max_batch_size=int(os.environ.get('DESCRIPTION_BATCH_SIZE', '8')),
+    max_wait_seconds=float(os.environ.get('DESCRIPTION_BATCH_WAIT_MS', '20')) / 1000,
+) if os.environ.get('DESCRIPTION_BATCHING', '').lower() in ('1', 'true', 'yes') else None
+
+async def optimize_description(original_description: str) -> str:
+    """Use Gemini to create compelling eBay listing description"""
+    cache_key = description_cache_key_for(original_description)
+    cached = await description_cache.aget(cache_key)
+    if cached is not None:
+        return cached
+    try:
+        if description_batcher is not None:
+            text = await description_batcher.generate(original_description)
+        else:
+            text = (await gemini.generate(GEMINI_MODEL, description_prompt(original_description))).text
+        # Only real generations are cached, never the fallback text below
+        await description_cache.aset(cache_key, text)
+        return text
     except Exception as e:
         logging.error(f"Error optimizing description: {e}")
-        return f"PREMIUM LISTING: {original_description}\\n\\n✨ Professional eBay listing optimization available! This item features excellent quality and condition. Perfect for collectors and enthusiasts. Don't miss this opportunity - buy now while available!"
+        return fallback_description(original_description)
 
-async def optimize_image(image_data: bytes, description: str = "") -> Optional[str]:
+def fallback_description(original_description: str) -> str:
+    return f"PREMIUM LISTING: {original_description}\\n\\n✨ Professional eBay listing optimization available! This item features excellent quality and condition. Perfect for collectors and enthusiasts. Don't miss this opportunity - buy now while available!"
+
+def with_result_url(listing: dict) -> dict:
+    """Swap a stored result key for a signed URL; legacy inline data URLs pass through."""
+    key = listing.get('optimized_image_url')
+    if key and is_valid_key(key):
+        listing = {**listing, 'optimized_image_url': result_store.signed_url(key, RESULT_URL_TTL)}
+    return listing
+
+async def optimize_image(image_data: bytes, description: str = "") -> Optional[Tuple[bytes, str]]:
     """Use Gemini to create professional product photo with hot pink backdrop"""
     try:
-        model = genai.GenerativeModel('gemini-2.0-flash-exp')
-        
         # Prepare image
         import PIL.Image
         import io
@@ -113,14 +245,14 @@ async def optimize_image(image_data: bytes, description: str = "") -> Optional[s
 
 **OUTPUT:** A single, high-resolution JPEG image suitable for a high-end eBay listing."""
 
-        response = model.generate_content([prompt, image])
+        response = await gemini.generate(GEMINI_MODEL, [prompt, image])
         
         # Check if response has images
         if hasattr(response, 'parts'):
             for part in response.parts:
                 if hasattr(part, 'inline_data'):
                     logging.info("Successfully generated optimized image using Gemini")
-                    return base64.b64encode(part.inline_data.data).decode('utf-8')
+                    return part.inline_data.data, part.inline_data.mime_type or 'image/png'
         
         logging.warning("No images generated by Gemini - image optimization not available")
         return None
@@ -189,68 +321,368 @@ async def login(user: UserLogin):
         logging.error(f"Login error: {e}")
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
+async def store_optimized_image(image_data: bytes, description: str) -> Optional[str]:
+    """Optimize an image and return the stored result's key."""
+    optimized_image = await optimize_image(image_data, description)
+    if not optimized_image:
+        return None
+    return (await asyncio.to_thread(result_store.put, *optimized_image)).key
+
+async def optimize_and_store_image(image: UploadFile, description: str) -> Optional[str]:
+    return await store_optimized_image(await image.read(), description)
+
+async def generate_listing(
+    description: str,
+    image_stage: Optional[Awaitable[Optional[str]]] = None,
+) -> Tuple[str, Optional[str], Dict[str, float]]:
+    """Run the description and image stages; a failed stage falls back instead of failing the listing."""
+    return await listing_stages.generate_listing(description, optimize_description, fallback_description, image_stage)
+
+async def reserve_listing_quota(user_id: str) -> QuotaReservation:
+    """Take a listing slot, or raise 403 when the free tier is used up."""
+    try:
+        return await asyncio.to_thread(listing_quota.reserve, user_id)
+    except QuotaExceeded as e:
+        raise HTTPException(
+            status_code=403, 
+            detail=f"Free tier limit reached ({e.limit} listings). Upgrade to premium for unlimited access."
+        )
+
+def save_listing(
+    reservation: QuotaReservation,
+    original_description: str,
+    optimized_description: str,
+    optimized_image_key: Optional[str],
+) -> dict:
+    """Insert the listing row and commit its quota reservation in one transaction."""
+    listing_data = {
+        "id": str(uuid.uuid4()),
+        "user_id": reservation.user_id,
+        "original_description": original_description,
+        "optimized_description": optimized_description,
+        "optimized_image_url": optimized_image_key,
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    listing_quota.save(reservation, listing_data)
+    return listing_data
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 # Listing routes
 @api_router.post("/listings/optimize", response_model=OptimizedListing)
 async def create_optimized_listing(
+    response: Response,
     description: str = Form(...),
     image: Optional[UploadFile] = File(None),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user_checked)
 ):
+    reservation = None
+    saved = False
     try:
+        started = time.perf_counter()
         user_id = current_user.user.id
         
-        profile = supabase.table('profiles').select("*").eq('id', user_id).single().execute()
-        
-        if not profile.data['is_premium'] and profile.data['listings_used'] >= profile.data['listings_limit']:
-            raise HTTPException(
-                status_code=403, 
-                detail=f"Free tier limit reached ({profile.data['listings_limit']} listings). Upgrade to premium for unlimited access."
-            )
-        
-        # Optimize description
-        optimized_description = await optimize_description(description)
+        reservation = await reserve_listing_quota(user_id)
         
-        # Optimize image if provided
-        optimized_image_data = None
-        if image:
-            image_bytes = await image.read()
-            optimized_image_data = await optimize_image(image_bytes, description)
-        
-        # Create listing record
-        listing_id = str(uuid.uuid4())
-        listing_data = {
-            "id": listing_id,
-            "user_id": user_id,
-            "original_description": description,
-            "optimized_description": optimized_description,
-            "optimized_image_url": f"data:image/png;base64,{optimized_image_data}" if optimized_image_data else None,
-            "created_at": datetime.now(timezone.utc).isoformat()
-        }
-        
-        supabase.table('listings').insert(listing_data).execute()
+        optimized_description, optimized_image_key, timings = await generate_listing(
+            description, optimize_and_store_image(image, description) if image else None
+        )
         
-        # Update usage count
-        supabase.table('profiles').update({
-            "listings_used": profile.data['listings_used'] + 1
-        }).eq('id', user_id).execute()
+        listing_data = await asyncio.to_thread(
+            save_listing, reservation, description, optimized_description, optimized_image_key
+        )
+        saved = True
         
-        return OptimizedListing(**listing_data)
+        timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+        response.headers["Server-Timing"] = ", ".join(f"{name};dur={ms}" for name, ms in timings.items())
+        return OptimizedListing(**with_result_url(listing_data), timings=timings)
     except HTTPException:
         raise
     except Exception as e:
         logging.error(f"Optimization error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        # Errors, HTTPExceptions and cancelled requests (client disconnects) all hand the slot back;
+        # shielded so a cancelled request still finishes the refund
+        if reservation is not None and not saved:
+            await asyncio.shield(asyncio.to_thread(listing_quota.refund, reservation))
+
+@api_router.post("/listings/optimize/stream")
+async def stream_optimized_listing(
+    description: str = Form(...),
+    current_user = Depends(get_current_user_checked)
+):
+    """Stream the optimized description over Server-Sent Events, then save the listing.
+
+    Emits a ``delta`` event (``{"text": ...}``) per generated chunk and a final
+    ``done`` event carrying the saved listing, or ``error``. Nothing is saved or
+    counted if the client disconnects before the stream finishes.
+    """
+    # Quota problems surface as a normal 403 before any event is sent
+    reservation = await reserve_listing_quota(current_user.user.id)
+    stream_started = False
+
+    async def events():
+        nonlocal stream_started
+        stream_started = True
+        started = time.perf_counter()
+        timings: Dict[str, float] = {}
+        cache_key = description_cache_key_for(description)
+        parts: List[str] = []
+        saved = False
+        try:
+            cached = await description_cache.aget(cache_key)
+            if cached is not None:
+                parts.append(cached)
+                yield sse_event("delta", {"text": cached})
+            else:
+                try:
+                    async for text in gemini.stream(GEMINI_MODEL, description_prompt(description)):
+                        if not parts:
+                            timings["first_token"] = round((time.perf_counter() - started) * 1000, 1)
+                        parts.append(text)
+                        yield sse_event("delta", {"text": text})
+                    await description_cache.aset(cache_key, "".join(parts))
+                except Exception as e:
+                    logging.error(f"Error streaming description: {e}")
+                    if parts:
+                        # Half a description is already on screen; don't save or charge for it
+                        yield sse_event("error", {"detail": "Description generation failed"})
+                        return
+                    parts.append(fallback_description(description))
+                    yield sse_event("delta", {"text": parts[0]})
+            timings["description"] = round((time.perf_counter() - started) * 1000, 1)
+            try:
+                listing_data = await asyncio.to_thread(save_listing, reservation, description, "".join(parts), None)
+                saved = True
+            except Exception as e:
+                logging.error(f"Error saving streamed listing: {e}")
+                yield sse_event("error", {"detail": "Could not save listing"})
+                return
+            timings["total"] = round((time.perf_counter() - started) * 1000, 1)
+            listing = OptimizedListing(**listing_data, timings=timings)
+            yield sse_event("done", jsonable_encoder(listing))
+        finally:
+            # Failed generations and disconnected clients get their slot back; shielded so a
+            # cancelled stream still finishes the refund
+            if not saved:
+                await asyncio.shield(asyncio.to_thread(listing_quota.refund, reservation))
+
+    async def refund_unstarted():
+        # A client that disconnects before the first event never runs the generator or its finally
+        if not stream_started:
+            await asyncio.to_thread(listing_quota.refund, reservation)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(refund_unstarted),
+    )
+
+# Bulk jobs: one row per listing, processed in the background by a small worker pool
+BULK_UPLOAD_DIR = Path(os.environ.get('BULK_UPLOAD_DIR') or ROOT_DIR / 'var' / 'bulk_uploads')
+BULK_MAX_UPLOAD_BYTES = int(os.environ.get('BULK_MAX_UPLOAD_BYTES', str(20 * 1024 * 1024)))
+BULK_IMAGE_MAX_BYTES = int(os.environ.get('BULK_IMAGE_MAX_BYTES', str(10 * 1024 * 1024)))
+BULK_RESULT_COLUMNS = (
+    'row_number', 'status', 'original_description', 'listing_id',
+    'optimized_description', 'optimized_image_url', 'error',
+)
+# Connects only to the public address it resolved, so a DNS rebind cannot reach the private network
+image_fetcher = httpx.AsyncClient(
+    transport=PublicAddressTransport(),
+    timeout=httpx.Timeout(20.0, connect=5.0),
+    follow_redirects=False,
+)
+
+async def fetch_image_reference(url: str) -> bytes:
+    parsed = urlparse(url)
+    if parsed.scheme != 'https' or not parsed.hostname:
+        raise ValueError("Image references must be public https URLs")
+    chunks, size = [], 0
+    try:
+        async with image_fetcher.stream('GET', url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > BULK_IMAGE_MAX_BYTES:
+                    raise ValueError("Image reference is too large")
+                chunks.append(chunk)
+    except BlockedAddress:
+        raise ValueError("Image references must be public https URLs")
+    return b"".join(chunks)
+
+async def optimize_and_store_image_reference(url: str, description: str) -> Optional[str]:
+    return await store_optimized_image(await fetch_image_reference(url), description)
+
+async def process_bulk_row(user_id: str, row: BulkRow) -> dict:
+    """Optimize one bulk row; each row reserves and is counted against quota like a single listing."""
+    try:
+        reservation = await asyncio.to_thread(listing_quota.reserve, user_id)
+    except QuotaExceeded as e:
+        raise StopJob(f"Free tier limit reached ({e.limit} listings)")
+    try:
+        optimized_description, optimized_image_key, _ = await generate_listing(
+            row.description,
+            optimize_and_store_image_reference(row.image_url, row.description) if row.image_url else None,
+        )
+        listing_data = await asyncio.to_thread(
+            save_listing, reservation, row.description, optimized_description, optimized_image_key
+        )
+    except BaseException:
+        await asyncio.to_thread(listing_quota.refund, reservation)
+        raise
+    return {
+        "listing_id": listing_data["id"],
+        "optimized_description": optimized_description,
+        "optimized_image_url": optimized_image_key,
+    }
+
+bulk_jobs = BulkJobRunner(
+    BulkJobStore(os.environ.get('BULK_JOB_DB_PATH') or ROOT_DIR / 'var' / 'bulk_jobs.sqlite3'),
+    process_bulk_row,
+    workers=int(os.environ.get('BULK_WORKERS', '4')),
+    max_rows=int(os.environ.get('BULK_MAX_ROWS', '1000')),
+)
+
+def spool_upload(source, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    written = 0
+    try:
+        with open(path, 'wb') as out:
+            while chunk := source.read(1024 * 1024):
+                written += len(chunk)
+                if written > BULK_MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail="Bulk upload is too large")
+                out.write(chunk)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+
+def bulk_job_status(job: dict) -> dict:
+    status = {key: value for key, value in job.items() if key != 'user_id'}
+    status['results_url'] = f"/api/listings/bulk/{job['id']}/results"
+    return status
+
+async def owned_bulk_job(job_id: str, user_id: str) -> dict:
+    job = await asyncio.to_thread(bulk_jobs.store.get_job, job_id)
+    if job is None or job['user_id'] != user_id:
+        raise HTTPException(status_code=404, detail="Bulk job not found")
+    return job
+
+@api_router.post("/listings/bulk", status_code=202)
+async def create_bulk_job(
+    file: UploadFile = File(...),
+    current_user = Depends(get_current_user_checked)
+):
+    """Optimize every row of a CSV (``description`` and optional ``image_url`` columns) or JSONL upload."""
+    user_id = current_user.user.id
+    try:
+        file_format = file_format_for(file.filename, file.content_type)
+    except BulkJobError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    # Cheap early rejection before spooling; start() repeats the check atomically with the insert
+    if await asyncio.to_thread(bulk_jobs.store.active_job, user_id):
+        raise HTTPException(status_code=409, detail="A bulk job is already running")
+    path = BULK_UPLOAD_DIR / f"{uuid.uuid4().hex}.{file_format}"
+    await asyncio.to_thread(spool_upload, file.file, path)
+    try:
+        return bulk_job_status(bulk_jobs.start(user_id, path, file_format, file.filename))
+    except JobAlreadyActive:
+        path.unlink(missing_ok=True)
+        raise HTTPException(status_code=409, detail="A bulk job is already running")
+
+@api_router.get("/listings/bulk/{job_id}")
+async def get_bulk_job(job_id: str, current_user = Depends(get_current_user)):
+    return bulk_job_status(await owned_bulk_job(job_id, current_user.user.id))
+
+@api_router.get("/listings/bulk/{job_id}/results")
+async def get_bulk_job_results(job_id: str, current_user = Depends(get_current_user)):
+    """CSV of finished rows in completion order; stays open until a running job finishes."""
+    await owned_bulk_job(job_id, current_user.user.id)
+
+    async def rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(BULK_RESULT_COLUMNS)
+        after = 0
+        while True:
+            # Read the job before its results so rows written just before it finished are not missed
+            job = await asyncio.to_thread(bulk_jobs.store.get_job, job_id)
+            results = await asyncio.to_thread(bulk_jobs.store.results_after, job_id, after)
+            for result in results:
+                result = with_result_url(result)
+                writer.writerow([result[column] for column in BULK_RESULT_COLUMNS])
+                after = result['seq']
+            if buffer.tell():
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if not results:
+                if not is_active(job):
+                    return
+                await asyncio.sleep(1.0)
+
+    return StreamingResponse(
+        rows(),
+        media_type="text/csv",
+        headers={
+            "Content-Disposition": f'attachment; filename="bulk-{job_id}.csv"',
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        },
+    )
 
 @api_router.get("/listings", response_model=List[OptimizedListing])
 async def get_user_listings(current_user = Depends(get_current_user)):
     try:
         user_id = current_user.user.id
         listings = supabase.table('listings').select("*").eq('user_id', user_id).order('created_at', desc=True).limit(100).execute()
-        return listings.data
+        return [with_result_url(listing) for listing in listings.data]
     except Exception as e:
         logging.error(f"Error fetching listings: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/listings/history", response_model=ListingPage)
+async def get_listing_history(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user = Depends(get_current_user)
+):
+    """Newest listings first, ``limit`` per page, paged by a (created_at, id) cursor.
+
+    ``fields`` is a comma-separated subset of ``listing_history.LISTING_FIELDS``. Images are
+    left out unless ``optimized_image_url`` is requested; instead each listing
+    with an image carries an ``image_url`` that loads it on demand.
+    """
+    try:
+        page, next_cursor = await asyncio.to_thread(
+            listing_history.fetch_page, supabase, current_user.user.id, limit, cursor, fields
+        )
+    except listing_history.InvalidHistoryQuery as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error fetching listing history: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    return ListingPage(listings=[with_result_url(row) for row in page], next_cursor=next_cursor)
+
+@api_router.get("/listings/{listing_id}/image")
+async def get_listing_image(
+    listing_id: str,
+    if_none_match: Optional[str] = Header(None),
+    current_user = Depends(get_current_user)
+):
+    """The listing's optimized image: a redirect to its signed URL, or the bytes of a legacy data URL."""
+    try:
+        return await asyncio.to_thread(
+            listing_history.listing_image_response,
+            supabase, current_user.user.id, listing_id, result_store, RESULT_URL_TTL, if_none_match,
+        )
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
 @api_router.get("/user/profile")
 async def get_user_profile(current_user = Depends(get_current_user)):
     try:
@@ -261,6 +693,27 @@ async def get_user_profile(current_user = Depends(get_current_user)):
         logging.error(f"Error fetching profile: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/results/{key:path}")
+async def get_result(key: str, expires: int = 0, sig: str = ""):
+    # No auth header here: <img> tags load these, so the signed query string is the credential
+    if not isinstance(result_store, LocalStore):
+        raise HTTPException(status_code=404, detail="Result not found")
+    if not result_store.verify(key, expires, sig) or not result_store.path(key).is_file():
+        raise HTTPException(status_code=404, detail="Result not found")
+    return FileResponse(
+        result_store.path(key),
+        media_type=content_type_for(key),
+        # Keys are content hashes, so the bytes never change and shared caches may keep them
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
+    )
+
+@api_router.get("/metrics")
+async def metrics(authorization: str = Header(None)):
+    metrics_token = os.environ.get('METRICS_TOKEN')
+    if metrics_token and not hmac.compare_digest(authorization or "", f"Bearer {metrics_token}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE_LATEST)
+
 @api_router.get("/")
 async def root():
     return {"message": "eBai API - eBay Listing Optimization Tool", "status": "online"}
@@ -275,7 +728,3 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
@@ -0,0 +1,236 @@
+"""Shared state for counters, caches and rate limits across uvicorn workers.
+
+``SharedState`` is deliberately small and maps onto Redis primitives
+(``GET``/``SET EX``/``DEL``/``INCRBY`` and a sorted-set sliding window), so a
+Redis adapter can be registered later with ``register_backend("redis", ...)``
+without touching callers.
+
+Backends are chosen by URL:
+
+- ``memory://`` — per process; fine for a single worker and for tests.
+- ``sqlite:///path/to/state.sqlite3`` — one WAL-mode file shared by every
+  worker on the host.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Callable
+from urllib.parse import urlparse
+
+
+class SharedState(ABC):
+    @abstractmethod
+    def get(self, key: str) -> str | None:
+        """Return the value stored at ``key`` or None when missing/expired."""
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        """Store ``value``; ``ttl`` is in seconds."""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove ``key`` and any sliding-window hits recorded under it."""
+
+    @abstractmethod
+    def incr(self, key: str, amount: int = 1, ttl: float | None = None) -> int:
+        """Atomically add ``amount`` and return the new value; ``ttl`` applies when the key is created."""
+
+    @abstractmethod
+    def hit_window(self, key: str, window_seconds: float, limit: int) -> bool:
+        """Record a hit unless ``limit`` hits already fall inside the window; False means over the limit."""
+
+    def close(self) -> None:
+        pass
+
+    def get_json(self, key: str) -> Any:
+        raw = self.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set_json(self, key: str, value: Any, ttl: float | None = None) -> None:
+        self.set(key, json.dumps(value, separators=(",", ":")), ttl)
+
+
+class InMemoryState(SharedState):
+    def __init__(self) -> None:
+        self._values: dict[str, tuple[str, float | None]] = {}
+        self._hits: dict[str, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key: str, now: float) -> tuple[str, float | None] | None:
+        entry = self._values.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._values[key]
+            return None
+        return entry
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            entry = self._live(key, time.time())
+        return entry[0] if entry else None
+
+    def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._values[key] = (value, expires_at)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._values.pop(key, None)
+            self._hits.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1, ttl: float | None = None) -> int:
+        now = time.time()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is None:
+                value, expires_at = amount, (now + ttl if ttl is not None else None)
+            else:
+                value, expires_at = int(entry[0]) + amount, entry[1]
+            self._values[key] = (str(value), expires_at)
+        return value
+
+    def hit_window(self, key: str, window_seconds: float, limit: int) -> bool:
+        now = time.time()
+        cutoff = now - window_seconds
+        with self._lock:
+            hits = [ts for ts in self._hits.get(key, ()) if ts > cutoff]
+            allowed = len(hits) < limit
+            if allowed:
+                hits.append(now)
+            if hits:
+                self._hits[key] = hits
+            else:
+                self._hits.pop(key, None)
+        return allowed
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS shared_kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires_at REAL
+);
+CREATE TABLE IF NOT EXISTS shared_hits (
+    key TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS shared_hits_key_ts ON shared_hits (key, ts);
+"""
+
+
+class SQLiteState(SharedState):
+    """Host-wide state in a WAL-mode SQLite file; every worker opens the same path."""
+
+    # Expired rows are swept every N writes rather than on every call.
+    SWEEP_EVERY = 1000
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # Counters and caches can be rebuilt; skip the fsync on every commit.
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SQLITE_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _write(self, fn: Callable[[sqlite3.Connection, float], Any]) -> Any:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn, now)
+                self._writes += 1
+                if self._writes % self.SWEEP_EVERY == 0:
+                    self._conn.execute("DELETE FROM shared_kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+                    self._conn.execute("DELETE FROM shared_hits WHERE ts <= ?", (now - 86400,))
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM shared_kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: str, ttl: float | None = None) -> None:
+        def apply(conn: sqlite3.Connection, now: float) -> None:
+            conn.execute(
+                "INSERT INTO shared_kv (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                (key, value, now + ttl if ttl is not None else None),
+            )
+
+        self._write(apply)
+
+    def delete(self, key: str) -> None:
+        def apply(conn: sqlite3.Connection, now: float) -> None:
+            conn.execute("DELETE FROM shared_kv WHERE key = ?", (key,))
+            conn.execute("DELETE FROM shared_hits WHERE key = ?", (key,))
+
+        self._write(apply)
+
+    def incr(self, key: str, amount: int = 1, ttl: float | None = None) -> int:
+        def apply(conn: sqlite3.Connection, now: float) -> int:
+            row = conn.execute(
+                "SELECT value, expires_at FROM shared_kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now),
+            ).fetchone()
+            if row is None:
+                value, expires_at = amount, (now + ttl if ttl is not None else None)
+            else:
+                value, expires_at = int(row[0]) + amount, row[1]
+            conn.execute(
+                "INSERT INTO shared_kv (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                (key, str(value), expires_at),
+            )
+            return value
+
+        return self._write(apply)
+
+    def hit_window(self, key: str, window_seconds: float, limit: int) -> bool:
+        def apply(conn: sqlite3.Connection, now: float) -> bool:
+            conn.execute("DELETE FROM shared_hits WHERE key = ? AND ts <= ?", (key, now - window_seconds))
+            (count,) = conn.execute("SELECT COUNT(*) FROM shared_hits WHERE key = ?", (key,)).fetchone()
+            if count >= limit:
+                return False
+            conn.execute("INSERT INTO shared_hits (key, ts) VALUES (?, ?)", (key, now))
+            return True
+
+        return self._write(apply)
+
+
+_BACKENDS: dict[str, Callable[[str], SharedState]] = {
+    "memory": lambda url: InMemoryState(),
+    "sqlite": lambda url: SQLiteState(urlparse(url).path),
+}
+
+
+def register_backend(scheme: str, factory: Callable[[str], SharedState]) -> None:
+    """Make ``scheme://...`` URLs resolve to ``factory(url)`` (e.g. a Redis adapter)."""
+    _BACKENDS[scheme] = factory
+
+
+def create_state(url: str) -> SharedState:
+    scheme = urlparse(url).scheme or "memory"
+    factory = _BACKENDS.get(scheme)
+    if factory is None:
+        raise ValueError(f"Unsupported shared state backend: {scheme}")
+    return factory(url)
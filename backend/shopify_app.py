@@ -1,13 +1,20 @@
 from __future__ import annotations
 
 import base64
+import contextvars
+import cProfile
 import hashlib
 import hmac
 import os
 import re
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
 from io import BytesIO
 from pathlib import Path
 from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Awaitable, Callable
 from urllib.parse import parse_qsl
 from urllib.parse import urlencode
 from urllib.parse import urlparse
@@ -18,66 +25,257 @@ import asyncio
 import jwt
 import logging
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, Request, File, UploadFile
+from fastapi import APIRouter, FastAPI, HTTPException, Request, File, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, RedirectResponse, Response, JSONResponse
+from fastapi.responses import FileResponse, RedirectResponse, Response, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from PIL import Image
-from pillow_heif import register_heif_opener
 from pydantic import BaseModel
-from supabase import Client, create_client
-
-load_dotenv()
-logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
-
-SHOPIFY_API_KEY = os.environ.get("SHOPIFY_API_KEY")
-SHOPIFY_API_SECRET = os.environ.get("SHOPIFY_API_SECRET")
-SHOPIFY_SCOPES = os.environ.get("SHOPIFY_SCOPES", "read_products,write_products")
-SHOPIFY_APP_URL = os.environ.get("SHOPIFY_APP_URL", "https://app.nudio.ai/shopify/app")
-# App Store listing slug + admin app handle (apps.shopify.com/<handle> and admin.shopify.com/.../apps/<handle>).
-SHOPIFY_APP_HANDLE = os.environ.get("SHOPIFY_APP_HANDLE", "nudio").strip()
-SHOPIFY_OAUTH_CALLBACK = os.environ.get(
-    "SHOPIFY_OAUTH_CALLBACK", "https://app.nudio.ai/shopify/oauth/callback"
-)
-SHOPIFY_ADMIN_API_VERSION = os.environ.get("SHOPIFY_ADMIN_API_VERSION", "2024-10")
-SHOPIFY_TEST_BILLING = os.environ.get("SHOPIFY_TEST_BILLING", "false").lower() in ("1", "true", "yes")
-SHOPIFY_SHOPS_TABLE = os.environ.get("SHOPIFY_SHOPS_TABLE", "shopify_shops")
-SHOPIFY_FRONTEND_BUILD_DIR = os.environ.get(
-    "SHOPIFY_FRONTEND_BUILD_DIR",
-    str(Path(__file__).resolve().parents[1] / "frontend-shopify" / "build"),
-)
+from starlette.background import BackgroundTask
+from starlette.routing import Match
+
+from adaptive_limit import AIMDLimit
+from catalog_export import CatalogExportError, CatalogExporter, CatalogIndex
+from fair_queue import Admission, FairScheduler, Overloaded
+from log_pipeline import configure_logging
+from metrics import BYTES_BUCKETS, CONTENT_TYPE_LATEST, REGISTRY
+from shared_state import SharedState, create_state
+from shopify_settings import ShopifySettings
+from storage import LocalStore, ObjectStore, content_type_for, create_store, decode_data_url
+from webhook_queue import WebhookConsumer, WebhookDelivery, WebhookQueue
+
+if TYPE_CHECKING:
+    from supabase import Client
+
 SHOPIFY_SUBSCRIPTION_NAME = "Nudio (Product Studio)"
 SHOPIFY_USAGE_DESCRIPTION = "Nudio image processing"
 SHOPIFY_USAGE_PRICE_USD = 0.08
 
-SUPABASE_URL = os.environ.get("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
-    raise RuntimeError("Missing SUPABASE_URL or SUPABASE_SERVICE_KEY")
+def _apply_settings(settings: ShopifySettings) -> None:
+    """Publish ``settings`` as the module-level config the helpers read.
 
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    Each app keeps its settings on ``app.state.settings`` and publishes them
+    when its lifespan starts, so the app that is serving is the one whose
+    config applies; importing the module only installs the defaults and
+    reads no environment. Lazily built clients are dropped so they pick up
+    the new values on next use.
+    """
+    global SHOPIFY_API_KEY, SHOPIFY_API_SECRET, SHOPIFY_SCOPES, SHOPIFY_APP_URL, SHOPIFY_APP_HANDLE
+    global SHOPIFY_OAUTH_CALLBACK, SHOPIFY_ADMIN_API_VERSION, SHOPIFY_ADMIN_BASE_URL, SHOPIFY_TEST_BILLING
+    global SHOPIFY_SHOPS_TABLE, SHOPIFY_FRONTEND_BUILD_DIR, SHOPIFY_METRICS_TOKEN, SHOPIFY_PROFILE_SECRET
+    global SHOPIFY_PROFILE_DIR, SHOPIFY_PROFILE_KEEP, SHOPIFY_WEBHOOK_QUEUE_PATH, SHOPIFY_WEBHOOK_DEDUPE_SECONDS
+    global SHOPIFY_CATALOG_INDEX_PATH, SHOPIFY_THUMB_CACHE_DIR, SHOPIFY_THUMB_CACHE_MAX_BYTES
+    global SHOPIFY_RESULT_STORE_URL, SHOPIFY_RESULT_URL_TTL, SHOPIFY_RESULT_URL_SECRET
+    global SHOPIFY_STATE_URL, SUPABASE_URL, SUPABASE_SERVICE_KEY, SUPABASE_FUNCTION_BASE
+    global SHOPIFY_EDGE_MAX_CONCURRENCY, SHOPIFY_EDGE_SHOP_CONCURRENCY, SHOPIFY_EDGE_QUEUE_DEPTH
+    global SHOPIFY_EDGE_SHOP_QUEUE_DEPTH, SHOPIFY_EDGE_SHOP_WEIGHTS, SHOPIFY_EDGE_MIN_CONCURRENCY
+    global SHOPIFY_EDGE_INITIAL_CONCURRENCY, SHOPIFY_EDGE_LATENCY_TOLERANCE, SHOPIFY_EDGE_TIMEOUT_SECONDS
+    global _SUPABASE_CLIENT, _WEBHOOK_QUEUE, _SHARED_STATE, _EDGE_SCHEDULER, _EDGE_LIMIT
+    global _CATALOG_INDEX, _CATALOG_EXPORTER, _RESULT_STORE
+    SHOPIFY_API_KEY = settings.api_key
+    SHOPIFY_API_SECRET = settings.api_secret
+    SHOPIFY_SCOPES = settings.scopes
+    SHOPIFY_APP_URL = settings.app_url
+    SHOPIFY_APP_HANDLE = settings.app_handle
+    SHOPIFY_OAUTH_CALLBACK = settings.oauth_callback
+    SHOPIFY_ADMIN_API_VERSION = settings.admin_api_version
+    SHOPIFY_ADMIN_BASE_URL = settings.admin_base_url
+    SHOPIFY_TEST_BILLING = settings.test_billing
+    SHOPIFY_SHOPS_TABLE = settings.shops_table
+    SHOPIFY_FRONTEND_BUILD_DIR = settings.frontend_build_dir
+    SHOPIFY_METRICS_TOKEN = settings.metrics_token
+    SHOPIFY_PROFILE_SECRET = settings.profile_secret
+    SHOPIFY_PROFILE_DIR = settings.profile_dir
+    SHOPIFY_PROFILE_KEEP = settings.profile_keep
+    SHOPIFY_WEBHOOK_QUEUE_PATH = settings.webhook_queue_path
+    SHOPIFY_WEBHOOK_DEDUPE_SECONDS = settings.webhook_dedupe_seconds
+    SHOPIFY_CATALOG_INDEX_PATH = settings.catalog_index_path
+    SHOPIFY_THUMB_CACHE_DIR = settings.thumb_cache_dir
+    SHOPIFY_THUMB_CACHE_MAX_BYTES = settings.thumb_cache_max_bytes
+    SHOPIFY_RESULT_STORE_URL = settings.result_store_url
+    SHOPIFY_RESULT_URL_TTL = settings.result_url_ttl
+    SHOPIFY_RESULT_URL_SECRET = settings.result_url_secret
+    SHOPIFY_STATE_URL = settings.state_url
+    SUPABASE_URL = settings.supabase_url
+    SUPABASE_SERVICE_KEY = settings.supabase_service_key
+    SUPABASE_FUNCTION_BASE = f"{SUPABASE_URL}/functions/v1" if SUPABASE_URL else ""
+    SHOPIFY_EDGE_MAX_CONCURRENCY = settings.edge_max_concurrency
+    SHOPIFY_EDGE_SHOP_CONCURRENCY = settings.edge_shop_concurrency
+    SHOPIFY_EDGE_QUEUE_DEPTH = settings.edge_queue_depth
+    SHOPIFY_EDGE_SHOP_QUEUE_DEPTH = settings.edge_shop_queue_depth
+    SHOPIFY_EDGE_SHOP_WEIGHTS = dict(settings.edge_shop_weights)
+    SHOPIFY_EDGE_MIN_CONCURRENCY = settings.edge_min_concurrency
+    SHOPIFY_EDGE_INITIAL_CONCURRENCY = settings.edge_initial_concurrency
+    SHOPIFY_EDGE_LATENCY_TOLERANCE = settings.edge_latency_tolerance
+    SHOPIFY_EDGE_TIMEOUT_SECONDS = settings.edge_timeout_seconds
+    _SUPABASE_CLIENT = None
+    _WEBHOOK_QUEUE = None
+    _SHARED_STATE = None
+    _EDGE_SCHEDULER = None
+    _EDGE_LIMIT = None
+    _CATALOG_INDEX = None
+    _CATALOG_EXPORTER = None
+    _RESULT_STORE = None
+
+
+_SUPABASE_CLIENT: Client | None = None
+_WEBHOOK_QUEUE: WebhookQueue | None = None
+_SHARED_STATE: SharedState | None = None
+_EDGE_SCHEDULER: FairScheduler | None = None
+_EDGE_LIMIT: AIMDLimit | None = None
+_CATALOG_INDEX: CatalogIndex | None = None
+_CATALOG_EXPORTER: CatalogExporter | None = None
+_RESULT_STORE: ObjectStore | None = None
+_HEIF_OPENER_REGISTERED = False
+_apply_settings(ShopifySettings())
+
+
+def _supabase() -> Client:
+    # Importing supabase pulls in several HTTP/auth packages; keep it off the cold-start path.
+    global _SUPABASE_CLIENT
+    if _SUPABASE_CLIENT is None:
+        if not SUPABASE_URL or not SUPABASE_SERVICE_KEY:
+            raise HTTPException(status_code=500, detail="Missing Supabase configuration.")
+        from supabase import create_client
+
+        _SUPABASE_CLIENT = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+    return _SUPABASE_CLIENT
+
+
+def _webhook_queue() -> WebhookQueue:
+    global _WEBHOOK_QUEUE
+    if _WEBHOOK_QUEUE is None:
+        _WEBHOOK_QUEUE = WebhookQueue(SHOPIFY_WEBHOOK_QUEUE_PATH, dedupe_window_seconds=SHOPIFY_WEBHOOK_DEDUPE_SECONDS)
+    return _WEBHOOK_QUEUE
+
+
+def _shared_state() -> SharedState:
+    global _SHARED_STATE
+    if _SHARED_STATE is None:
+        _SHARED_STATE = create_state(SHOPIFY_STATE_URL)
+    return _SHARED_STATE
+
+
+def _edge_scheduler() -> FairScheduler:
+    global _EDGE_SCHEDULER
+    if _EDGE_SCHEDULER is None:
+        _EDGE_SCHEDULER = FairScheduler(
+            global_limit=_edge_limit().limit,
+            shop_limit=SHOPIFY_EDGE_SHOP_CONCURRENCY,
+            max_queue_depth=SHOPIFY_EDGE_QUEUE_DEPTH,
+            max_shop_queue_depth=SHOPIFY_EDGE_SHOP_QUEUE_DEPTH,
+            weights=SHOPIFY_EDGE_SHOP_WEIGHTS,
+        )
+    return _EDGE_SCHEDULER
 
-SUPABASE_FUNCTION_BASE = f"{SUPABASE_URL}/functions/v1"
 
-app = FastAPI(title="Nudio Shopify App")
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+def _edge_limit() -> AIMDLimit:
+    global _EDGE_LIMIT
+    if _EDGE_LIMIT is None:
+        _EDGE_LIMIT = AIMDLimit(
+            initial_limit=SHOPIFY_EDGE_INITIAL_CONCURRENCY,
+            min_limit=SHOPIFY_EDGE_MIN_CONCURRENCY,
+            max_limit=SHOPIFY_EDGE_MAX_CONCURRENCY,
+            latency_tolerance=SHOPIFY_EDGE_LATENCY_TOLERANCE,
+        )
+    return _EDGE_LIMIT
 
-register_heif_opener()
-MAX_HEIC_BYTES = 20 * 1024 * 1024
 
-build_dir = Path(SHOPIFY_FRONTEND_BUILD_DIR)
-static_dir = build_dir / "static"
-if static_dir.exists():
-    app.mount("/shopify/app/static", StaticFiles(directory=static_dir), name="shopify_static")
+def _catalog_index() -> CatalogIndex:
+    global _CATALOG_INDEX
+    if _CATALOG_INDEX is None:
+        _CATALOG_INDEX = CatalogIndex(SHOPIFY_CATALOG_INDEX_PATH)
+    return _CATALOG_INDEX
+
+
+def _catalog_exporter() -> CatalogExporter:
+    global _CATALOG_EXPORTER
+    if _CATALOG_EXPORTER is None:
+        _CATALOG_EXPORTER = CatalogExporter(_catalog_index(), _shopify_graphql, _shop_access_token)
+    return _CATALOG_EXPORTER
+
+
+def _result_store() -> ObjectStore:
+    global _RESULT_STORE
+    if _RESULT_STORE is None:
+        _RESULT_STORE = create_store(
+            SHOPIFY_RESULT_STORE_URL,
+            base_url=f"{_shopify_app_origin()}/shopify/results",
+            secret=SHOPIFY_RESULT_URL_SECRET,
+        )
+    return _RESULT_STORE
+
+
+def _pil_image():
+    """Return ``PIL.Image`` with the HEIF opener registered, importing both on first use."""
+    global _HEIF_OPENER_REGISTERED
+    from PIL import Image
+
+    if not _HEIF_OPENER_REGISTERED:
+        from pillow_heif import register_heif_opener
+
+        register_heif_opener()
+        _HEIF_OPENER_REGISTERED = True
+    return Image
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # Fail the deploy at startup rather than on import, so tooling can import the module without credentials.
+    missing = app.state.settings.missing_required()
+    if missing:
+        raise RuntimeError(f"Missing {' or '.join(missing)}")
+    _apply_settings(app.state.settings)
+    consumer = WebhookConsumer(_webhook_queue(), _process_webhook_delivery)
+    app.state.webhook_consumer = consumer
+    consumer.start()
+    exporter = _catalog_exporter()
+    resumed = await asyncio.to_thread(exporter.resume)
+    if resumed:
+        logging.info("catalog_exports_resumed count=%s", resumed)
+    try:
+        yield
+    finally:
+        await consumer.stop()
+        await exporter.close()
+
+
+router = APIRouter()
+
+MAX_HEIC_BYTES = 20 * 1024 * 1024
 
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "shopify_http_request_duration_seconds",
+    "Latency of requests served by the Shopify app, by route template.",
+    ("method", "route", "status"),
+)
+HTTP_REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "shopify_http_requests_in_flight",
+    "Requests currently being served, by route template.",
+    ("method", "route"),
+)
+UPSTREAM_REQUEST_SECONDS = REGISTRY.histogram(
+    "shopify_upstream_request_duration_seconds",
+    "Latency of outbound calls, by upstream target and response status.",
+    ("target", "status"),
+)
+UPSTREAM_RETRIES = REGISTRY.counter(
+    "shopify_upstream_retries_total",
+    "Retries issued against an upstream after a transient status.",
+    ("target", "status"),
+)
+UPSTREAM_THROTTLED = REGISTRY.counter(
+    "shopify_upstream_throttled_total",
+    "Upstream responses that signalled throttling (HTTP 429 or GraphQL THROTTLED).",
+    ("target",),
+)
+IMAGE_BYTES = REGISTRY.histogram(
+    "shopify_image_bytes",
+    "Size of images received from clients or fetched from the Shopify CDN.",
+    ("source",),
+    buckets=BYTES_BUCKETS,
+)
 
-@app.middleware("http")
 async def require_shopify_session_token(request: Request, call_next):
     # NOTE: Raising HTTPException from Starlette/FastAPI middleware is handled by
     # ServerErrorMiddleware (500) instead of FastAPI's exception handlers.
@@ -89,6 +287,9 @@ async def require_shopify_session_token(request: Request, call_next):
             "/shopify/oauth/callback",
             "/shopify/app",
             "/shopify/health",
+            "/shopify/metrics",
+            # <img> tags cannot send a session token; thumbnail URLs are HMAC-signed instead.
+            "/shopify/images/thumb",
             "/shopify/webhooks/compliance",
             "/shopify/webhooks/app/uninstalled",
             "/shopify/webhooks/customers/data_request",
@@ -99,7 +300,7 @@ async def require_shopify_session_token(request: Request, call_next):
             "/shopify/webhooks/customers_data_request",
             "/shopify/webhooks/shop_redact",
         )
-        if path.startswith("/shopify/app") or path in public_paths:
+        if path.startswith(("/shopify/app", "/shopify/debug/profiles/", "/shopify/results/")) or path in public_paths:
             return await call_next(request)
         if not path.startswith("/shopify/"):
             return await call_next(request)
@@ -130,15 +331,18 @@ async def require_shopify_session_token(request: Request, call_next):
         return JSONResponse(status_code=500, content={"detail": "Internal Server Error"})
 
 
-@app.middleware("http")
 async def add_shopify_csp(request: Request, call_next):
     response = await call_next(request)
     shop = request.query_params.get("shop", "")
     if not _is_valid_shop_domain(shop):
         host_param = request.query_params.get("host", "")
         host_shop = _shop_from_host_param(host_param)
+        # The auth middleware already verified the session token for API routes.
+        verified_shop = getattr(request.state, "shop", "") or ""
         if _is_valid_shop_domain(host_shop):
             shop = host_shop
+        elif _is_valid_shop_domain(verified_shop):
+            shop = verified_shop
         else:
             auth_header = request.headers.get("authorization", "")
             if auth_header.startswith("Bearer "):
@@ -158,6 +362,135 @@ async def add_shopify_csp(request: Request, call_next):
     return response
 
 
+_SERVER_TIMINGS: contextvars.ContextVar[dict[str, float] | None] = contextvars.ContextVar(
+    "shopify_server_timings", default=None
+)
+_PROFILE_LOCK = threading.Lock()
+
+
+async def record_request_timings(request: Request, call_next):
+    route = _route_template(request)
+    method = request.method
+    status = "500"
+    timings: dict[str, float] = {}
+    _SERVER_TIMINGS.set(timings)
+    profiler = _start_request_profile(request)
+    started = time.perf_counter()
+    HTTP_REQUESTS_IN_FLIGHT.inc(method=method, route=route)
+    try:
+        response = await call_next(request)
+        status = str(response.status_code)
+    finally:
+        elapsed = time.perf_counter() - started
+        HTTP_REQUESTS_IN_FLIGHT.dec(method=method, route=route)
+        HTTP_REQUEST_SECONDS.observe(elapsed, method=method, route=route, status=status)
+        profile_id = _finish_request_profile(profiler) if profiler is not None else None
+    response.headers["Server-Timing"] = _format_server_timing(timings, elapsed)
+    if profile_id:
+        response.headers["X-Nudio-Profile-Id"] = profile_id
+    return response
+
+
+def _route_template(request: Request) -> str:
+    # Label by route template, never the raw path, to keep metric cardinality bounded.
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+
+@contextmanager
+def _upstream_call(target: str, phase: str | None = None):
+    """Time an outbound call; callers set ``span["status"]`` once a response arrives.
+
+    The duration is also reported in the ``Server-Timing`` header under ``phase``
+    (or the target name when no phase is given).
+    """
+    span = {"status": "error"}
+    started = time.perf_counter()
+    try:
+        yield span
+    finally:
+        elapsed = time.perf_counter() - started
+        status = str(span["status"])
+        UPSTREAM_REQUEST_SECONDS.observe(elapsed, target=target, status=status)
+        if status == "429":
+            UPSTREAM_THROTTLED.inc(target=target)
+        _record_server_timing(phase or target, elapsed)
+
+
+def _record_server_timing(name: str, seconds: float) -> None:
+    timings = _SERVER_TIMINGS.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+def _format_server_timing(timings: dict[str, float], total_seconds: float) -> str:
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    parts.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ", ".join(parts)
+
+
+# A captured X-Nudio-Profile header must not stay usable: signatures expire, at most this far ahead.
+_PROFILE_SIGNATURE_MAX_SECONDS = 3600
+
+
+def _profile_signature(value: str, expires: int) -> str:
+    """Header value that authorizes profiling ``value`` (a path or profile id) until ``expires``."""
+    message = f"{value}|{expires}".encode("utf-8")
+    digest = hmac.new(SHOPIFY_PROFILE_SECRET.encode("utf-8"), message, hashlib.sha256).hexdigest()
+    return f"{expires}.{digest}"
+
+
+def _has_profile_signature(request: Request, value: str) -> bool:
+    if not SHOPIFY_PROFILE_SECRET:
+        return False
+    provided = request.headers.get("X-Nudio-Profile", "")
+    expires, _, digest = provided.partition(".")
+    if not expires.isdigit() or not digest:
+        return False
+    now = time.time()
+    if not now <= int(expires) <= now + _PROFILE_SIGNATURE_MAX_SECONDS:
+        return False
+    return hmac.compare_digest(provided, _profile_signature(value, int(expires)))
+
+
+def _start_request_profile(request: Request) -> cProfile.Profile | None:
+    if not _has_profile_signature(request, request.url.path):
+        return None
+    # cProfile is per-thread and the event loop is shared, so only one capture runs at a time.
+    if not _PROFILE_LOCK.acquire(blocking=False):
+        logging.info("request_profile_busy path=%s", request.url.path)
+        return None
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def _finish_request_profile(profiler: cProfile.Profile) -> str | None:
+    profiler.disable()
+    try:
+        profile_dir = Path(SHOPIFY_PROFILE_DIR)
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        profile_id = uuid.uuid4().hex
+        profiler.dump_stats(str(profile_dir / f"{profile_id}.prof"))
+        stored = sorted(profile_dir.glob("*.prof"), key=lambda item: item.stat().st_mtime)
+        for stale in stored[: max(0, len(stored) - SHOPIFY_PROFILE_KEEP)]:
+            stale.unlink(missing_ok=True)
+        logging.info("request_profile_stored id=%s", profile_id)
+        return profile_id
+    except OSError as exc:
+        logging.warning("request_profile_store_failed err=%s", exc)
+        return None
+    finally:
+        _PROFILE_LOCK.release()
+
+
+def _estimated_base64_bytes(data: str) -> int:
+    return (len(data) * 3) // 4 - data.count("=")
+
+
 def _is_valid_shop_domain(shop: str) -> bool:
     return bool(shop) and shop.endswith(".myshopify.com") and "/" not in shop
 
@@ -234,22 +567,20 @@ ACTIVE_SUBSCRIPTIONS_QUERY = """
 
 RATE_LIMIT_WINDOW_SECONDS = 60
 RATE_LIMIT_MAX_REQUESTS = 45
-_RATE_LIMIT_BUCKET: dict[str, list[float]] = {}
 
 
 def _rate_limit_key(shop: str, action: str) -> str:
-    return f"{shop}:{action}"
+    return f"ratelimit:{shop}:{action}"
 
 
-def _check_rate_limit(shop: str, action: str) -> None:
-    now = datetime.now(timezone.utc).timestamp()
-    key = _rate_limit_key(shop, action)
-    entries = _RATE_LIMIT_BUCKET.get(key, [])
-    entries = [ts for ts in entries if now - ts <= RATE_LIMIT_WINDOW_SECONDS]
-    if len(entries) >= RATE_LIMIT_MAX_REQUESTS:
+def _rate_limit_allows(shop: str, action: str) -> bool:
+    return _shared_state().hit_window(_rate_limit_key(shop, action), RATE_LIMIT_WINDOW_SECONDS, RATE_LIMIT_MAX_REQUESTS)
+
+
+async def _check_rate_limit(shop: str, action: str) -> None:
+    # The SQLite backend takes a write transaction per hit; keep it off the event loop.
+    if not await asyncio.to_thread(_rate_limit_allows, shop, action):
         raise HTTPException(status_code=429, detail="Rate limit exceeded.")
-    entries.append(now)
-    _RATE_LIMIT_BUCKET[key] = entries
 
 
 def _base64_host(shop: str) -> str:
@@ -261,39 +592,53 @@ def _base64_host(shop: str) -> str:
     return base64.b64encode(raw).decode("utf-8")
 
 
+def _shopify_admin_base(shop: str) -> str:
+    if SHOPIFY_ADMIN_BASE_URL:
+        return f"{SHOPIFY_ADMIN_BASE_URL}/{shop}"
+    return f"https://{shop}"
+
+
 async def _exchange_token(shop: str, code: str) -> dict:
-    url = f"https://{shop}/admin/oauth/access_token"
+    url = f"{_shopify_admin_base(shop)}/admin/oauth/access_token"
     payload = {
         "client_id": SHOPIFY_API_KEY,
         "client_secret": SHOPIFY_API_SECRET,
         "code": code,
     }
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        response = await client.post(url, json=payload)
-        response.raise_for_status()
-        return response.json()
+    with _upstream_call("shopify_oauth") as span:
+        async with httpx.AsyncClient(timeout=15.0) as client:
+            response = await client.post(url, json=payload)
+            span["status"] = response.status_code
+    response.raise_for_status()
+    return response.json()
 
 
 def _store_shop_token(shop: str, access_token: str, scope: str) -> None:
     now = datetime.now(timezone.utc).isoformat()
-    supabase.table(SHOPIFY_SHOPS_TABLE).upsert(
-        {
-            "shop_domain": shop,
-            "access_token": access_token,
-            "scope": scope,
-            "installed_at": now,
-            "updated_at": now,
-        },
-        on_conflict="shop_domain",
-    ).execute()
+    with _upstream_call("supabase_postgrest", phase="shop_store") as span:
+        _supabase().table(SHOPIFY_SHOPS_TABLE).upsert(
+            {
+                "shop_domain": shop,
+                "access_token": access_token,
+                "scope": scope,
+                "installed_at": now,
+                "updated_at": now,
+            },
+            on_conflict="shop_domain",
+        ).execute()
+        span["status"] = 200
 
 
 def _delete_shop_record(shop: str) -> None:
-    supabase.table(SHOPIFY_SHOPS_TABLE).delete().eq("shop_domain", shop).execute()
+    with _upstream_call("supabase_postgrest", phase="shop_delete") as span:
+        _supabase().table(SHOPIFY_SHOPS_TABLE).delete().eq("shop_domain", shop).execute()
+        span["status"] = 200
 
 
 def _get_shop_record(shop: str, host: str | None = None) -> dict:
-    result = supabase.table(SHOPIFY_SHOPS_TABLE).select("*").eq("shop_domain", shop).limit(1).execute()
+    with _upstream_call("supabase_postgrest", phase="shop_lookup") as span:
+        result = _supabase().table(SHOPIFY_SHOPS_TABLE).select("*").eq("shop_domain", shop).limit(1).execute()
+        span["status"] = 200
     data = result.data[0] if result.data else None
     if not data:
         raise HTTPException(
@@ -306,6 +651,11 @@ def _get_shop_record(shop: str, host: str | None = None) -> dict:
     return data
 
 
+async def _shop_access_token(shop: str) -> str:
+    record = await asyncio.to_thread(_get_shop_record, shop)
+    return record["access_token"]
+
+
 def _shopify_install_url(shop: str, host: str | None = None) -> str:
     if not SHOPIFY_API_KEY or not SHOPIFY_API_SECRET:
         return ""
@@ -382,7 +732,7 @@ def _shopify_admin_app_url(shop: str) -> str:
 
 
 async def _shopify_active_subscriptions(shop: str, access_token: str) -> list[dict]:
-    data = await _shopify_graphql(shop, access_token, ACTIVE_SUBSCRIPTIONS_QUERY)
+    data = await _shopify_graphql(shop, access_token, ACTIVE_SUBSCRIPTIONS_QUERY, phase="subscriptions")
     return data.get("data", {}).get("currentAppInstallation", {}).get("activeSubscriptions", [])
 
 
@@ -422,7 +772,7 @@ async def _create_usage_record(
         "description": description,
         "amount": {"amount": amount, "currencyCode": "USD"},
     }
-    created = await _shopify_graphql(shop, access_token, mutation, variables)
+    created = await _shopify_graphql(shop, access_token, mutation, variables, phase="billing")
     payload = created.get("data", {}).get("appUsageRecordCreate", {})
     if payload.get("userErrors"):
         raise HTTPException(status_code=400, detail=payload["userErrors"])
@@ -450,16 +800,24 @@ def _verify_oauth_state(state: str, shop: str) -> bool:
     return payload.get("shop") == shop
 
 
-async def _shopify_graphql(shop: str, access_token: str, query: str, variables: dict | None = None) -> dict:
-    url = f"https://{shop}/admin/api/{SHOPIFY_ADMIN_API_VERSION}/graphql.json"
+async def _shopify_graphql(
+    shop: str,
+    access_token: str,
+    query: str,
+    variables: dict | None = None,
+    phase: str | None = None,
+) -> dict:
+    url = f"{_shopify_admin_base(shop)}/admin/api/{SHOPIFY_ADMIN_API_VERSION}/graphql.json"
     payload = {"query": query, "variables": variables or {}}
     headers = {
         "X-Shopify-Access-Token": access_token,
         "Content-Type": "application/json",
     }
     try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            response = await client.post(url, json=payload, headers=headers)
+        with _upstream_call("shopify_graphql", phase=phase) as span:
+            async with httpx.AsyncClient(timeout=20.0) as client:
+                response = await client.post(url, json=payload, headers=headers)
+            span["status"] = response.status_code
     except httpx.RequestError as exc:
         logging.warning("shopify_graphql_request_error shop=%s err=%s", shop, exc)
         raise HTTPException(status_code=502, detail="Shopify API request failed.") from exc
@@ -478,21 +836,34 @@ async def _shopify_graphql(shop: str, access_token: str, query: str, variables:
             detail={"error": "shopify_api_error", "status": response.status_code},
         )
 
-    return response.json()
+    data = response.json()
+    if _is_graphql_throttled(data):
+        UPSTREAM_THROTTLED.inc(target="shopify_graphql")
+    return data
+
+
+def _is_graphql_throttled(data: dict) -> bool:
+    # Shopify reports GraphQL cost throttling as a 200 with a THROTTLED error code.
+    for error in (data or {}).get("errors") or []:
+        if isinstance(error, dict) and (error.get("extensions") or {}).get("code") == "THROTTLED":
+            return True
+    return False
 
 
 async def _shopify_rest(shop: str, access_token: str, method: str, path: str, payload: dict) -> dict:
-    url = f"https://{shop}/admin/api/{SHOPIFY_ADMIN_API_VERSION}/{path.lstrip('/')}"
+    url = f"{_shopify_admin_base(shop)}/admin/api/{SHOPIFY_ADMIN_API_VERSION}/{path.lstrip('/')}"
     headers = {
         "X-Shopify-Access-Token": access_token,
         "Content-Type": "application/json",
     }
     try:
-        async with httpx.AsyncClient(timeout=20.0) as client:
-            if method.upper() == "GET":
-                response = await client.request(method, url, params=payload, headers=headers)
-            else:
-                response = await client.request(method, url, json=payload, headers=headers)
+        with _upstream_call("shopify_rest") as span:
+            async with httpx.AsyncClient(timeout=20.0) as client:
+                if method.upper() == "GET":
+                    response = await client.request(method, url, params=payload, headers=headers)
+                else:
+                    response = await client.request(method, url, json=payload, headers=headers)
+            span["status"] = response.status_code
     except httpx.RequestError as exc:
         logging.warning("shopify_rest_request_error shop=%s method=%s path=%s err=%s", shop, method, path, exc)
         raise HTTPException(status_code=502, detail="Shopify API request failed.") from exc
@@ -548,6 +919,7 @@ async def _shopify_rest_with_retry(
             if status not in (429, 500, 502, 503, 504) or attempt >= retries:
                 raise
             delay = base_delay * (2 ** attempt)
+            UPSTREAM_RETRIES.inc(target="shopify_rest", status=str(status))
             logging.warning("shopify_retry shop=%s status=%s delay=%.2f", shop, status, delay)
             await asyncio.sleep(delay)
             attempt += 1
@@ -661,6 +1033,20 @@ class ImageUploadRequest(BaseModel):
     filename: str | None = None
 
 
+class BatchImageUpload(BaseModel):
+    product_id: str
+    image_base64: str
+    filename: str | None = None
+    alt: str | None = None
+    # 1-based position in the product's media; make_primary is shorthand for position 1.
+    position: int | None = None
+    make_primary: bool = False
+
+
+class BatchImageUploadRequest(BaseModel):
+    images: list[BatchImageUpload]
+
+
 class ShopifyOptimizeRequest(BaseModel):
     imageBase64: str
     mode: str = "image"
@@ -741,20 +1127,20 @@ def _resolve_build_asset(path_fragment: str) -> Path | None:
     return candidate
 
 
-@app.api_route("/shopify/app", methods=["GET", "HEAD"])
+@router.api_route("/shopify/app", methods=["GET", "HEAD"])
 async def shopify_app_root(request: Request):
     if request.method == "HEAD":
         return Response(status_code=200)
     return _render_shopify_index()
 
-@app.api_route("/", methods=["GET", "HEAD"])
+@router.api_route("/", methods=["GET", "HEAD"])
 async def shopify_root(request: Request):
     if request.method == "HEAD":
         return Response(status_code=200)
     return _render_shopify_index()
 
 
-@app.get("/shopify/app/{full_path:path}")
+@router.get("/shopify/app/{full_path:path}")
 async def shopify_app_catchall(full_path: str):
     index_path = _frontend_index_path()
     if not index_path.exists():
@@ -765,7 +1151,7 @@ async def shopify_app_catchall(full_path: str):
     return _render_shopify_index()
 
 
-@app.get("/shopify/install")
+@router.get("/shopify/install")
 async def shopify_install(shop: str, host: str | None = None):
     if not SHOPIFY_API_KEY or not SHOPIFY_API_SECRET:
         raise HTTPException(status_code=500, detail="Missing Shopify API config.")
@@ -792,7 +1178,7 @@ async def shopify_install(shop: str, host: str | None = None):
     return response
 
 
-@app.get("/shopify/oauth/callback")
+@router.get("/shopify/oauth/callback")
 async def shopify_oauth_callback(request: Request, shop: str, code: str, state: str, host: str | None = None):
     if not SHOPIFY_API_KEY or not SHOPIFY_API_SECRET:
         raise HTTPException(status_code=500, detail="Missing Shopify API config.")
@@ -846,7 +1232,7 @@ async def shopify_oauth_callback(request: Request, shop: str, code: str, state:
     return response
 
 
-@app.get("/shopify/billing/active")
+@router.get("/shopify/billing/active")
 async def shopify_billing_active(request: Request, shop: str | None = None):
     auth_shop = getattr(request.state, "shop", None) or shop
     if not auth_shop:
@@ -857,7 +1243,7 @@ async def shopify_billing_active(request: Request, shop: str | None = None):
     return {"subscriptions": subscriptions}
 
 
-@app.post("/shopify/billing/ensure")
+@router.post("/shopify/billing/ensure")
 async def shopify_billing_ensure(request: Request, shop: str | None = None, host: str | None = None):
     auth_shop = getattr(request.state, "shop", None) or shop
     if not auth_shop:
@@ -911,19 +1297,19 @@ async def shopify_billing_ensure(request: Request, shop: str | None = None, host
         "terms": "8 cents per image, billed through Shopify.",
         "test": SHOPIFY_TEST_BILLING,
     }
-    created = await _shopify_graphql(auth_shop, access_token, mutation, variables)
+    created = await _shopify_graphql(auth_shop, access_token, mutation, variables, phase="billing_subscribe")
     payload = created.get("data", {}).get("appSubscriptionCreate", {})
     if payload.get("userErrors"):
         raise HTTPException(status_code=400, detail=payload["userErrors"])
     return {"active": False, "confirmationUrl": payload.get("confirmationUrl")}
 
 
-@app.post("/shopify/billing/usage")
+@router.post("/shopify/billing/usage")
 async def shopify_billing_usage(request: Request, payload: UsageChargeRequest, shop: str | None = None):
     auth_shop = getattr(request.state, "shop", None) or shop
     if not auth_shop:
         raise HTTPException(status_code=401, detail="Missing shop context.")
-    _check_rate_limit(auth_shop, "billing_usage")
+    await _check_rate_limit(auth_shop, "billing_usage")
     record = _get_shop_record(auth_shop, request.query_params.get("host"))
     access_token = record["access_token"]
     if abs(payload.price - SHOPIFY_USAGE_PRICE_USD) > 1e-6:
@@ -947,7 +1333,7 @@ async def shopify_billing_usage(request: Request, payload: UsageChargeRequest, s
     return {"ok": True, "usageRecordId": usage_record_id}
 
 
-@app.post("/shopify/products/{product_id}/images")
+@router.post("/shopify/products/{product_id}/images")
 async def shopify_product_image_upload(
     product_id: str,
     request: Request,
@@ -958,7 +1344,7 @@ async def shopify_product_image_upload(
     auth_shop = getattr(request.state, "shop", None) or shop
     if not auth_shop:
         raise HTTPException(status_code=401, detail="Missing shop context.")
-    _check_rate_limit(auth_shop, "product_upload")
+    await _check_rate_limit(auth_shop, "product_upload")
     record = _get_shop_record(auth_shop, request.query_params.get("host"))
     access_token = record["access_token"]
     image_base64 = payload.image_base64
@@ -967,7 +1353,8 @@ async def shopify_product_image_upload(
         raise HTTPException(status_code=400, detail="Missing image_base64.")
 
     attachment = _extract_base64(image_base64)
-    estimated_bytes = (len(attachment) * 3) // 4 - attachment.count("=")
+    estimated_bytes = _estimated_base64_bytes(attachment)
+    IMAGE_BYTES.observe(estimated_bytes, source="product_upload")
     if estimated_bytes > 10 * 1024 * 1024:
         raise HTTPException(status_code=413, detail="Image exceeds 10MB limit.")
     payload = {"image": {"attachment": attachment}}
@@ -998,19 +1385,297 @@ async def shopify_product_image_upload(
     return response
 
 
-@app.post("/shopify/optimize-listing")
-async def shopify_optimize_listing(request: Request, payload: ShopifyOptimizeRequest):
+MAX_BATCH_IMAGES = 25
+STAGED_UPLOAD_CONCURRENCY = 4
+
+STAGED_UPLOADS_CREATE_MUTATION = """
+  mutation StagedUploadsCreate($input: [StagedUploadInput!]!) {
+    stagedUploadsCreate(input: $input) {
+      stagedTargets {
+        url
+        resourceUrl
+        parameters {
+          name
+          value
+        }
+      }
+      userErrors {
+        field
+        message
+      }
+    }
+  }
+"""
+
+PRODUCT_CREATE_MEDIA_MUTATION = """
+  mutation ProductCreateMedia($productId: ID!, $media: [CreateMediaInput!]!) {
+    productCreateMedia(productId: $productId, media: $media) {
+      media {
+        ... on MediaImage {
+          id
+        }
+        status
+      }
+      mediaUserErrors {
+        field
+        message
+        code
+      }
+    }
+  }
+"""
+
+PRODUCT_REORDER_MEDIA_MUTATION = """
+  mutation ProductReorderMedia($id: ID!, $moves: [MoveInput!]!) {
+    productReorderMedia(id: $id, moves: $moves) {
+      job {
+        id
+      }
+      mediaUserErrors {
+        field
+        message
+      }
+    }
+  }
+"""
+
+
+def _product_gid(product_id: str) -> str:
+    if product_id.startswith("gid://"):
+        return product_id
+    return f"gid://shopify/Product/{product_id}"
+
+
+def _sniff_image_mime(data: bytes, data_url: str = "") -> str:
+    match = re.match(r"data:(image/[a-zA-Z0-9.+-]+);base64,", data_url)
+    if match:
+        return match.group(1)
+    if data.startswith(b"\x89PNG"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    return "image/png"
+
+
+async def _staged_upload(client: httpx.AsyncClient, target: dict, filename: str, mime: str, data: bytes) -> None:
+    fields = {param["name"]: param["value"] for param in target.get("parameters") or []}
+    with _upstream_call("shopify_staged_upload", phase="media_upload") as span:
+        response = await client.post(target["url"], data=fields, files={"file": (filename, data, mime)})
+        span["status"] = response.status_code
+    if response.status_code >= 400:
+        raise HTTPException(status_code=502, detail={"error": "staged_upload_failed", "status": response.status_code})
+
+
+async def _create_product_media(
+    shop: str,
+    access_token: str,
+    product_id: str,
+    items: list[tuple[int, dict]],
+    results: list[dict],
+) -> None:
+    """Attach staged uploads to one product and apply requested positions with a single reorder."""
+    media_input = []
+    for _, staged in items:
+        media = {"originalSource": staged["resource_url"], "mediaContentType": "IMAGE"}
+        if staged["alt"]:
+            media["alt"] = staged["alt"]
+        media_input.append(media)
+    try:
+        created = await _shopify_graphql(
+            shop,
+            access_token,
+            PRODUCT_CREATE_MEDIA_MUTATION,
+            {"productId": _product_gid(product_id), "media": media_input},
+            phase="media_create",
+        )
+    except HTTPException as exc:
+        for index, _ in items:
+            results[index].update(ok=False, error=exc.detail)
+        return
+    payload = (created.get("data") or {}).get("productCreateMedia") or {}
+    media = payload.get("media") or []
+    failed_inputs: dict[int, str] = {}
+    for error in payload.get("mediaUserErrors") or []:
+        field = error.get("field") or []
+        # field looks like ["media", "<input index>", "originalSource"]; unindexed errors fail every input.
+        if len(field) > 1 and str(field[1]).isdigit():
+            failed_inputs[int(field[1])] = error.get("message", "Media creation failed.")
+        else:
+            failed_inputs.update({position: error.get("message", "Media creation failed.") for position in range(len(items))})
+    moves = []
+    for position, (index, staged) in enumerate(items):
+        if position in failed_inputs or position >= len(media) or not (media[position] or {}).get("id"):
+            results[index].update(ok=False, error=failed_inputs.get(position, "Media creation failed."))
+            continue
+        media_id = media[position]["id"]
+        results[index].update(ok=True, media_id=media_id, status=media[position].get("status"))
+        if staged["position"] is not None:
+            moves.append((staged["position"], index, media_id))
+    if not moves:
+        return
+    # Shopify positions are 0-based strings; apply the lowest requested position first.
+    moves.sort()
+    reorder = [{"id": media_id, "newPosition": str(max(0, position - 1))} for position, _, media_id in moves]
+    try:
+        reordered = await _shopify_graphql(
+            shop,
+            access_token,
+            PRODUCT_REORDER_MEDIA_MUTATION,
+            {"id": _product_gid(product_id), "moves": reorder},
+            phase="media_reorder",
+        )
+        errors = ((reordered.get("data") or {}).get("productReorderMedia") or {}).get("mediaUserErrors") or []
+    except HTTPException as exc:
+        errors = [exc.detail]
+    if errors:
+        logging.warning("product_media_reorder_failed shop=%s product_id=%s errors=%s", shop, product_id, errors)
+    for _, index, _ in moves:
+        results[index]["reordered"] = not errors
+
+
+@router.post("/shopify/products/images/batch")
+async def shopify_product_images_batch(request: Request, payload: BatchImageUploadRequest, shop: str | None = None):
+    """Upload several images to one or more products with GraphQL media mutations.
+
+    One ``stagedUploadsCreate`` covers the whole batch, the files go straight to
+    Shopify's staged storage in parallel, then each product gets one
+    ``productCreateMedia`` and, when positions were requested, one
+    ``productReorderMedia``. Results are reported per image, in request order.
+    """
+    auth_shop = getattr(request.state, "shop", None) or shop
+    if not auth_shop:
+        raise HTTPException(status_code=401, detail="Missing shop context.")
+    if not payload.images:
+        raise HTTPException(status_code=400, detail="No images provided.")
+    if len(payload.images) > MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_IMAGES} images per batch.")
+    await _check_rate_limit(auth_shop, "product_upload_batch")
+    record = _get_shop_record(auth_shop, request.query_params.get("host"))
+    access_token = record["access_token"]
+
+    results = [{"index": index, "product_id": image.product_id, "ok": False} for index, image in enumerate(payload.images)]
+    decoded: dict[int, dict] = {}
+    for index, image in enumerate(payload.images):
+        attachment = _extract_base64(image.image_base64)
+        estimated_bytes = _estimated_base64_bytes(attachment)
+        IMAGE_BYTES.observe(estimated_bytes, source="product_upload")
+        if not attachment:
+            results[index]["error"] = "Missing image_base64."
+            continue
+        if estimated_bytes > 10 * 1024 * 1024:
+            results[index]["error"] = "Image exceeds 10MB limit."
+            continue
+        try:
+            data = base64.b64decode(attachment, validate=False)
+        except ValueError:
+            results[index]["error"] = "Invalid base64 image."
+            continue
+        mime = _sniff_image_mime(data, image.image_base64)
+        extension = mime.split("/", 1)[1].replace("jpeg", "jpg")
+        decoded[index] = {
+            "data": data,
+            "mime": mime,
+            "filename": image.filename or f"nudio-{index + 1}.{extension}",
+            "alt": image.alt,
+            "position": 1 if image.make_primary else image.position,
+        }
+
+    if decoded:
+        staged_input = [
+            {
+                "resource": "IMAGE",
+                "filename": item["filename"],
+                "mimeType": item["mime"],
+                "httpMethod": "POST",
+                "fileSize": str(len(item["data"])),
+            }
+            for item in decoded.values()
+        ]
+        staged = await _shopify_graphql(
+            auth_shop, access_token, STAGED_UPLOADS_CREATE_MUTATION, {"input": staged_input}, phase="media_stage"
+        )
+        staged_payload = (staged.get("data") or {}).get("stagedUploadsCreate") or {}
+        if staged_payload.get("userErrors"):
+            raise HTTPException(status_code=400, detail=staged_payload["userErrors"])
+        targets = staged_payload.get("stagedTargets") or []
+        if len(targets) != len(decoded):
+            raise HTTPException(status_code=502, detail={"error": "staged_upload_mismatch"})
+
+        semaphore = asyncio.Semaphore(STAGED_UPLOAD_CONCURRENCY)
+
+        async def upload(index: int, target: dict) -> None:
+            item = decoded[index]
+            async with semaphore:
+                try:
+                    await _staged_upload(client, target, item["filename"], item["mime"], item["data"])
+                except (HTTPException, httpx.RequestError) as exc:
+                    results[index]["error"] = exc.detail if isinstance(exc, HTTPException) else "Staged upload failed."
+                    decoded[index]["failed"] = True
+                    return
+            item["resource_url"] = target["resourceUrl"]
+
+        async with httpx.AsyncClient(timeout=60.0) as client:
+            await asyncio.gather(*(upload(index, target) for index, target in zip(list(decoded), targets)))
+
+        by_product: dict[str, list[tuple[int, dict]]] = {}
+        for index, item in decoded.items():
+            if not item.get("failed"):
+                by_product.setdefault(payload.images[index].product_id, []).append((index, item))
+        await asyncio.gather(
+            *(
+                _create_product_media(auth_shop, access_token, product_id, items, results)
+                for product_id, items in by_product.items()
+            )
+        )
+
+    succeeded = sum(1 for result in results if result["ok"])
+    logging.info(
+        "product_upload_batch shop=%s images=%s succeeded=%s products=%s",
+        auth_shop,
+        len(results),
+        succeeded,
+        len({image.product_id for image in payload.images}),
+    )
+    return {"results": results, "succeeded": succeeded, "failed": len(results) - succeeded}
+
+
+@router.post("/shopify/optimize-listing")
+async def shopify_optimize_listing(
+    request: Request, payload: ShopifyOptimizeRequest, stream: bool = False, delivery: str = "inline"
+):
+    """Run the optimize-listing edge function for the shop and bill one usage charge.
+
+    The edge function call starts right away, concurrently with the shop
+    lookup and subscription check; if the shop turns out not to be eligible
+    the call is cancelled and nothing is billed or returned. Calls go through
+    the per-shop fair queue; when its backlog is full the request is shed
+    with a 503 and ``Retry-After`` before any upstream work starts.
+
+    With ``stream=true`` the edge function's body is relayed to the client as
+    it arrives instead of being parsed and re-encoded. The charge is then
+    created only after the last byte has been relayed, so a body cut off by
+    the upstream or by the client is never billed. The usage record id is
+    logged rather than returned: the headers are already sent, the relayed
+    body (possibly compressed) is passed through untouched, and the ASGI
+    servers we run on do not send HTTP trailers.
+
+    With ``delivery=url`` the result image is written to the result store and
+    returned as a signed ``imageUrl`` instead of an inline data URL; it is
+    rejected with a 400 unless ``SHOPIFY_RESULT_URL_SECRET`` is configured.
+    """
     auth_shop = getattr(request.state, "shop", None)
     if not auth_shop:
         raise HTTPException(status_code=401, detail="Missing shop context.")
+    if delivery == "url" and not SHOPIFY_RESULT_URL_SECRET:
+        raise HTTPException(
+            status_code=400, detail="delivery=url is not available: SHOPIFY_RESULT_URL_SECRET is not configured."
+        )
     if not SUPABASE_FUNCTION_BASE or not SUPABASE_SERVICE_KEY:
         raise HTTPException(status_code=500, detail="Missing Supabase configuration.")
-    record = _get_shop_record(auth_shop, request.query_params.get("host"))
-    access_token = record["access_token"]
-    subscriptions = await _shopify_active_subscriptions(auth_shop, access_token)
-    usage_line_item_id = _extract_usage_line_item_id(subscriptions)
-    if not usage_line_item_id:
-        raise HTTPException(status_code=402, detail="Active billing subscription required.")
 
     headers = {
         "Content-Type": "application/json",
@@ -1021,46 +1686,207 @@ async def shopify_optimize_listing(request: Request, payload: ShopifyOptimizeReq
     body = payload.dict(exclude_none=True)
     if not body.get("userEmail"):
         body["userEmail"] = f"shopify+{auth_shop}@nudio.ai"
-    timeout = httpx.Timeout(180.0, connect=10.0)
-    async with httpx.AsyncClient(timeout=timeout) as client:
+    IMAGE_BYTES.observe(_estimated_base64_bytes(_extract_base64(payload.imageBase64)), source="optimize_input")
+
+    try:
+        admission = _edge_scheduler().admit(auth_shop)
+    except Overloaded as exc:
+        logging.warning(
+            "optimize_listing_shed shop=%s reason=%s retry_after=%s", auth_shop, exc.reason, exc.retry_after
+        )
+        raise HTTPException(
+            status_code=503,
+            detail={"error": "edge_function_busy", "reason": exc.reason},
+            headers={"Retry-After": str(exc.retry_after)},
+        ) from exc
+
+    client = httpx.AsyncClient(timeout=httpx.Timeout(SHOPIFY_EDGE_TIMEOUT_SECONDS, connect=10.0))
+    edge_task = asyncio.create_task(_send_optimize_request(client, admission, headers, body, stream))
+    response: httpx.Response | None = None
+    relaying = False
+    try:
         try:
-            response = await client.post(
-                f"{SUPABASE_FUNCTION_BASE}/optimize-listing",
-                headers=headers,
-                json=body,
+            access_token, usage_line_item_id = await _optimize_eligibility(
+                auth_shop, request.query_params.get("host")
             )
-        except httpx.ReadTimeout:
-            raise HTTPException(
-                status_code=504,
-                detail="Processing timed out. Please try again.",
+        except BaseException:
+            edge_task.cancel()
+            raise
+        response = await edge_task
+        if response.status_code >= 400:
+            await response.aread()
+            detail = _upstream_error_detail(response)
+            logging.warning(
+                "optimize_listing_failed shop=%s status=%s detail=%s",
+                auth_shop,
+                response.status_code,
+                detail,
             )
-    if response.status_code >= 400:
-        try:
-            detail = response.json()
-        except Exception:
-            detail = response.text
-        logging.warning(
-            "optimize_listing_failed shop=%s status=%s detail=%s",
-            auth_shop,
-            response.status_code,
-            detail,
-        )
-        raise HTTPException(status_code=response.status_code, detail=detail)
-    result = response.json()
+            raise HTTPException(status_code=response.status_code, detail=detail)
+        if stream:
+            relaying = True
+            return _relay_optimize_response(
+                client, response, lambda: _bill_optimize_listing(auth_shop, access_token, usage_line_item_id, stream)
+            )
+        result = response.json()
+        usage_record_id = await _bill_optimize_listing(auth_shop, access_token, usage_line_item_id, stream)
+    finally:
+        if not relaying:
+            # Collects the edge task's outcome even when it was cancelled or failed first.
+            (outcome,) = await asyncio.gather(edge_task, return_exceptions=True)
+            # Leaves the queue if the task was cancelled before it could take its slot.
+            admission.close()
+            if isinstance(outcome, httpx.Response):
+                await outcome.aclose()
+            await client.aclose()
+    if isinstance(result, dict):
+        result["usageRecordId"] = usage_record_id
+        if delivery == "url" and str(result.get("image") or "").startswith("data:"):
+            result["imageUrl"] = await asyncio.to_thread(_store_result_image, result.pop("image"))
+    return result
+
+
+async def _bill_optimize_listing(shop: str, access_token: str, usage_line_item_id: str, stream: bool) -> str | None:
     usage_record_id = await _create_usage_record(
-        auth_shop,
+        shop,
         access_token,
         usage_line_item_id,
         description=SHOPIFY_USAGE_DESCRIPTION,
         amount=SHOPIFY_USAGE_PRICE_USD,
     )
-    logging.info("optimize_listing_billed shop=%s usage_id=%s amount=%.2f", auth_shop, usage_record_id, SHOPIFY_USAGE_PRICE_USD)
-    if isinstance(result, dict):
-        result["usageRecordId"] = usage_record_id
-    return result
+    logging.info(
+        "optimize_listing_billed shop=%s usage_id=%s amount=%.2f stream=%s",
+        shop,
+        usage_record_id,
+        SHOPIFY_USAGE_PRICE_USD,
+        str(stream).lower(),
+    )
+    return usage_record_id
+
+
+def _store_result_image(data_url: str) -> str:
+    data, content_type = decode_data_url(data_url)
+    stored = _result_store().put(data, content_type)
+    return _result_store().signed_url(stored.key, SHOPIFY_RESULT_URL_TTL)
+
+
+async def _optimize_eligibility(shop: str, host: str | None) -> tuple[str, str]:
+    """Return the shop's access token and usage line item, or raise 401/402."""
+    record = await asyncio.to_thread(_get_shop_record, shop, host)
+    access_token = record["access_token"]
+    subscriptions = await _shopify_active_subscriptions(shop, access_token)
+    usage_line_item_id = _extract_usage_line_item_id(subscriptions)
+    if not usage_line_item_id:
+        raise HTTPException(status_code=402, detail="Active billing subscription required.")
+    return access_token, usage_line_item_id
+
+
+async def _send_optimize_request(
+    client: httpx.AsyncClient,
+    admission: Admission,
+    headers: dict,
+    body: dict,
+    stream: bool,
+) -> httpx.Response:
+    # The slot is held until the upstream responds; in streaming mode that is when its headers arrive.
+    async with admission:
+        _record_server_timing("edge_queue", admission.granted_at - admission.enqueued_at)
+        started = time.perf_counter()
+        dropped: bool | None = None
+        try:
+            response = await _post_optimize_listing(client, headers, body, stream)
+            dropped = response.status_code in _EDGE_OVERLOAD_STATUSES
+            # Only full generations time the same work: a fast 4xx or a streamed response's headers
+            # would drag the latency baseline down and make every normal call look congested.
+            if not dropped and (stream or not response.is_success):
+                dropped = None
+            return response
+        except Exception:
+            # Timeouts and connection failures; a cancelled call says nothing about the upstream.
+            dropped = True
+            raise
+        finally:
+            if dropped is not None:
+                _record_edge_sample(time.perf_counter() - started, dropped)
 
 
-@app.post("/shopify/convert-heic")
+# Upstream statuses that mean the edge function (or Gemini behind it) is overloaded.
+_EDGE_OVERLOAD_STATUSES = (429, 502, 503, 504, 546)
+
+
+def _record_edge_sample(latency: float, dropped: bool) -> None:
+    scheduler = _edge_scheduler()
+    limit = _edge_limit().on_sample(latency, dropped, scheduler.in_flight)
+    if limit != scheduler.global_limit:
+        logging.info("edge_limit_changed limit=%s latency=%.2f dropped=%s", limit, latency, dropped)
+        scheduler.set_global_limit(limit)
+
+
+async def _post_optimize_listing(client: httpx.AsyncClient, headers: dict, body: dict, stream: bool) -> httpx.Response:
+    with _upstream_call("optimize_listing", phase="edge_function") as span:
+        try:
+            response = await client.send(
+                client.build_request("POST", f"{SUPABASE_FUNCTION_BASE}/optimize-listing", headers=headers, json=body),
+                stream=stream,
+            )
+        except httpx.ReadTimeout:
+            span["status"] = "timeout"
+            raise HTTPException(
+                status_code=504,
+                detail="Processing timed out. Please try again.",
+            )
+        except asyncio.CancelledError:
+            span["status"] = "cancelled"
+            raise
+        span["status"] = response.status_code
+    return response
+
+
+# Upstream headers that describe the body bytes and are relayed unchanged in streaming mode.
+_RELAYED_BODY_HEADERS = ("content-type", "content-length", "content-encoding")
+
+
+def _upstream_error_detail(response: httpx.Response):
+    try:
+        return response.json()
+    except Exception:
+        return response.text
+
+
+def _relay_optimize_response(
+    client: httpx.AsyncClient,
+    response: httpx.Response,
+    bill: Callable[[], Awaitable[str | None]],
+) -> StreamingResponse:
+    async def close():
+        # Both are idempotent: the relay frees the connection as soon as the body is done, and the
+        # background task covers a client that disconnects before the body is ever iterated.
+        await response.aclose()
+        await client.aclose()
+
+    async def relay():
+        try:
+            # Headers are already sent, so the body phase is reported as its own upstream span only.
+            with _upstream_call("optimize_listing", phase="edge_function_body") as span:
+                # Raw bytes: no decompression or JSON round trip, Content-Encoding is passed through.
+                async for chunk in response.aiter_raw():
+                    yield chunk
+                span["status"] = response.status_code
+        finally:
+            await close()
+        # Only reached once the whole body was relayed; a dropped upstream or client raises above instead.
+        try:
+            await bill()
+        except Exception as exc:
+            logging.error("optimize_listing_billing_failed stream=true err=%s", exc)
+
+    relayed = {name: response.headers[name] for name in _RELAYED_BODY_HEADERS if name in response.headers}
+    return StreamingResponse(
+        relay(), status_code=response.status_code, headers=relayed, background=BackgroundTask(close)
+    )
+
+
+@router.post("/shopify/convert-heic")
 async def shopify_convert_heic(
     request: Request,
     file: UploadFile = File(...),
@@ -1069,16 +1895,17 @@ async def shopify_convert_heic(
     auth_shop = getattr(request.state, "shop", None) or shop
     if not auth_shop:
         raise HTTPException(status_code=401, detail="Missing shop context.")
-    _check_rate_limit(auth_shop, "convert_heic")
+    await _check_rate_limit(auth_shop, "convert_heic")
     if not file:
         raise HTTPException(status_code=400, detail="Missing file.")
     contents = await file.read()
     if not contents:
         raise HTTPException(status_code=400, detail="Empty upload.")
+    IMAGE_BYTES.observe(len(contents), source="heic_upload")
     if len(contents) > MAX_HEIC_BYTES:
         raise HTTPException(status_code=413, detail="Image exceeds 20MB limit.")
     try:
-        image = Image.open(BytesIO(contents))
+        image = _pil_image().open(BytesIO(contents))
         image = image.convert("RGB")
     except Exception as exc:
         logging.warning("heic_decode_failed shop=%s error=%s", auth_shop, exc)
@@ -1088,7 +1915,7 @@ async def shopify_convert_heic(
     return Response(content=output.getvalue(), media_type="image/jpeg")
 
 
-@app.get("/shopify/products")
+@router.get("/shopify/products")
 async def shopify_products(request: Request, shop: str | None = None, limit: int = 25):
     auth_shop = getattr(request.state, "shop", None) or shop
     if not auth_shop:
@@ -1103,10 +1930,12 @@ async def shopify_products(request: Request, shop: str | None = None, limit: int
         "/products.json",
         payload,
     )
+    for product in response.get("products") or []:
+        _add_thumb_urls(product.get("images") or [])
     return response
 
 
-@app.get("/shopify/products/{product_id}/images")
+@router.get("/shopify/products/{product_id}/images")
 async def shopify_product_images(request: Request, product_id: str, shop: str | None = None):
     auth_shop = getattr(request.state, "shop", None) or shop
     if not auth_shop:
@@ -1121,10 +1950,57 @@ async def shopify_product_images(request: Request, product_id: str, shop: str |
         f"/products/{product_id}/images.json",
         payload,
     )
+    _add_thumb_urls(response.get("images") or [])
     return response
 
 
-@app.get("/shopify/images/fetch")
+@router.post("/shopify/catalog/export", status_code=202)
+async def shopify_catalog_export(request: Request, shop: str | None = None):
+    """Start a bulk-operation export of the shop's products and images into the local catalog index.
+
+    Returns the export record; an export already in progress is returned instead of starting another.
+    """
+    auth_shop = getattr(request.state, "shop", None) or shop
+    if not auth_shop:
+        raise HTTPException(status_code=401, detail="Missing shop context.")
+    await _check_rate_limit(auth_shop, "catalog_export")
+    _get_shop_record(auth_shop, request.query_params.get("host"))
+    try:
+        return _export_view(await _catalog_exporter().start(auth_shop))
+    except CatalogExportError as exc:
+        raise HTTPException(status_code=409, detail={"error": "catalog_export_rejected", "message": str(exc)})
+
+
+def _export_view(export: dict) -> dict:
+    # Lease bookkeeping is internal to the exporters.
+    return {key: value for key, value in export.items() if key not in ("owner", "lease_expires_at")}
+
+
+@router.get("/shopify/catalog/export")
+async def shopify_catalog_export_status(request: Request, shop: str | None = None):
+    auth_shop = getattr(request.state, "shop", None) or shop
+    if not auth_shop:
+        raise HTTPException(status_code=401, detail="Missing shop context.")
+    export = await asyncio.to_thread(_catalog_index().latest_export, auth_shop)
+    if export is None:
+        raise HTTPException(status_code=404, detail="No catalog export yet.")
+    return _export_view(export)
+
+
+@router.get("/shopify/catalog/products")
+async def shopify_catalog_products(
+    request: Request, shop: str | None = None, after: str | None = None, limit: int = 50
+):
+    auth_shop = getattr(request.state, "shop", None) or shop
+    if not auth_shop:
+        raise HTTPException(status_code=401, detail="Missing shop context.")
+    limit = max(1, min(limit, 250))
+    products = await asyncio.to_thread(_catalog_index().products, auth_shop, after, limit)
+    next_cursor = products[-1]["id"] if len(products) == limit else None
+    return {"products": products, "next": next_cursor}
+
+
+@router.get("/shopify/images/fetch")
 async def shopify_fetch_image(request: Request, src: str, shop: str | None = None):
     auth_shop = getattr(request.state, "shop", None) or shop
     if not auth_shop:
@@ -1135,12 +2011,15 @@ async def shopify_fetch_image(request: Request, src: str, shop: str | None = Non
     if not _is_allowed_shopify_image_url(src):
         raise HTTPException(status_code=400, detail="Unsupported image source.")
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        response = await client.get(src)
-        response.raise_for_status()
-        content_type = response.headers.get("Content-Type", "image/jpeg")
-        content = response.content
+    with _upstream_call("shopify_cdn", phase="image_fetch") as span:
+        async with httpx.AsyncClient(timeout=30) as client:
+            response = await client.get(src)
+            span["status"] = response.status_code
+            response.raise_for_status()
+            content_type = response.headers.get("Content-Type", "image/jpeg")
+            content = response.content
 
+    IMAGE_BYTES.observe(len(content), source="cdn_fetch")
     if len(content) > 10 * 1024 * 1024:
         raise HTTPException(status_code=413, detail="Image exceeds 10MB limit.")
 
@@ -1149,12 +2028,185 @@ async def shopify_fetch_image(request: Request, src: str, shop: str | None = Non
     return {"data_url": data_url}
 
 
-@app.get("/shopify/health")
+THUMB_WIDTHS = (96, 160, 240, 320, 480, 640)
+THUMB_DEFAULT_WIDTH = 320
+# Shopify CDN URLs change when the file changes, so a derivative of one never goes stale.
+THUMB_CACHE_CONTROL = "public, max-age=31536000, immutable"
+_THUMB_FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+_THUMB_WRITES = 0
+
+
+def _thumb_signature(src: str, width: int) -> str:
+    message = f"{src}|{width}".encode("utf-8")
+    return hmac.new((SHOPIFY_API_SECRET or "").encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+def _thumb_url(src: str, width: int = THUMB_DEFAULT_WIDTH) -> str:
+    return "/shopify/images/thumb?" + urlencode({"src": src, "w": width, "sig": _thumb_signature(src, width)})
+
+
+def _add_thumb_urls(images: list[dict]) -> None:
+    if not SHOPIFY_API_SECRET:
+        return
+    for image in images:
+        src = image.get("src") or ""
+        if _is_allowed_shopify_image_url(src):
+            image["thumb_url"] = _thumb_url(src)
+
+
+def _thumb_width(requested: int) -> int:
+    # Snap to a fixed set so every caller shares the same few cached derivatives per image.
+    return next((width for width in THUMB_WIDTHS if width >= requested), THUMB_WIDTHS[-1])
+
+
+def _thumb_format(accept: str) -> str:
+    return "webp" if "image/webp" in (accept or "").lower() else "jpeg"
+
+
+def _render_thumbnail(data: bytes, width: int, fmt: str) -> bytes:
+    Image = _pil_image()
+    image = Image.open(BytesIO(data))
+    source_width, source_height = image.size
+    if source_width > width:
+        height = max(1, round(source_height * width / source_width))
+        # JPEG sources are DCT-scaled during decode, so a 4000px original is never fully decoded.
+        image.draft("RGB", (width, height))
+        image = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=2.0)
+    pil_format, _ = _THUMB_FORMATS[fmt]
+    if fmt == "jpeg" and image.mode not in ("RGB", "L"):
+        rgba = image.convert("RGBA")
+        image = Image.new("RGB", rgba.size, (255, 255, 255))
+        image.paste(rgba, mask=rgba.getchannel("A"))
+    elif image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA")
+    output = BytesIO()
+    image.save(output, format=pil_format, quality=80, optimize=fmt == "jpeg")
+    return output.getvalue()
+
+
+def _store_thumbnail(path: Path, content: bytes) -> None:
+    global _THUMB_WRITES
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    temp_path.write_bytes(content)
+    os.replace(temp_path, path)
+    _THUMB_WRITES += 1
+    if _THUMB_WRITES % 200 == 0:
+        _prune_thumb_cache(path.parent)
+
+
+def _prune_thumb_cache(cache_dir: Path) -> None:
+    entries = []
+    for entry in cache_dir.glob("*.thumb"):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_atime, stat.st_size, entry))
+    total = sum(size for _, size, _ in entries)
+    for _, size, entry in sorted(entries):
+        if total <= SHOPIFY_THUMB_CACHE_MAX_BYTES:
+            break
+        entry.unlink(missing_ok=True)
+        total -= size
+
+
+@router.get("/shopify/images/thumb")
+async def shopify_image_thumb(request: Request, src: str, sig: str, w: int = THUMB_DEFAULT_WIDTH):
+    """Serve a resized Shopify CDN image as WebP or JPEG, depending on ``Accept``.
+
+    URLs come signed from the product image endpoints (see ``_thumb_url``), so
+    they work in plain ``<img>`` tags and stay cacheable across session tokens.
+    Derivatives are cached on disk under ``SHOPIFY_THUMB_CACHE_DIR``.
+    """
+    if not SHOPIFY_API_SECRET or not hmac.compare_digest(sig, _thumb_signature(src, w)):
+        raise HTTPException(status_code=401, detail="Invalid thumbnail signature.")
+    if not _is_allowed_shopify_image_url(src):
+        raise HTTPException(status_code=400, detail="Unsupported image source.")
+    width = _thumb_width(w)
+    fmt = _thumb_format(request.headers.get("accept", ""))
+    _, media_type = _THUMB_FORMATS[fmt]
+    cache_key = hashlib.sha256(f"{src}|{width}|{fmt}".encode("utf-8")).hexdigest()
+    headers = {"Cache-Control": THUMB_CACHE_CONTROL, "ETag": f'"{cache_key}"', "Vary": "Accept"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+
+    cache_path = Path(SHOPIFY_THUMB_CACHE_DIR) / cache_key[:2] / f"{cache_key}.thumb"
+    try:
+        content = await asyncio.to_thread(cache_path.read_bytes)
+        return Response(content=content, media_type=media_type, headers={**headers, "X-Nudio-Thumb-Cache": "hit"})
+    except FileNotFoundError:
+        pass
+
+    with _upstream_call("shopify_cdn", phase="thumb_fetch") as span:
+        async with httpx.AsyncClient(timeout=30) as client:
+            response = await client.get(src)
+            span["status"] = response.status_code
+    if response.status_code == 404:
+        raise HTTPException(status_code=404, detail="Image not found.")
+    if response.status_code >= 400:
+        raise HTTPException(status_code=502, detail="Image fetch failed.")
+    IMAGE_BYTES.observe(len(response.content), source="thumb_fetch")
+    if len(response.content) > 20 * 1024 * 1024:
+        raise HTTPException(status_code=413, detail="Image exceeds 20MB limit.")
+    try:
+        content = await asyncio.to_thread(_render_thumbnail, response.content, width, fmt)
+    except Exception as exc:
+        logging.warning("thumb_render_failed src=%s err=%s", src, exc)
+        raise HTTPException(status_code=415, detail="Unsupported image format.")
+    await asyncio.to_thread(_store_thumbnail, cache_path, content)
+    return Response(content=content, media_type=media_type, headers={**headers, "X-Nudio-Thumb-Cache": "miss"})
+
+
+@router.get("/shopify/results/{key:path}")
+async def shopify_result(key: str, expires: int = 0, sig: str = ""):
+    # Public path (no session token): links come signed from the optimize endpoint.
+    store = _result_store()
+    if not SHOPIFY_RESULT_URL_SECRET or not isinstance(store, LocalStore):
+        raise HTTPException(status_code=404, detail="Result not found.")
+    if not store.verify(key, expires, sig):
+        raise HTTPException(status_code=401, detail="Invalid or expired result link.")
+    path = store.path(key)
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="Result not found.")
+    # Content-addressed: the bytes behind a key never change, so shared caches may keep them (as /api/results does).
+    return FileResponse(
+        path, media_type=content_type_for(key), headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+
+@router.get("/shopify/health")
 async def shopify_health():
     return {"ok": True, "timestamp": datetime.now(timezone.utc).isoformat()}
 
 
+@router.get("/shopify/metrics")
+async def shopify_metrics(request: Request):
+    # Public for Prometheus scrapers (no session token); guarded by a static bearer token when configured.
+    if SHOPIFY_METRICS_TOKEN:
+        auth_header = request.headers.get("authorization", "")
+        provided = auth_header[len("Bearer "):] if auth_header.startswith("Bearer ") else ""
+        if not hmac.compare_digest(provided, SHOPIFY_METRICS_TOKEN):
+            raise HTTPException(status_code=401, detail="Invalid metrics token.")
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE_LATEST)
+
+
+@router.get("/shopify/debug/profiles/{profile_id}")
+async def shopify_download_profile(request: Request, profile_id: str):
+    # Public path (no session token): the caller signs the profile id with SHOPIFY_PROFILE_SECRET instead.
+    if not _has_profile_signature(request, profile_id):
+        raise HTTPException(status_code=401, detail="Invalid profile signature.")
+    if not re.fullmatch(r"[0-9a-f]{32}", profile_id):
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    profile_path = Path(SHOPIFY_PROFILE_DIR) / f"{profile_id}.prof"
+    if not profile_path.is_file():
+        raise HTTPException(status_code=404, detail="Profile not found.")
+    return FileResponse(profile_path, media_type="application/octet-stream", filename=profile_path.name)
+
+
 async def _handle_shopify_webhook(request: Request, delete_shop: bool = False) -> dict:
+    # Verify, persist and acknowledge; the Supabase work happens in the background consumer.
+    # Topics that need no work (we hold no customer data) are acknowledged without queueing.
     try:
         raw_body = await request.body()
         hmac_header = request.headers.get("X-Shopify-Hmac-Sha256", "")
@@ -1163,7 +2215,17 @@ async def _handle_shopify_webhook(request: Request, delete_shop: bool = False) -
         if delete_shop:
             shop = request.headers.get("X-Shopify-Shop-Domain", "")
             if _is_valid_shop_domain(shop):
-                _delete_shop_record(shop)
+                queued = await asyncio.to_thread(
+                    _webhook_queue().enqueue,
+                    request.headers.get("X-Shopify-Webhook-Id", ""),
+                    shop,
+                    request.headers.get("X-Shopify-Topic", ""),
+                    "delete_shop",
+                    raw_body,
+                )
+                consumer = getattr(request.app.state, "webhook_consumer", None)
+                if queued and consumer is not None:
+                    consumer.notify()
         return {"ok": True}
     except HTTPException:
         raise
@@ -1172,8 +2234,18 @@ async def _handle_shopify_webhook(request: Request, delete_shop: bool = False) -
         raise HTTPException(status_code=401, detail="Invalid webhook signature.")
 
 
+async def _process_webhook_delivery(delivery: WebhookDelivery) -> None:
+    if delivery.action == "delete_shop":
+        await asyncio.to_thread(_delete_shop_record, delivery.shop)
+        # Exports running in other workers see their export gone at their next write and stop.
+        if _CATALOG_EXPORTER is not None:
+            _CATALOG_EXPORTER.cancel_shop(delivery.shop)
+        await asyncio.to_thread(_catalog_index().delete_shop, delivery.shop)
+        logging.info("webhook_shop_deleted shop=%s topic=%s", delivery.shop, delivery.topic)
+
+
 # Shopify CLI compliance_topics webhook (single endpoint for GDPR topics).
-@app.post("/shopify/webhooks/compliance")
+@router.post("/shopify/webhooks/compliance")
 async def shopify_webhooks_compliance(request: Request):
     if not SHOPIFY_API_SECRET:
         raise HTTPException(status_code=401, detail="Invalid webhook signature.")
@@ -1183,42 +2255,80 @@ async def shopify_webhooks_compliance(request: Request):
 
 
 # Canonical compliance webhook paths (preferred).
-@app.post("/shopify/webhooks/app/uninstalled")
+@router.post("/shopify/webhooks/app/uninstalled")
 async def shopify_app_uninstalled(request: Request):
     return await _handle_shopify_webhook(request, delete_shop=True)
 
 
-@app.post("/shopify/webhooks/customers/data_request")
+@router.post("/shopify/webhooks/customers/data_request")
 async def shopify_customers_data_request(request: Request):
     return await _handle_shopify_webhook(request)
 
 
-@app.post("/shopify/webhooks/customers/redact")
+@router.post("/shopify/webhooks/customers/redact")
 async def shopify_customers_redact(request: Request):
     return await _handle_shopify_webhook(request)
 
 
-@app.post("/shopify/webhooks/shop/redact")
+@router.post("/shopify/webhooks/shop/redact")
 async def shopify_shop_redact(request: Request):
     return await _handle_shopify_webhook(request, delete_shop=True)
 
 
 # Backward-compatible paths (legacy underscore URLs).
-@app.post("/shopify/webhooks/app_uninstalled")
+@router.post("/shopify/webhooks/app_uninstalled")
 async def shopify_app_uninstalled_legacy(request: Request):
     return await _handle_shopify_webhook(request, delete_shop=True)
 
 
-@app.post("/shopify/webhooks/customers_data_request")
+@router.post("/shopify/webhooks/customers_data_request")
 async def shopify_customers_data_request_legacy(request: Request):
     return await _handle_shopify_webhook(request)
 
 
-@app.post("/shopify/webhooks/customers_redact")
+@router.post("/shopify/webhooks/customers_redact")
 async def shopify_customers_redact_legacy(request: Request):
     return await _handle_shopify_webhook(request)
 
 
-@app.post("/shopify/webhooks/shop_redact")
+@router.post("/shopify/webhooks/shop_redact")
 async def shopify_shop_redact_legacy(request: Request):
     return await _handle_shopify_webhook(request, delete_shop=True)
+
+
+def create_app(settings: ShopifySettings | None = None) -> FastAPI:
+    """Build the Shopify FastAPI app.
+
+    Without ``settings`` the ``.env`` file and environment are read. Supabase,
+    PIL and pillow_heif are imported on first use, not here.
+    """
+    if settings is None:
+        load_dotenv()
+        settings = ShopifySettings.from_env()
+    configure_logging()
+    app = FastAPI(title="Nudio Shopify App", lifespan=_lifespan)
+    app.state.settings = settings
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    # The last middleware registered is outermost: timings wrap CSP, which wraps auth.
+    app.middleware("http")(require_shopify_session_token)
+    app.middleware("http")(add_shopify_csp)
+    app.middleware("http")(record_request_timings)
+    static_dir = Path(settings.frontend_build_dir) / "static"
+    if static_dir.exists():
+        app.mount("/shopify/app/static", StaticFiles(directory=static_dir), name="shopify_static")
+    app.include_router(router)
+    return app
+
+
+def __getattr__(name: str):
+    # `uvicorn shopify_app:app` and `from shopify_app import app` build the default app on first access.
+    if name == "app":
+        global app
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
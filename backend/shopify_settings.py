@@ -0,0 +1,122 @@
+"""Typed configuration for the Shopify backend.
+
+``ShopifySettings.from_env()`` only reads environment variables; nothing here
+imports clients or touches the network, so building settings is cheap and
+safe at import time. Missing Supabase credentials are reported by
+``missing_required()`` and enforced at app startup, not on import.
+"""
+
+from __future__ import annotations
+
+import os
+import tempfile
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Mapping
+
+from fair_queue import parse_weights
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+
+@dataclass(frozen=True)
+class ShopifySettings:
+    api_key: str | None = None
+    api_secret: str | None = None
+    scopes: str = "read_products,write_products"
+    app_url: str = "https://app.nudio.ai/shopify/app"
+    # App Store listing slug + admin app handle (apps.shopify.com/<handle> and admin.shopify.com/.../apps/<handle>).
+    app_handle: str = "nudio"
+    oauth_callback: str = "https://app.nudio.ai/shopify/oauth/callback"
+    admin_api_version: str = "2024-10"
+    # Points Admin API traffic at a local stand-in (load tests, fixture servers); empty in production.
+    admin_base_url: str = ""
+    test_billing: bool = False
+    shops_table: str = "shopify_shops"
+    frontend_build_dir: str = str(BACKEND_DIR.parent / "frontend-shopify" / "build")
+    metrics_token: str = ""
+    # Per-request profiling is off unless a secret is configured; requests opt in with a signed header.
+    profile_secret: str = ""
+    profile_dir: str = str(Path(tempfile.gettempdir()) / "nudio-shopify-profiles")
+    profile_keep: int = 20
+    webhook_queue_path: str = str(BACKEND_DIR / "var" / "webhook_queue.sqlite3")
+    webhook_dedupe_seconds: float = 86400.0
+    catalog_index_path: str = str(BACKEND_DIR / "var" / "catalog_index.sqlite3")
+    thumb_cache_dir: str = str(BACKEND_DIR / "var" / "thumbs")
+    thumb_cache_max_bytes: int = 256 * 1024 * 1024
+    # Where optimized results go when a client asks for URLs instead of inline base64 (see storage.py).
+    result_store_url: str = f"file://{BACKEND_DIR / 'var' / 'results'}"
+    result_url_ttl: int = 3600
+    # Signs result links; its own secret so the Shopify app credential cannot mint them. Unset disables delivery=url.
+    result_url_secret: str = ""
+    # Rate limits and caches must agree across uvicorn workers, so the default is a host-wide SQLite file.
+    state_url: str = f"sqlite:///{BACKEND_DIR / 'var' / 'shared_state.sqlite3'}"
+    supabase_url: str | None = None
+    supabase_service_key: str | None = None
+    # Admission control in front of the optimize-listing edge function (per worker process).
+    # The global limit adapts to edge latency between edge_min_concurrency and edge_max_concurrency.
+    edge_max_concurrency: int = 32
+    edge_min_concurrency: int = 2
+    edge_initial_concurrency: int = 8
+    edge_latency_tolerance: float = 2.0
+    edge_timeout_seconds: float = 180.0
+    edge_shop_concurrency: int = 4
+    edge_queue_depth: int = 200
+    edge_shop_queue_depth: int = 50
+    edge_shop_weights: Mapping[str, float] = field(default_factory=dict)
+
+    @classmethod
+    def from_env(cls, environ: Mapping[str, str] | None = None) -> "ShopifySettings":
+        env = os.environ if environ is None else environ
+        defaults = cls()
+        return cls(
+            api_key=env.get("SHOPIFY_API_KEY"),
+            api_secret=env.get("SHOPIFY_API_SECRET"),
+            scopes=env.get("SHOPIFY_SCOPES", defaults.scopes),
+            app_url=env.get("SHOPIFY_APP_URL", defaults.app_url),
+            app_handle=env.get("SHOPIFY_APP_HANDLE", defaults.app_handle).strip(),
+            oauth_callback=env.get("SHOPIFY_OAUTH_CALLBACK", defaults.oauth_callback),
+            admin_api_version=env.get("SHOPIFY_ADMIN_API_VERSION", defaults.admin_api_version),
+            admin_base_url=env.get("SHOPIFY_ADMIN_BASE_URL", "").rstrip("/"),
+            test_billing=env.get("SHOPIFY_TEST_BILLING", "false").lower() in ("1", "true", "yes"),
+            shops_table=env.get("SHOPIFY_SHOPS_TABLE", defaults.shops_table),
+            frontend_build_dir=env.get("SHOPIFY_FRONTEND_BUILD_DIR", defaults.frontend_build_dir),
+            metrics_token=env.get("SHOPIFY_METRICS_TOKEN", ""),
+            profile_secret=env.get("SHOPIFY_PROFILE_SECRET", ""),
+            profile_dir=env.get("SHOPIFY_PROFILE_DIR", defaults.profile_dir),
+            profile_keep=int(env.get("SHOPIFY_PROFILE_KEEP", str(defaults.profile_keep))),
+            webhook_queue_path=env.get("SHOPIFY_WEBHOOK_QUEUE_PATH", defaults.webhook_queue_path),
+            webhook_dedupe_seconds=float(
+                env.get("SHOPIFY_WEBHOOK_DEDUPE_SECONDS", str(defaults.webhook_dedupe_seconds))
+            ),
+            catalog_index_path=env.get("SHOPIFY_CATALOG_INDEX_PATH", defaults.catalog_index_path),
+            thumb_cache_dir=env.get("SHOPIFY_THUMB_CACHE_DIR", defaults.thumb_cache_dir),
+            thumb_cache_max_bytes=int(env.get("SHOPIFY_THUMB_CACHE_MAX_BYTES", str(defaults.thumb_cache_max_bytes))),
+            result_store_url=env.get("SHOPIFY_RESULT_STORE_URL") or defaults.result_store_url,
+            result_url_ttl=int(env.get("SHOPIFY_RESULT_URL_TTL", str(defaults.result_url_ttl))),
+            result_url_secret=env.get("SHOPIFY_RESULT_URL_SECRET", ""),
+            state_url=env.get("SHOPIFY_STATE_URL") or defaults.state_url,
+            supabase_url=env.get("SUPABASE_URL"),
+            supabase_service_key=env.get("SUPABASE_SERVICE_KEY"),
+            edge_max_concurrency=int(env.get("SHOPIFY_EDGE_MAX_CONCURRENCY", str(defaults.edge_max_concurrency))),
+            edge_min_concurrency=int(env.get("SHOPIFY_EDGE_MIN_CONCURRENCY", str(defaults.edge_min_concurrency))),
+            edge_initial_concurrency=int(
+                env.get("SHOPIFY_EDGE_INITIAL_CONCURRENCY", str(defaults.edge_initial_concurrency))
+            ),
+            edge_latency_tolerance=float(
+                env.get("SHOPIFY_EDGE_LATENCY_TOLERANCE", str(defaults.edge_latency_tolerance))
+            ),
+            edge_timeout_seconds=float(env.get("SHOPIFY_EDGE_TIMEOUT_SECONDS", str(defaults.edge_timeout_seconds))),
+            edge_shop_concurrency=int(env.get("SHOPIFY_EDGE_SHOP_CONCURRENCY", str(defaults.edge_shop_concurrency))),
+            edge_queue_depth=int(env.get("SHOPIFY_EDGE_QUEUE_DEPTH", str(defaults.edge_queue_depth))),
+            edge_shop_queue_depth=int(env.get("SHOPIFY_EDGE_SHOP_QUEUE_DEPTH", str(defaults.edge_shop_queue_depth))),
+            edge_shop_weights=parse_weights(env.get("SHOPIFY_EDGE_SHOP_WEIGHTS", "")),
+        )
+
+    def missing_required(self) -> list[str]:
+        missing = []
+        if not self.supabase_url:
+            missing.append("SUPABASE_URL")
+        if not self.supabase_service_key:
+            missing.append("SUPABASE_SERVICE_KEY")
+        return missing
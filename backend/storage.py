@@ -0,0 +1,185 @@
+"""Content-addressed storage for generated images.
+
+Results are written once under a key derived from their SHA-256, so storing
+the same bytes twice is a no-op, and handed to clients as short-lived signed
+URLs instead of inline base64. Database rows keep the key, never a URL.
+
+Stores are chosen by URL, like ``shared_state`` backends:
+
+- ``file:///path/to/dir`` — local directory; the app serves ``signed_url``
+  links itself (``LocalStore.verify`` checks them).
+- ``supabase://bucket`` — a Supabase Storage bucket; signed URLs come from
+  Supabase and point at its CDN.
+
+Other object stores (e.g. S3) plug in with ``register_backend``.
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import math
+import os
+import re
+import time
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable
+from urllib.parse import urlencode, urlparse
+
+CONTENT_TYPES = {"png": "image/png", "jpg": "image/jpeg", "webp": "image/webp", "gif": "image/gif"}
+_EXTENSIONS = {content_type: extension for extension, content_type in CONTENT_TYPES.items()}
+_KEY_PATTERN = re.compile(r"[a-z0-9_-]+/[0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]+")
+
+
+@dataclass(frozen=True)
+class StoredObject:
+    key: str
+    content_type: str
+    size: int
+
+
+def content_key(data: bytes, content_type: str, prefix: str = "results") -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    return f"{prefix}/{digest[:2]}/{digest}.{_EXTENSIONS.get(content_type, 'bin')}"
+
+
+def is_valid_key(key: str) -> bool:
+    return bool(_KEY_PATTERN.fullmatch(key or ""))
+
+
+def content_type_for(key: str) -> str:
+    return CONTENT_TYPES.get(key.rsplit(".", 1)[-1], "application/octet-stream")
+
+
+def decode_data_url(data_url: str) -> tuple[bytes, str]:
+    """Split a ``data:<type>;base64,...`` URL into bytes and content type."""
+    header, _, payload = data_url.rpartition(",")
+    content_type = header[len("data:"):].split(";", 1)[0] if header.startswith("data:") else ""
+    return base64.b64decode(payload), content_type or "image/png"
+
+
+class ObjectStore(ABC):
+    def put(self, data: bytes, content_type: str, prefix: str = "results") -> StoredObject:
+        key = content_key(data, content_type, prefix)
+        if not self.exists(key):
+            self.write(key, data, content_type)
+        return StoredObject(key=key, content_type=content_type, size=len(data))
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def write(self, key: str, data: bytes, content_type: str) -> None:
+        ...
+
+    @abstractmethod
+    def read(self, key: str) -> bytes:
+        ...
+
+    @abstractmethod
+    def signed_url(self, key: str, expires_in: int = 3600) -> str:
+        ...
+
+
+class LocalStore(ObjectStore):
+    def __init__(self, root: str | os.PathLike, base_url: str = "", secret: str = ""):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip("/")
+        self.secret = secret
+
+    def path(self, key: str) -> Path:
+        if not is_valid_key(key):
+            raise KeyError(key)
+        return self.root / key
+
+    def exists(self, key: str) -> bool:
+        return self.path(key).is_file()
+
+    def write(self, key: str, data: bytes, content_type: str) -> None:
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f".{uuid.uuid4().hex}.tmp")
+        temp_path.write_bytes(data)
+        os.replace(temp_path, path)
+
+    def read(self, key: str) -> bytes:
+        return self.path(key).read_bytes()
+
+    def signed_url(self, key: str, expires_in: int = 3600) -> str:
+        # Expiry is rounded up to a whole window so repeated requests get the same, cacheable URL.
+        window = max(60, expires_in)
+        expires = (math.floor(time.time() / window) + 2) * window
+        query = urlencode({"expires": expires, "sig": self._signature(key, expires)})
+        return f"{self.base_url}/{key}?{query}"
+
+    def verify(self, key: str, expires: int, sig: str) -> bool:
+        if not self.secret or not is_valid_key(key) or expires < time.time():
+            return False
+        return hmac.compare_digest(sig or "", self._signature(key, expires))
+
+    def _signature(self, key: str, expires: int) -> str:
+        message = f"{key}|{expires}".encode("utf-8")
+        return hmac.new(self.secret.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+
+class SupabaseStore(ObjectStore):
+    """Supabase Storage bucket; ``client`` is a supabase-py client or a callable returning one."""
+
+    def __init__(self, bucket: str, client: Any):
+        self.bucket = bucket
+        self._client = client
+
+    def _bucket(self):
+        if callable(self._client):
+            self._client = self._client()
+        return self._client.storage.from_(self.bucket)
+
+    def exists(self, key: str) -> bool:
+        folder, _, name = key.rpartition("/")
+        entries = self._bucket().list(folder, {"search": name, "limit": 1})
+        return any(entry.get("name") == name for entry in entries or [])
+
+    def write(self, key: str, data: bytes, content_type: str) -> None:
+        self._bucket().upload(
+            key,
+            data,
+            {"content-type": content_type, "cache-control": "31536000", "upsert": "true"},
+        )
+
+    def read(self, key: str) -> bytes:
+        return self._bucket().download(key)
+
+    def signed_url(self, key: str, expires_in: int = 3600) -> str:
+        signed = self._bucket().create_signed_url(key, expires_in)
+        return signed.get("signedURL") or signed.get("signedUrl") or ""
+
+
+def _supabase_client():
+    from supabase import create_client
+
+    return create_client(os.environ["SUPABASE_URL"], os.environ["SUPABASE_SERVICE_KEY"])
+
+
+_BACKENDS: dict[str, Callable[..., ObjectStore]] = {
+    "file": lambda url, **options: LocalStore(urlparse(url).path, **options),
+    "supabase": lambda url, **options: SupabaseStore(urlparse(url).netloc, _supabase_client),
+}
+
+
+def register_backend(scheme: str, factory: Callable[..., ObjectStore]) -> None:
+    """Make ``scheme://...`` URLs resolve to ``factory(url, base_url=..., secret=...)`` (e.g. an S3 adapter)."""
+    _BACKENDS[scheme] = factory
+
+
+def create_store(url: str, base_url: str = "", secret: str = "") -> ObjectStore:
+    """Build a store; ``base_url`` and ``secret`` sign and serve URLs for stores the app serves itself."""
+    scheme = urlparse(url).scheme or "file"
+    factory = _BACKENDS.get(scheme)
+    if factory is None:
+        raise ValueError(f"Unsupported object store: {scheme}")
+    return factory(url, base_url=base_url, secret=secret)
@@ -0,0 +1,200 @@
+"""Local verification of Supabase access tokens.
+
+Supabase signs access tokens either with the project's shared JWT secret
+(HS256) or with an asymmetric signing key published as a JWKS at
+``/auth/v1/.well-known/jwks.json``. ``TokenVerifier`` checks both locally, so
+authenticating a request needs no round trip to Supabase:
+
+- JWKS keys are fetched in the background every ``jwks_refresh_seconds``; a
+  token signed with an unknown ``kid`` (a key rotation) triggers an early
+  refresh, at most once per ``jwks_min_refresh_seconds``.
+- Verified identities are cached by token hash until the token expires.
+
+``verify`` returns None when no local key can check a token (no secret
+configured, or the JWKS could not be fetched); callers then fall back to
+``supabase.auth.get_user``. Local checks cannot see sign-outs or bans before
+a token expires, so routes that must honour revocation ask Supabase as well.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable
+
+import httpx
+import jwt
+
+from metrics import REGISTRY
+
+ASYMMETRIC_ALGORITHMS = ("RS256", "ES256", "EdDSA")
+
+TOKEN_VERIFICATIONS = REGISTRY.counter(
+    "supabase_token_verifications_total",
+    "Access token checks, by result (cache_hit, verified, invalid, unavailable).",
+    ("result",),
+)
+
+
+@dataclass(frozen=True)
+class TokenUser:
+    id: str
+    email: str | None
+    role: str | None
+    session_id: str | None
+    expires_at: float
+
+
+@dataclass(frozen=True)
+class VerifiedToken:
+    """Shaped like supabase-py's ``UserResponse`` so callers keep using ``.user.id``."""
+
+    user: TokenUser
+    claims: dict[str, Any]
+
+
+class TokenVerifier:
+    def __init__(
+        self,
+        jwt_secret: str = "",
+        jwks_url: str = "",
+        audience: str | None = "authenticated",
+        issuer: str | None = None,
+        jwks_refresh_seconds: float = 600.0,
+        jwks_min_refresh_seconds: float = 30.0,
+        leeway_seconds: float = 10.0,
+        max_entries: int = 10000,
+        http_client: Callable[[], httpx.AsyncClient] | None = None,
+        clock=time.time,
+    ):
+        self.jwt_secret = jwt_secret
+        self.jwks_url = jwks_url
+        self.audience = audience
+        self.issuer = issuer
+        self.jwks_refresh_seconds = jwks_refresh_seconds
+        self.jwks_min_refresh_seconds = jwks_min_refresh_seconds
+        self.leeway_seconds = leeway_seconds
+        self.max_entries = max(1, max_entries)
+        self._http_client = http_client or (lambda: httpx.AsyncClient(timeout=httpx.Timeout(10.0, connect=5.0)))
+        self._clock = clock
+        self._identities: OrderedDict[str, VerifiedToken] = OrderedDict()
+        self._keys: dict[str, Any] | None = None
+        self._jwks_fetched_at = float("-inf")
+        self._refresh_lock: asyncio.Lock | None = None
+        self._refresher: asyncio.Task | None = None
+
+    async def verify(self, token: str) -> VerifiedToken | None:
+        """Return the token's identity, None if it cannot be checked locally; raises ``jwt.InvalidTokenError``."""
+        cache_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+        cached = self._identities.get(cache_key)
+        if cached is not None and cached.user.expires_at > self._clock():
+            self._identities.move_to_end(cache_key)
+            TOKEN_VERIFICATIONS.inc(result="cache_hit")
+            return cached
+        if cached is not None:
+            del self._identities[cache_key]
+
+        try:
+            header = jwt.get_unverified_header(token)
+            algorithm = header.get("alg")
+            signing_key = await self._signing_key(algorithm, header.get("kid"))
+            if signing_key is None:
+                TOKEN_VERIFICATIONS.inc(result="unavailable")
+                return None
+            claims = jwt.decode(
+                token,
+                signing_key,
+                algorithms=[algorithm],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.leeway_seconds,
+                options={"require": ["exp", "sub"], "verify_aud": self.audience is not None},
+            )
+        except jwt.InvalidTokenError:
+            TOKEN_VERIFICATIONS.inc(result="invalid")
+            raise
+
+        verified = VerifiedToken(
+            user=TokenUser(
+                id=claims["sub"],
+                email=claims.get("email"),
+                role=claims.get("role"),
+                session_id=claims.get("session_id"),
+                expires_at=float(claims["exp"]),
+            ),
+            claims=claims,
+        )
+        self._identities[cache_key] = verified
+        while len(self._identities) > self.max_entries:
+            self._identities.popitem(last=False)
+        TOKEN_VERIFICATIONS.inc(result="verified")
+        return verified
+
+    async def _signing_key(self, algorithm: str | None, kid: str | None) -> Any:
+        if algorithm == "HS256":
+            return self.jwt_secret or None
+        if algorithm not in ASYMMETRIC_ALGORITHMS:
+            raise jwt.InvalidAlgorithmError(f"Unsupported token algorithm: {algorithm}")
+        if not self.jwks_url:
+            return None
+        if (self._keys is None or kid not in self._keys) and self._can_refresh():
+            await self.refresh_jwks()
+        if not self._keys:
+            return None
+        if kid not in self._keys:
+            raise jwt.InvalidTokenError(f"Unknown signing key: {kid}")
+        return self._keys[kid]
+
+    def _can_refresh(self) -> bool:
+        return self._clock() - self._jwks_fetched_at >= self.jwks_min_refresh_seconds
+
+    async def refresh_jwks(self) -> bool:
+        """Fetch the JWKS now; keeps the previous keys if the fetch fails."""
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        attempted_at = self._jwks_fetched_at
+        async with self._refresh_lock:
+            if self._jwks_fetched_at != attempted_at:
+                # Another caller refreshed while this one waited for the lock.
+                return self._keys is not None
+            self._jwks_fetched_at = self._clock()
+            try:
+                async with self._http_client() as client:
+                    response = await client.get(self.jwks_url)
+                    response.raise_for_status()
+                    payload = response.json()
+            except (httpx.HTTPError, ValueError) as exc:
+                logging.warning("JWKS refresh from %s failed: %s", self.jwks_url, exc)
+                return False
+            keys = {}
+            for jwk in payload.get("keys") or []:
+                try:
+                    key = jwt.PyJWK(jwk)
+                except jwt.PyJWTError:
+                    continue
+                keys[key.key_id] = key.key
+            self._keys = keys
+            return True
+
+    def start(self) -> None:
+        """Begin refreshing the JWKS in the background; call from a running event loop."""
+        if self.jwks_url and self._refresher is None:
+            self._refresher = asyncio.create_task(self._refresh_forever())
+
+    async def _refresh_forever(self) -> None:
+        while True:
+            await self.refresh_jwks()
+            await asyncio.sleep(self.jwks_refresh_seconds)
+
+    async def close(self) -> None:
+        if self._refresher is not None:
+            self._refresher.cancel()
+            try:
+                await self._refresher
+            except asyncio.CancelledError:
+                pass
+            self._refresher = None
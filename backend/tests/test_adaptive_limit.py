@@ -0,0 +1,81 @@
+import pathlib
+import sys
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from adaptive_limit import CONCURRENCY_LIMIT, AIMDLimit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_grows_additively_while_limit_is_in_use():
+    limiter = AIMDLimit(initial_limit=4, min_limit=1, max_limit=6)
+    assert limiter.on_sample(1.0, dropped=False, in_flight=2) == 5
+    assert limiter.on_sample(1.0, dropped=False, in_flight=1) == 5
+    for _ in range(5):
+        limiter.on_sample(1.0, dropped=False, in_flight=6)
+    assert limiter.limit == 6
+    assert CONCURRENCY_LIMIT.value() == 6
+
+
+def test_drops_shrink_multiplicatively_once_per_baseline_interval():
+    clock = FakeClock()
+    limiter = AIMDLimit(initial_limit=16, min_limit=2, max_limit=32, clock=clock)
+    limiter.on_sample(10.0, dropped=False, in_flight=0)
+    assert limiter.on_sample(180.0, dropped=True, in_flight=16) == 12
+    # The rest of the burst that was in flight together does not compound the cut.
+    assert limiter.on_sample(180.0, dropped=True, in_flight=15) == 12
+    clock.now += 11.0
+    assert limiter.on_sample(180.0, dropped=True, in_flight=12) == 9
+
+
+def test_slow_success_counts_as_congestion():
+    clock = FakeClock()
+    limiter = AIMDLimit(
+        initial_limit=8, min_limit=2, max_limit=32, latency_tolerance=2.0, min_samples=2, clock=clock
+    )
+    limiter.on_sample(5.0, dropped=False, in_flight=8)
+    assert limiter.limit == 9
+    clock.now += 100
+    assert limiter.on_sample(12.0, dropped=False, in_flight=9) == 6
+
+
+def test_limit_never_leaves_bounds():
+    clock = FakeClock()
+    limiter = AIMDLimit(initial_limit=100, min_limit=2, max_limit=4, clock=clock)
+    assert limiter.limit == 4
+    for _ in range(10):
+        clock.now += 1000
+        limiter.on_sample(1.0, dropped=True, in_flight=4)
+    assert limiter.limit == 2
+
+
+def test_baseline_is_a_low_percentile_of_recent_successes():
+    limiter = AIMDLimit(initial_limit=8, min_limit=1, max_limit=8, baseline_window=10, baseline_percentile=0.2)
+    for latency in (9.0, 1.0, 8.0, 2.0, 7.0, 3.0, 6.0, 4.0, 5.0, 10.0):
+        limiter.on_sample(latency, dropped=False, in_flight=0)
+    assert limiter.baseline == 3.0
+    limiter.on_sample(50.0, dropped=True, in_flight=0)
+    assert limiter.baseline == 3.0
+    # A permanently slower upstream pushes the old samples out of the window
+    for _ in range(10):
+        limiter.on_sample(20.0, dropped=False, in_flight=0)
+    assert limiter.baseline == 20.0
+
+
+def test_one_fast_outlier_does_not_collapse_the_limit():
+    clock = FakeClock()
+    limiter = AIMDLimit(initial_limit=16, min_limit=2, max_limit=32, clock=clock)
+    limiter.on_sample(0.05, dropped=False, in_flight=16)
+    for _ in range(50):
+        clock.now += 5.0
+        limiter.on_sample(5.0 + (clock.now % 3), dropped=False, in_flight=limiter.limit)
+    assert limiter.limit == 32
+    assert limiter.baseline >= 5.0
@@ -0,0 +1,56 @@
+import pathlib
+import sys
+
+from fastapi.testclient import TestClient
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from bench.loadtest import percentile, summarize
+from bench.mock_upstreams import MockProfile, create_mock_app
+
+
+def _fast_profile(**overrides):
+    raw = {target: {"latency_ms": 0, "jitter_ms": 0} for target in ("shopify_graphql", "shopify_rest", "supabase_postgrest", "optimize_listing")}
+    raw.update({"result_image_bytes": 16, "seed": 1})
+    raw.update(overrides)
+    return MockProfile.from_dict(raw)
+
+
+def test_percentile_uses_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile(values, 99) == 99
+    assert percentile([], 99) == 0.0
+
+
+def test_summarize_reports_throughput_and_errors():
+    report = summarize({"products": [(0.1, 200), (0.2, 200), (0.3, 502), (0.4, "error")]}, elapsed=2.0)
+    products = report["endpoints"]["products"]
+    assert report["throughput_rps"] == 2.0
+    assert products["errors"] == 2
+    assert products["latency_ms"]["p50"] == 200.0
+
+
+def test_mock_profile_merges_target_overrides():
+    profile = MockProfile.from_dict({"optimize_listing": {"latency_ms": 9000}})
+    assert profile.optimize_listing.latency_ms == 9000
+    assert profile.optimize_listing.jitter_ms == MockProfile().optimize_listing.jitter_ms
+
+
+def test_mock_shopify_graphql_serves_usage_subscription():
+    client = TestClient(create_mock_app(_fast_profile()))
+    response = client.post(
+        "/test.myshopify.com/admin/api/2024-10/graphql.json",
+        json={"query": "query { currentAppInstallation { activeSubscriptions { id } } }"},
+    )
+    subscriptions = response.json()["data"]["currentAppInstallation"]["activeSubscriptions"]
+    assert subscriptions[0]["lineItems"][0]["plan"]["pricingDetails"]["__typename"] == "AppUsagePricing"
+
+
+def test_mock_injects_throttling():
+    client = TestClient(create_mock_app(_fast_profile(shopify_rest={"throttle_rate": 1.0, "retry_after_s": 2})))
+    response = client.get("/test.myshopify.com/admin/api/2024-10/products.json")
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "2"
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import pathlib
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from bulk_jobs import BulkJobError, BulkJobRunner, BulkJobStore, JobAlreadyActive, StopJob, file_format_for, parse_rows
+
+
+def _runner(tmp_path, process_row, **options):
+    return BulkJobRunner(BulkJobStore(tmp_path / "bulk.sqlite3"), process_row, **options)
+
+
+def test_parse_rows_reads_csv_and_jsonl(tmp_path):
+    csv_path = tmp_path / "rows.csv"
+    csv_path.write_text('\ufeffDescription,Image_URL\n"Blue mug, 12oz",https://cdn.example.com/mug.jpg\nRed scarf,\n')
+    jsonl_path = tmp_path / "rows.jsonl"
+    jsonl_path.write_text(json.dumps({"description": "Lamp"}) + "\n\n" + json.dumps({"description": " Desk "}) + "\n")
+
+    assert [(row.number, row.description, row.image_url) for row in parse_rows(csv_path, "csv")] == [
+        (1, "Blue mug, 12oz", "https://cdn.example.com/mug.jpg"),
+        (2, "Red scarf", None),
+    ]
+    assert [(row.number, row.description) for row in parse_rows(jsonl_path, "jsonl")] == [(1, "Lamp"), (3, "Desk")]
+    assert file_format_for("inventory.NDJSON") == "jsonl"
+    with pytest.raises(BulkJobError):
+        file_format_for("inventory.xlsx")
+
+
+def test_job_processes_rows_with_bounded_workers(tmp_path):
+    path = tmp_path / "upload.jsonl"
+    path.write_text("".join(json.dumps({"description": f"item {index}"}) + "\n" for index in range(10)) + "{}\n")
+    in_flight = peak = 0
+
+    async def process_row(user_id, row):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return {"listing_id": f"listing-{row.number}", "optimized_description": row.description.upper()}
+
+    async def scenario():
+        runner = _runner(tmp_path, process_row, workers=3)
+        job = runner.start("user-1", path, "jsonl", "upload.jsonl")
+        await runner.wait(job["id"])
+        return runner.store, job["id"]
+
+    store, job_id = asyncio.run(scenario())
+    job = store.get_job(job_id)
+    assert (job["status"], job["total_rows"], job["succeeded"], job["failed"]) == ("completed", 11, 10, 1)
+    assert peak == 3
+    results = store.results_after(job_id)
+    assert {result["optimized_description"] for result in results if result["status"] == "succeeded"} == {
+        f"ITEM {index}" for index in range(10)
+    }
+    assert [result["error"] for result in results if result["status"] == "failed"] == ["Missing description"]
+    assert store.results_after(job_id, after_seq=results[-1]["seq"]) == []
+    assert not path.exists()
+
+
+def test_stop_job_skips_the_remaining_rows(tmp_path):
+    path = tmp_path / "upload.csv"
+    path.write_text("description\n" + "".join(f"item {index}\n" for index in range(20)))
+    processed = []
+
+    async def process_row(user_id, row):
+        if len(processed) == 2:
+            raise StopJob("Free tier limit reached (2 listings)")
+        processed.append(row.number)
+        return {"listing_id": str(row.number)}
+
+    async def scenario():
+        runner = _runner(tmp_path, process_row, workers=1)
+        job = runner.start("user-1", path, "csv")
+        await runner.wait(job["id"])
+        return runner.store.get_job(job["id"]), runner.store.results_after(job["id"])
+
+    job, results = asyncio.run(scenario())
+    assert job["status"] == "stopped"
+    assert job["succeeded"] == 2
+    assert results[2]["error"] == "Free tier limit reached (2 listings)"
+    assert {result["status"] for result in results[3:]} <= {"skipped"}
+    assert job["total_rows"] < 20
+
+
+def test_malformed_upload_fails_the_job(tmp_path):
+    path = tmp_path / "upload.csv"
+    path.write_text("title,price\nMug,10\n")
+
+    async def process_row(user_id, row):
+        raise AssertionError("not reached")
+
+    async def scenario():
+        runner = _runner(tmp_path, process_row)
+        job = runner.start("user-1", path, "csv")
+        await runner.wait(job["id"])
+        return runner.store.get_job(job["id"])
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "failed"
+    assert job["error"] == "CSV needs a description column"
+
+
+def test_only_one_active_job_per_user_is_created(tmp_path):
+    store = BulkJobStore(tmp_path / "bulk.sqlite3")
+    others = [BulkJobStore(tmp_path / "bulk.sqlite3") for _ in range(4)]
+
+    def create(candidate):
+        try:
+            return candidate.create_job("user-1", "upload.csv", "csv")["id"]
+        except JobAlreadyActive:
+            return None
+
+    with ThreadPoolExecutor(max_workers=len(others)) as pool:
+        created = [job_id for job_id in pool.map(create, others) if job_id]
+    assert len(created) == 1
+    with pytest.raises(JobAlreadyActive):
+        store.create_job("user-1", "again.csv", "csv")
+    assert store.create_job("user-2", "upload.csv", "csv")["status"] == "queued"
+
+    store.update_job(created[0], status="completed")
+    assert store.create_job("user-1", "again.csv", "csv")["status"] == "queued"
@@ -0,0 +1,191 @@
+import asyncio
+import pathlib
+import sys
+
+import httpx
+import pytest
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from bench.mock_upstreams import MockProfile, create_mock_app
+from catalog_export import CatalogExporter, CatalogExportError, CatalogIndex
+
+SHOP = "bulk.myshopify.com"
+
+
+def _mock_upstream(**overrides):
+    profile = {"shopify_graphql": {"latency_ms": 0, "jitter_ms": 0}, "catalog_products": 120}
+    profile.update(overrides)
+    return create_mock_app(MockProfile.from_dict(profile))
+
+
+def _exporter(tmp_path, mock_app, **options):
+    transport = httpx.ASGITransport(app=mock_app)
+    phases = []
+
+    async def graphql(shop, access_token, query, variables=None, phase=None):
+        phases.append(phase)
+        async with httpx.AsyncClient(transport=transport, base_url="http://upstream") as client:
+            response = await client.post(
+                f"/{shop}/admin/api/2024-10/graphql.json", json={"query": query, "variables": variables or {}}
+            )
+        return response.json()
+
+    async def access_token(shop):
+        return f"token-{shop}"
+
+    options.setdefault("poll_interval", 0.001)
+    exporter = CatalogExporter(
+        CatalogIndex(tmp_path / "catalog.sqlite3"),
+        graphql,
+        access_token,
+        http_client=lambda: httpx.AsyncClient(transport=transport),
+        **options,
+    )
+    exporter.phases = phases
+    return exporter
+
+
+def test_export_streams_bulk_result_into_index(tmp_path):
+    async def scenario():
+        exporter = _exporter(tmp_path, _mock_upstream(), batch_size=50)
+        export = await exporter.start(SHOP)
+        assert export["status"] == "submitted"
+        await exporter.wait(export["id"])
+        return exporter, exporter.index.get_export(export["id"])
+
+    exporter, export = asyncio.run(scenario())
+    assert export["status"] == "completed"
+    assert (export["products"], export["images"], export["object_count"]) == (120, 360, 480)
+    assert exporter.phases.count("bulk_export") == 1
+    assert exporter.phases.count("bulk_export_poll") == 3
+
+    first_page = exporter.index.products(SHOP, limit=2)
+    assert [product["id"] for product in first_page] == ["gid://shopify/Product/1000", "gid://shopify/Product/1001"]
+    assert [image["url"] for image in first_page[0]["images"]] == [
+        f"https://cdn.shopify.com/s/files/0-{view}.jpg" for view in range(3)
+    ]
+    next_page = exporter.index.products(SHOP, after=first_page[-1]["id"], limit=2)
+    assert next_page[0]["id"] == "gid://shopify/Product/1002"
+
+
+def test_reexport_drops_products_that_are_gone(tmp_path):
+    mock_app = _mock_upstream(catalog_products=10)
+
+    async def scenario():
+        exporter = _exporter(tmp_path, mock_app)
+        await exporter.wait((await exporter.start(SHOP))["id"])
+        mock_app.state.profile.catalog_products = 4
+        await exporter.wait((await exporter.start(SHOP))["id"])
+        return exporter
+
+    exporter = asyncio.run(scenario())
+    products = exporter.index.products(SHOP, limit=50)
+    assert len(products) == 4
+    assert all(len(product["images"]) == 3 for product in products)
+
+
+def test_failed_bulk_operation_marks_export_failed(tmp_path):
+    async def graphql(shop, access_token, query, variables=None, phase=None):
+        if phase == "bulk_export":
+            return {"data": {"bulkOperationRunQuery": {"bulkOperation": {"id": "gid://shopify/BulkOperation/9"}}}}
+        return {"data": {"node": {"id": "gid://shopify/BulkOperation/9", "status": "FAILED", "errorCode": "TIMEOUT"}}}
+
+    async def access_token(shop):
+        return "token"
+
+    async def scenario():
+        exporter = CatalogExporter(CatalogIndex(tmp_path / "catalog.sqlite3"), graphql, access_token, poll_interval=0)
+        export = await exporter.start(SHOP)
+        await exporter.wait(export["id"])
+        return exporter.index.get_export(export["id"])
+
+    export = asyncio.run(scenario())
+    assert export["status"] == "failed"
+    assert "TIMEOUT" in export["error"]
+    assert export["finished_at"] is not None
+
+
+def test_rejected_bulk_operation_raises(tmp_path):
+    async def graphql(shop, access_token, query, variables=None, phase=None):
+        message = "A bulk query operation for this app and shop is already in progress."
+        return {"data": {"bulkOperationRunQuery": {"bulkOperation": None, "userErrors": [{"message": message}]}}}
+
+    async def access_token(shop):
+        return "token"
+
+    async def scenario():
+        exporter = CatalogExporter(CatalogIndex(tmp_path / "catalog.sqlite3"), graphql, access_token)
+        await exporter.start(SHOP)
+
+    with pytest.raises(CatalogExportError, match="already in progress"):
+        asyncio.run(scenario())
+
+
+def test_unfinished_export_resumes_after_restart(tmp_path):
+    mock_app = _mock_upstream(catalog_products=5, bulk_running_polls=100)
+
+    async def first_process():
+        exporter = _exporter(tmp_path, mock_app)
+        export = await exporter.start(SHOP)
+        await asyncio.sleep(0.01)
+        await exporter.close()
+        return export["id"]
+
+    export_id = asyncio.run(first_process())
+    assert CatalogIndex(tmp_path / "catalog.sqlite3").get_export(export_id)["status"] in ("submitted", "running")
+    mock_app.state.profile.bulk_running_polls = 0
+
+    async def second_process():
+        exporter = _exporter(tmp_path, mock_app)
+        assert exporter.resume() == 1
+        # A second start while the export is still running returns it instead of submitting another.
+        assert (await exporter.start(SHOP))["id"] == export_id
+        await exporter.wait(export_id)
+        return exporter.index.get_export(export_id)
+
+    export = asyncio.run(second_process())
+    assert export["status"] == "completed"
+    assert export["products"] == 5
+
+
+def test_only_one_worker_claims_an_unfinished_export(tmp_path):
+    mock_app = _mock_upstream(catalog_products=3, bulk_running_polls=100)
+
+    async def scenario():
+        crashed = _exporter(tmp_path, mock_app)
+        export = await crashed.start(SHOP)
+        # Simulate a crash: the task dies without releasing its lease, which then lapses.
+        for task in list(crashed._tasks.values()):
+            task.cancel()
+        await asyncio.sleep(0)
+        crashed.index.update_export(export["id"], lease_expires_at=0)
+
+        workers = [_exporter(tmp_path, mock_app) for _ in range(3)]
+        claimed = [worker.resume() for worker in workers]
+        mock_app.state.profile.bulk_running_polls = 0
+        for worker in workers:
+            await worker.wait(export["id"])
+        return claimed, workers[0].index.get_export(export["id"])
+
+    claimed, export = asyncio.run(scenario())
+    assert sorted(claimed) == [0, 0, 1]
+    assert export["status"] == "completed"
+    assert export["products"] == 3
+
+
+def test_deleting_the_shop_stops_a_running_export(tmp_path):
+    mock_app = _mock_upstream(catalog_products=5, bulk_running_polls=3)
+
+    async def scenario():
+        exporter = _exporter(tmp_path, mock_app)
+        export = await exporter.start(SHOP)
+        # Another worker handles the uninstall webhook, so this exporter's task is not cancelled.
+        CatalogIndex(tmp_path / "catalog.sqlite3").delete_shop(SHOP)
+        await exporter.wait(export["id"])
+        return exporter.index, export["id"]
+
+    index, export_id = asyncio.run(scenario())
+    assert index.get_export(export_id) is None
+    assert index.products(SHOP) == []
@@ -0,0 +1,63 @@
+import asyncio
+import json
+import pathlib
+import sys
+from types import SimpleNamespace
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from description_batcher import DescriptionBatcher
+from gemini_client import GeminiClient
+
+
+class FakeModel:
+    def __init__(self, batch_reply=None):
+        self.batch_reply = batch_reply
+        self.calls = []
+
+    async def generate_content_async(self, contents, request_options=None, generation_config=None):
+        self.calls.append((contents, generation_config))
+        if generation_config is None:
+            return SimpleNamespace(text=f"single:{contents}")
+        prompts = json.loads(contents.split("\n\n", 1)[1])
+        reply = self.batch_reply(prompts) if self.batch_reply else [f"batched:{prompt}" for prompt in prompts]
+        return SimpleNamespace(text=json.dumps(reply) if not isinstance(reply, str) else reply)
+
+
+def _batcher(model, **options):
+    client = GeminiClient(models=["flash"], factory=lambda name: model)
+    return DescriptionBatcher(client, "flash", lambda text: f"describe {text}", **options)
+
+
+def test_concurrent_requests_share_one_call():
+    model = FakeModel()
+    batcher = _batcher(model, max_batch_size=4, max_wait_seconds=0.05)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.generate(f"item {index}") for index in range(6)))
+
+    results = asyncio.run(scenario())
+    assert results == [f"batched:describe item {index}" for index in range(6)]
+    # A full batch of four goes at once; the remaining two after the wait.
+    assert len(model.calls) == 2
+    assert model.calls[0][1]["response_mime_type"] == "application/json"
+
+
+def test_lone_request_is_sent_as_a_plain_call():
+    model = FakeModel()
+    batcher = _batcher(model, max_wait_seconds=0.001)
+
+    assert asyncio.run(batcher.generate("lamp")) == "single:describe lamp"
+    assert model.calls[0][1] is None
+
+
+def test_unusable_batch_reply_falls_back_to_single_calls():
+    model = FakeModel(batch_reply=lambda prompts: ["only one"])
+    batcher = _batcher(model, max_batch_size=3, max_wait_seconds=0.05)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.generate(name) for name in ("mug", "scarf", "lamp")))
+
+    assert asyncio.run(scenario()) == ["single:describe mug", "single:describe scarf", "single:describe lamp"]
+    assert len(model.calls) == 4
@@ -0,0 +1,66 @@
+import asyncio
+import pathlib
+import sys
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from description_cache import DESCRIPTION_CACHE_REQUESTS, DescriptionCache, description_cache_key
+from shared_state import SQLiteState
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_key_folds_whitespace_and_case_but_not_model_or_prompt():
+    key = description_cache_key("  Vintage   Leather\nJacket ", "flash", "v1")
+    assert key == description_cache_key("vintage leather jacket", "flash", "v1")
+    assert key != description_cache_key("vintage leather jacket", "pro", "v1")
+    assert key != description_cache_key("vintage leather jacket", "flash", "v2")
+    assert key != description_cache_key("vintage leather coat", "flash", "v1")
+
+
+def test_memory_tier_is_lru_bounded():
+    cache = DescriptionCache(max_entries=2)
+    cache.set("a", "A")
+    cache.set("b", "B")
+    assert cache.get("a") == "A"
+    cache.set("c", "C")
+    assert cache.get("b") is None
+    assert cache.get("a") == "A" and cache.get("c") == "C"
+    assert cache.hits == 3 and cache.misses == 1
+    assert cache.hit_rate == 0.75
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = DescriptionCache(ttl_seconds=60, clock=clock)
+    cache.set("a", "A")
+    clock.now += 61
+    assert cache.get("a") is None
+
+
+def test_persistent_tier_survives_restart_and_promotes(tmp_path):
+    path = tmp_path / "descriptions.sqlite3"
+    DescriptionCache(store=SQLiteState(path)).set("k", "Generated copy")
+    restarted = DescriptionCache(store=SQLiteState(path))
+    before = DESCRIPTION_CACHE_REQUESTS.value(result="persistent_hit")
+    assert restarted.get("k") == "Generated copy"
+    assert DESCRIPTION_CACHE_REQUESTS.value(result="persistent_hit") == before + 1
+    memory_hits = DESCRIPTION_CACHE_REQUESTS.value(result="memory_hit")
+    assert restarted.get("k") == "Generated copy"
+    assert DESCRIPTION_CACHE_REQUESTS.value(result="memory_hit") == memory_hits + 1
+
+
+def test_async_access_reads_and_writes_the_persistent_tier(tmp_path):
+    path = tmp_path / "descriptions.sqlite3"
+    asyncio.run(DescriptionCache(store=SQLiteState(path)).aset("k", "Generated copy"))
+    restarted = DescriptionCache(store=SQLiteState(path))
+    assert asyncio.run(restarted.aget("k")) == "Generated copy"
+    assert asyncio.run(restarted.aget("missing")) is None
+    assert restarted.hits == 1 and restarted.misses == 1
@@ -0,0 +1,143 @@
+import asyncio
+import pathlib
+import sys
+
+import pytest
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from fair_queue import QUEUE_DEPTH, FairScheduler, Overloaded, parse_weights
+
+
+def _scheduler(**overrides):
+    options = {"global_limit": 1, "shop_limit": 1, "max_queue_depth": 10, "max_shop_queue_depth": 10}
+    options.update(overrides)
+    return FairScheduler(**options)
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_admits_immediately_under_capacity():
+    async def scenario():
+        scheduler = _scheduler(global_limit=2, shop_limit=2)
+        first, second = scheduler.admit("a"), scheduler.admit("a")
+        assert first.granted and second.granted
+        third = scheduler.admit("a")
+        assert not third.granted and scheduler.queue_depth == 1
+        first.close()
+        assert third.granted and scheduler.queue_depth == 0
+
+    _run(scenario())
+
+
+def test_light_shop_is_not_stuck_behind_heavy_backlog():
+    async def scenario():
+        scheduler = _scheduler(global_limit=1, shop_limit=1)
+        running = scheduler.admit("heavy")
+        heavy = [scheduler.admit("heavy") for _ in range(5)]
+        light = scheduler.admit("light")
+        order = []
+        current = running
+        for _ in range(6):
+            current.close()
+            current = next(item for item in heavy + [light] if item.granted and item not in order)
+            order.append(current)
+        assert order.index(light) <= 1
+
+    _run(scenario())
+
+
+def test_shop_cap_lets_other_shops_use_free_slots():
+    async def scenario():
+        scheduler = _scheduler(global_limit=4, shop_limit=1)
+        scheduler.admit("a")
+        queued = scheduler.admit("a")
+        other = scheduler.admit("b")
+        assert not queued.granted
+        assert other.granted
+
+    _run(scenario())
+
+
+def test_weights_scale_share_of_slots():
+    async def scenario():
+        scheduler = _scheduler(global_limit=1, shop_limit=1, weights={"vip": 3.0})
+        current = scheduler.admit("idle")
+        waiting = [scheduler.admit(shop) for shop in ("vip", "std") * 4]
+        served = []
+        for _ in range(len(waiting)):
+            current.close()
+            current = next(item for item in waiting if item.granted and item not in served)
+            served.append(current)
+        assert [item.shop for item in served[:4]].count("vip") >= 3
+        assert "std" in [item.shop for item in served[:5]]
+
+    _run(scenario())
+
+
+def test_sheds_load_when_backlog_is_full():
+    async def scenario():
+        scheduler = _scheduler(max_queue_depth=2, max_shop_queue_depth=1)
+        scheduler.admit("a")
+        scheduler.admit("a")
+        with pytest.raises(Overloaded) as shop_full:
+            scheduler.admit("a")
+        scheduler.admit("b")
+        with pytest.raises(Overloaded) as queue_full:
+            scheduler.admit("c")
+        assert shop_full.value.reason == "shop_queue_full"
+        assert queue_full.value.reason == "queue_full"
+        assert queue_full.value.retry_after >= 1
+
+    _run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = _scheduler()
+        holder = scheduler.admit("a")
+        waiter = scheduler.admit("cancel-shop")
+
+        async def wait():
+            async with waiter:
+                pass
+
+        task = asyncio.create_task(wait())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert scheduler.queue_depth == 0
+        assert QUEUE_DEPTH.value(shop="cancel-shop") == 0
+        holder.close()
+        assert scheduler.in_flight == 0
+
+    _run(scenario())
+
+
+def test_async_context_waits_for_slot_and_releases():
+    async def scenario():
+        scheduler = _scheduler()
+        holder = scheduler.admit("a")
+        entered = []
+
+        async def worker():
+            async with scheduler.admit("b"):
+                entered.append("b")
+
+        task = asyncio.create_task(worker())
+        await asyncio.sleep(0)
+        assert entered == []
+        holder.close()
+        await task
+        assert entered == ["b"]
+        assert scheduler.in_flight == 0
+
+    _run(scenario())
+
+
+def test_parse_weights_ignores_malformed_pairs():
+    assert parse_weights("a.myshopify.com=2, b.myshopify.com=x,c=0,=3,d=0.5") == {"a.myshopify.com": 2.0, "d": 0.5}
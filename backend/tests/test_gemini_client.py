@@ -0,0 +1,151 @@
+import asyncio
+import pathlib
+import sys
+
+import pytest
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from gemini_client import GeminiClient
+
+
+class FakeModel:
+    def __init__(self, name, delay=0.0):
+        self.name = name
+        self.delay = delay
+        self.in_flight = 0
+        self.peak = 0
+        self.request_options = []
+
+    async def generate_content_async(self, contents, request_options=None):
+        self.in_flight += 1
+        self.peak = max(self.peak, self.in_flight)
+        self.request_options.append(request_options)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        return f"{self.name}:{contents}"
+
+
+def _client(delay=0.0, **options):
+    built = []
+
+    def factory(name):
+        built.append(FakeModel(name, delay))
+        return built[-1]
+
+    return GeminiClient(factory=factory, **options), built
+
+
+def test_models_are_built_once_and_reused():
+    client, built = _client(models=["flash"])
+    assert len(built) == 1
+
+    async def scenario():
+        return await asyncio.gather(client.generate("flash", "a"), client.generate("flash", "b"))
+
+    assert asyncio.run(scenario()) == ["flash:a", "flash:b"]
+    assert len(built) == 1
+    assert built[0].request_options[0] == {"timeout": 60.0}
+
+
+def test_concurrency_is_bounded_and_loop_stays_responsive():
+    client, built = _client(delay=0.05, models=["flash"], max_concurrency=2)
+
+    async def scenario():
+        ticks = 0
+
+        async def heartbeat():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.005)
+
+        beat = asyncio.create_task(heartbeat())
+        await asyncio.gather(*(client.generate("flash", index) for index in range(6)))
+        beat.cancel()
+        return ticks
+
+    assert asyncio.run(scenario()) >= 10
+    assert built[0].peak == 2
+
+
+def test_timeout_covers_queueing_and_frees_the_slot():
+    client, built = _client(delay=0.2, models=["flash"], max_concurrency=1, timeout_seconds=0.05)
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await client.generate("flash", "slow")
+        built[0].delay = 0.0
+        return await client.generate("flash", "fast")
+
+    assert asyncio.run(scenario()) == "flash:fast"
+
+
+class FakeChunk:
+    def __init__(self, text):
+        self._text = text
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise ValueError("no text parts")
+        return self._text
+
+
+class FakeStream:
+    def __init__(self, texts, delay):
+        self._texts = list(texts)
+        self._delay = delay
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._texts:
+            raise StopAsyncIteration
+        await asyncio.sleep(self._delay)
+        return FakeChunk(self._texts.pop(0))
+
+
+class FakeStreamingModel:
+    def __init__(self, texts, delay=0.0):
+        self.texts = texts
+        self.delay = delay
+        self.calls = []
+
+    async def generate_content_async(self, contents, stream=False, request_options=None):
+        self.calls.append((contents, stream))
+        return FakeStream(self.texts, self.delay)
+
+
+def test_stream_yields_chunk_text_and_releases_the_slot():
+    model = FakeStreamingModel(["Hand", "made ", None, "mug"])
+    client = GeminiClient(models=["flash"], max_concurrency=1, factory=lambda name: model)
+
+    async def scenario():
+        first = [text async for text in client.stream("flash", "prompt")]
+        # An abandoned stream must free its slot too.
+        partial = client.stream("flash", "again")
+        await partial.__anext__()
+        await partial.aclose()
+        model.texts = ["ok"]
+        return first, [text async for text in client.stream("flash", "last", timeout=0.5)]
+
+    first, last = asyncio.run(scenario())
+    assert first == ["Hand", "made ", "mug"]
+    assert last == ["ok"]
+    assert model.calls[0] == ("prompt", True)
+
+
+def test_stream_times_out_waiting_for_a_chunk():
+    model = FakeStreamingModel(["slow"], delay=0.2)
+    client = GeminiClient(models=["flash"], factory=lambda name: model, timeout_seconds=0.05)
+
+    async def scenario():
+        return [text async for text in client.stream("flash", "prompt")]
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(scenario())
@@ -0,0 +1,154 @@
+import pathlib
+import re
+import sys
+import uuid
+
+import pytest
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from listing_history import InvalidHistoryQuery, decode_cursor, encode_cursor, fetch_page, listing_image_response
+from storage import LocalStore
+
+_KEYSET = re.compile(r'^created_at\.lt\."(?P<at>[^"]+)",and\(created_at\.eq\."(?P=at)",id\.lt\.(?P<id>[0-9a-f-]+)\)$')
+
+
+class FakeQuery:
+    """Applies the PostgREST calls the listing queries make to in-memory rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.columns = None
+        self.filters = []
+        self.sort = []
+        self.count = None
+
+    def select(self, columns):
+        self.columns = columns.split(",")
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row[column] == value)
+        return self
+
+    def or_(self, expression):
+        # Only the keyset filter is supported: anything else fails the test
+        match = _KEYSET.match(expression)
+        assert match, expression
+        at, last_id = match["at"], match["id"]
+        self.filters.append(lambda row: row["created_at"] < at or (row["created_at"] == at and row["id"] < last_id))
+        return self
+
+    def order(self, column, desc=False):
+        self.sort.append((column, desc))
+        return self
+
+    def limit(self, count):
+        self.count = count
+        return self
+
+    def execute(self):
+        rows = [row for row in self.rows if all(check(row) for check in self.filters)]
+        for column, desc in reversed(self.sort):
+            rows.sort(key=lambda row: row[column], reverse=desc)
+        rows = rows[: self.count]
+        return type("Result", (), {"data": [{column: row[column] for column in self.columns} for row in rows]})
+
+
+class FakeSupabase:
+    def __init__(self, rows):
+        self.rows = [{**row, "has_image": row.get("optimized_image_url") is not None} for row in rows]
+        self.queries = []
+
+    def table(self, name):
+        assert name == "listings"
+        query = FakeQuery(self.rows)
+        self.queries.append(query)
+        return query
+
+
+def _listing(created_at, image=None, user_id="user-1"):
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "created_at": created_at,
+        "original_description": "mug",
+        "optimized_description": "A fine mug",
+        "optimized_image_url": image,
+    }
+
+
+def test_cursor_round_trips_and_rejects_tampering():
+    listing = _listing("2024-11-21T10:00:00+00:00")
+    assert decode_cursor(encode_cursor(listing)) == (listing["created_at"], listing["id"])
+    bad_cursors = [
+        "not-base64!",
+        encode_cursor({"created_at": "yesterday", "id": listing["id"]}),
+        encode_cursor({"created_at": listing["created_at"], "id": "1),id.gt.(0"}),
+    ]
+    for bad in bad_cursors:
+        with pytest.raises(InvalidHistoryQuery):
+            decode_cursor(bad)
+
+
+def test_pages_cover_listings_created_at_the_same_instant_exactly_once():
+    same_instant = "2024-11-21T10:00:00+00:00"
+    rows = [_listing(same_instant) for _ in range(5)] + [_listing("2024-11-20T09:00:00+00:00") for _ in range(2)]
+    rows.append(_listing(same_instant, user_id="user-2"))
+    client = FakeSupabase(rows)
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = fetch_page(client, "user-1", 2, cursor)
+        seen += [row["id"] for row in page]
+        if cursor is None:
+            break
+    own = [row for row in rows if row["user_id"] == "user-1"]
+    assert seen == [row["id"] for row in sorted(own, key=lambda row: (row["created_at"], row["id"]), reverse=True)]
+    assert len(client.queries) == 4
+
+
+def test_default_projection_leaves_images_out_and_links_them():
+    with_image = _listing("2024-11-21T10:00:00+00:00", image="data:image/png;base64,AAAA")
+    client = FakeSupabase([with_image, _listing("2024-11-20T10:00:00+00:00")])
+    page, _ = fetch_page(client, "user-1", 10)
+    assert "optimized_image_url" not in client.queries[0].columns
+    assert [set(row) for row in page] == [
+        {"id", "created_at", "original_description", "optimized_description", "image_url"}
+    ] * 2
+    assert page[0]["image_url"] == f"/api/listings/{page[0]['id']}/image"
+    assert page[1]["image_url"] is None
+
+    page, _ = fetch_page(client, "user-1", 10, fields="optimized_image_url")
+    assert page[0]["optimized_image_url"] == "data:image/png;base64,AAAA"
+    with pytest.raises(InvalidHistoryQuery):
+        fetch_page(client, "user-1", 10, fields="user_id")
+
+
+def test_image_endpoint_redirects_stored_results_and_serves_legacy_bytes(tmp_path):
+    store = LocalStore(tmp_path, base_url="/api/results", secret="s")
+    key = store.put(b"png-bytes", "image/png").key
+    stored = _listing("2024-11-21T10:00:00+00:00", image=key)
+    legacy = _listing("2024-11-20T10:00:00+00:00", image="data:image/png;base64,AAAA")
+    client = FakeSupabase([stored, legacy])
+
+    redirect = listing_image_response(client, "user-1", stored["id"], store, 3600)
+    assert redirect.status_code == 307
+    assert redirect.headers["location"].startswith(f"/api/results/{key}?expires=")
+    assert redirect.headers["cache-control"] == "private, max-age=1800"
+
+    inline = listing_image_response(client, "user-1", legacy["id"], store, 3600)
+    assert (inline.status_code, inline.body, inline.media_type) == (200, b"\x00\x00\x00", "image/png")
+    assert inline.headers["etag"] == f'"{legacy["id"]}"'
+    assert "immutable" in inline.headers["cache-control"]
+
+    queries = len(client.queries)
+    etag = inline.headers["etag"]
+    not_modified = listing_image_response(client, "user-1", legacy["id"], store, 3600, if_none_match=etag)
+    assert (not_modified.status_code, not_modified.body) == (304, b"")
+    assert len(client.queries) == queries
+
+    for user_id, listing_id in (("user-2", legacy["id"]), ("user-1", "not-a-uuid"), ("user-1", str(uuid.uuid4()))):
+        with pytest.raises(LookupError):
+            listing_image_response(client, user_id, listing_id, store, 3600)
@@ -0,0 +1,108 @@
+import pathlib
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from listing_quota import ListingQuota, QuotaExceeded
+
+
+class FakeSupabase:
+    """Answers the quota RPCs the way the SQL functions do, for one profile."""
+
+    def __init__(self, is_premium=False, used=0, limit=5):
+        self.profile = {"is_premium": is_premium, "listings_used": used, "listings_limit": limit}
+        self.reservations = {}
+        self.listings = []
+        self.calls = []
+
+    def rpc(self, name, params):
+        self.calls.append(name)
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=getattr(self, name)(**params)))
+
+    def reserve_listing_quota(self, p_user_id, p_ttl_seconds):
+        profile = self.profile
+        if profile["is_premium"]:
+            return [{"allowed": True, "is_premium": True, "reservation_id": None, "remaining": None, **profile}]
+        if profile["listings_used"] >= profile["listings_limit"]:
+            return [{"allowed": False, "is_premium": False, "reservation_id": None, "remaining": 0, **profile}]
+        profile["listings_used"] += 1
+        reservation_id = f"r{len(self.reservations)}"
+        self.reservations[reservation_id] = "reserved"
+        remaining = profile["listings_limit"] - profile["listings_used"]
+        return [{"allowed": True, "is_premium": False, "reservation_id": reservation_id, "remaining": remaining,
+                 **profile}]
+
+    def save_listing_with_quota(self, p_user_id, p_reservation_id, p_listing):
+        if p_reservation_id is None:
+            self.profile["listings_used"] += 1
+        elif self.reservations.get(p_reservation_id) != "reserved":
+            raise RuntimeError(f"listing quota reservation {p_reservation_id} is no longer held")
+        else:
+            self.reservations[p_reservation_id] = "committed"
+        self.listings.append(p_listing)
+
+    def refund_listing_quota(self, p_user_id, p_reservation_id):
+        if self.reservations.get(p_reservation_id) != "reserved":
+            return False
+        self.reservations[p_reservation_id] = "refunded"
+        self.profile["listings_used"] -= 1
+        return True
+
+
+def test_reserve_save_and_refund_track_usage():
+    client = FakeSupabase(used=3, limit=5)
+    quota = ListingQuota(client)
+
+    first = quota.reserve("user-1")
+    second = quota.reserve("user-1")
+    assert (first.remaining, second.remaining) == (1, 0)
+    with pytest.raises(QuotaExceeded) as excinfo:
+        quota.reserve("user-1")
+    assert excinfo.value.limit == 5
+
+    quota.save(first, {"id": "listing-1"})
+    quota.refund(second)
+    quota.refund(second)
+    assert client.profile["listings_used"] == 4
+    assert quota.reserve("user-1").remaining == 0
+
+
+def test_premium_status_is_cached_briefly():
+    now = [0.0]
+    client = FakeSupabase(is_premium=True)
+    quota = ListingQuota(client, premium_ttl_seconds=60, clock=lambda: now[0])
+
+    reservations = [quota.reserve("user-1") for _ in range(3)]
+    assert all(reservation.unlimited for reservation in reservations)
+    assert client.calls == ["reserve_listing_quota"]
+
+    quota.save(reservations[0], {"id": "listing-1"})
+    quota.refund(reservations[1])
+    assert client.profile["listings_used"] == 1
+    assert client.calls == ["reserve_listing_quota", "save_listing_with_quota"]
+
+    client.profile["is_premium"] = False
+    now[0] = 61.0
+    assert not quota.reserve("user-1").unlimited
+
+
+def test_save_commits_the_slot_with_the_listing_or_not_at_all():
+    client = FakeSupabase(used=0, limit=5)
+    quota = ListingQuota(client)
+
+    saved = quota.reserve("user-1")
+    quota.save(saved, {"id": "listing-1"})
+    quota.refund(saved)
+    assert client.listings == [{"id": "listing-1"}]
+    assert client.profile["listings_used"] == 1
+
+    refunded = quota.reserve("user-1")
+    quota.refund(refunded)
+    with pytest.raises(RuntimeError):
+        quota.save(refunded, {"id": "listing-2"})
+    assert client.listings == [{"id": "listing-1"}]
+    assert client.profile["listings_used"] == 1
@@ -0,0 +1,45 @@
+import asyncio
+import pathlib
+import sys
+import time
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from listing_stages import generate_listing, run_stages
+
+
+async def _after(seconds, result):
+    await asyncio.sleep(seconds)
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def test_failed_stage_keeps_the_other_stages_result():
+    results, timings = asyncio.run(
+        run_stages({"description": _after(0.01, RuntimeError("quota")), "image": _after(0.02, "results/a.png")})
+    )
+    assert isinstance(results["description"], RuntimeError)
+    assert results["image"] == "results/a.png"
+    assert set(timings) == {"description", "image"}
+
+    description, image_key, _ = asyncio.run(
+        generate_listing("mug", lambda text: _after(0, "A fine mug"), str.upper, _after(0, RuntimeError("no image")))
+    )
+    assert (description, image_key) == ("A fine mug", None)
+    description, image_key, _ = asyncio.run(
+        generate_listing("mug", lambda text: _after(0, RuntimeError("down")), str.upper, _after(0, "results/a.png"))
+    )
+    assert (description, image_key) == ("MUG", "results/a.png")
+
+
+def test_wall_time_is_the_slowest_stage_not_the_sum():
+    started = time.perf_counter()
+    description, image_key, timings = asyncio.run(
+        generate_listing("mug", lambda text: _after(0.2, "A fine mug"), str.upper, _after(0.2, "results/a.png"))
+    )
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    assert (description, image_key) == ("A fine mug", "results/a.png")
+    assert min(timings.values()) >= 190
+    assert elapsed_ms < sum(timings.values()) * 0.75
@@ -0,0 +1,75 @@
+import json
+import logging
+import pathlib
+import queue
+import sys
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from log_pipeline import (
+    LOG_RECORDS_DROPPED,
+    BoundedQueueHandler,
+    JsonFormatter,
+    SamplingFilter,
+    parse_sample_rates,
+)
+
+
+def _record(msg, *args, level=logging.INFO):
+    return logging.LogRecord("test", level, __file__, 1, msg, args, None)
+
+
+def test_json_formatter_extracts_event_and_fields():
+    line = JsonFormatter().format(_record("shopify_retry shop=%s status=%s delay=%.2f", "a.myshopify.com", 429, 0.6))
+    entry = json.loads(line)
+    assert entry["event"] == "shopify_retry"
+    assert entry["shop"] == "a.myshopify.com"
+    assert entry["status"] == "429"
+    assert entry["delay"] == "0.60"
+    assert entry["level"] == "INFO"
+
+
+def test_parse_sample_rates_keeps_defaults_and_clamps():
+    rates = parse_sample_rates("product_upload=0.5,bogus,billing_usage=7,bad=x")
+    assert rates["product_upload"] == 0.5
+    assert rates["billing_usage"] == 1.0
+    assert "bad" not in rates
+    assert "session_token_ok" in rates
+
+
+def test_sampling_filter_drops_and_counts_sampled_events():
+    sampler = SamplingFilter({"session_token_ok": 0.0})
+    before = LOG_RECORDS_DROPPED.value(reason="sampled")
+    assert sampler.filter(_record("session_token_ok iss=%s", "x")) is False
+    assert sampler.filter(_record("billing_usage shop=%s", "x")) is True
+    assert sampler.filter(_record("session_token_ok iss=%s", "x", level=logging.WARNING)) is True
+    assert LOG_RECORDS_DROPPED.value(reason="sampled") == before + 1
+
+
+def test_bounded_queue_handler_drops_instead_of_blocking():
+    handler = BoundedQueueHandler(queue.Queue(maxsize=1))
+    before = LOG_RECORDS_DROPPED.value(reason="queue_full")
+    handler.emit(_record("first"))
+    handler.emit(_record("second"))
+    assert handler.queue.qsize() == 1
+    assert LOG_RECORDS_DROPPED.value(reason="queue_full") == before + 1
+
+
+def test_exceptions_reach_the_json_formatter_through_the_queue():
+    log_queue = queue.Queue()
+    logger = logging.getLogger("test_log_pipeline.exc")
+    logger.propagate = False
+    logger.addHandler(BoundedQueueHandler(log_queue))
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("upload_failed shop=%s", "a.myshopify.com")
+    finally:
+        logger.handlers.clear()
+
+    entry = json.loads(JsonFormatter().format(log_queue.get_nowait()))
+    assert entry["event"] == "upload_failed"
+    assert entry["shop"] == "a.myshopify.com"
+    assert entry["message"] == "upload_failed shop=a.myshopify.com"
+    assert "ValueError: boom" in entry["exc_info"]
@@ -0,0 +1,64 @@
+import pathlib
+import sys
+
+import pytest
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from metrics import Registry
+
+
+def test_counter_renders_labels_and_help():
+    registry = Registry()
+    counter = registry.counter("demo_total", "Demo counter.", ("target",))
+    counter.inc(target="shopify_rest")
+    counter.inc(2, target="shopify_rest")
+    rendered = registry.render()
+    assert "# HELP demo_total Demo counter." in rendered
+    assert "# TYPE demo_total counter" in rendered
+    assert 'demo_total{target="shopify_rest"} 3' in rendered
+
+
+def test_counter_rejects_negative_increment():
+    registry = Registry()
+    counter = registry.counter("demo_total", "Demo counter.")
+    with pytest.raises(ValueError):
+        counter.inc(-1)
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("demo_seconds", "Demo histogram.", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, route="/a")
+    histogram.observe(0.5, route="/a")
+    histogram.observe(5.0, route="/a")
+    rendered = registry.render()
+    assert 'demo_seconds_bucket{route="/a",le="0.1"} 1' in rendered
+    assert 'demo_seconds_bucket{route="/a",le="1"} 2' in rendered
+    assert 'demo_seconds_bucket{route="/a",le="+Inf"} 3' in rendered
+    assert 'demo_seconds_count{route="/a"} 3' in rendered
+    assert 'demo_seconds_sum{route="/a"} 5.55' in rendered
+
+
+def test_gauge_track_inprogress_restores_value():
+    registry = Registry()
+    gauge = registry.gauge("demo_in_flight", "Demo gauge.", ("route",))
+    with gauge.track_inprogress(route="/a"):
+        assert gauge.value(route="/a") == 1
+    assert gauge.value(route="/a") == 0
+
+
+def test_registry_returns_existing_metric_and_rejects_shape_change():
+    registry = Registry()
+    first = registry.counter("demo_total", "Demo counter.", ("target",))
+    assert registry.counter("demo_total", "Demo counter.", ("target",)) is first
+    with pytest.raises(ValueError):
+        registry.gauge("demo_total", "Demo counter.", ("target",))
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    counter = registry.counter("demo_total", "Demo counter.", ("detail",))
+    counter.inc(detail='say "hi"\n')
+    assert 'demo_total{detail="say \\"hi\\"\\n"} 1' in registry.render()
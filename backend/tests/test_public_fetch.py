@@ -0,0 +1,62 @@
+import asyncio
+import pathlib
+import socket
+import sys
+from unittest.mock import patch
+
+import httpx
+import pytest
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from public_fetch import BlockedAddress, PublicAddressTransport, resolve_public_address
+
+
+def _resolving(*addresses):
+    async def getaddrinfo(loop, host, port, **kwargs):
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (address, port)) for address in addresses]
+
+    return patch.object(asyncio.BaseEventLoop, "getaddrinfo", getaddrinfo)
+
+
+@pytest.mark.parametrize("address", ["127.0.0.1", "10.0.0.5", "169.254.169.254", "::1", "::ffff:192.168.1.1"])
+def test_hosts_resolving_to_private_addresses_are_blocked(address):
+    with _resolving(address), pytest.raises(BlockedAddress):
+        asyncio.run(resolve_public_address("images.example.com", 443))
+
+
+def test_one_private_address_among_public_ones_blocks_the_host():
+    with _resolving("93.184.216.34", "10.0.0.5"), pytest.raises(BlockedAddress):
+        asyncio.run(resolve_public_address("images.example.com", 443))
+    with pytest.raises(BlockedAddress):
+        asyncio.run(resolve_public_address("api.localhost", 443))
+
+
+def test_transport_connects_to_the_checked_address_with_the_original_host():
+    seen = []
+
+    def handler(request):
+        seen.append((request.url.host, request.headers["host"], request.extensions["sni_hostname"]))
+        return httpx.Response(200, content=b"image")
+
+    resolutions = iter(["93.184.216.34", "127.0.0.1"])
+
+    async def resolve(host, port):
+        # A rebinding resolver: public for the first lookup, loopback afterwards
+        address = next(resolutions)
+        if address == "127.0.0.1":
+            raise BlockedAddress(f"{host} does not resolve to a public address")
+        return address
+
+    async def fetch():
+        transport = PublicAddressTransport(httpx.MockTransport(handler), resolve=resolve)
+        async with httpx.AsyncClient(transport=transport) as client:
+            response = await client.get("https://images.example.com/a.png")
+            with pytest.raises(BlockedAddress):
+                await client.get("https://images.example.com/a.png")
+        return response
+
+    response = asyncio.run(fetch())
+    assert response.content == b"image"
+    assert seen == [("93.184.216.34", "images.example.com", "images.example.com")]
@@ -0,0 +1,85 @@
+import pathlib
+import sys
+import threading
+import time
+
+import pytest
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from shared_state import InMemoryState, SQLiteState, SharedState, create_state, register_backend
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def state(request, tmp_path):
+    if request.param == "memory":
+        backend = InMemoryState()
+    else:
+        backend = SQLiteState(tmp_path / "state.sqlite3")
+    yield backend
+    backend.close()
+
+
+def test_get_set_delete_and_json(state):
+    assert state.get("k") is None
+    state.set("k", "v")
+    assert state.get("k") == "v"
+    state.set_json("doc", {"a": [1, 2]})
+    assert state.get_json("doc") == {"a": [1, 2]}
+    state.delete("k")
+    assert state.get("k") is None
+
+
+def test_ttl_expires_values(state):
+    state.set("k", "v", ttl=0.0)
+    assert state.get("k") is None
+    assert state.incr("n", ttl=0.0) == 1
+    assert state.incr("n") == 1
+
+
+def test_incr_keeps_original_expiry(state):
+    assert state.incr("n", ttl=60) == 1
+    assert state.incr("n", 4, ttl=0.0) == 5
+    assert state.get("n") == "5"
+
+
+def test_hit_window_limits_and_slides(state):
+    assert [state.hit_window("rl", 60, 2) for _ in range(3)] == [True, True, False]
+    assert state.hit_window("other", 60, 2) is True
+    time.sleep(0.02)
+    assert state.hit_window("rl", 0.01, 2) is True
+
+
+def test_sqlite_state_is_shared_between_connections(tmp_path):
+    path = tmp_path / "state.sqlite3"
+    first, second = SQLiteState(path), SQLiteState(path)
+    results = []
+
+    def worker(backend):
+        for _ in range(20):
+            results.append(backend.hit_window("shop:upload", 60, 25))
+            backend.incr("count")
+
+    threads = [threading.Thread(target=worker, args=(b,)) for b in (first, second)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 25
+    assert first.get("count") == second.get("count") == "40"
+
+
+def test_create_state_resolves_registered_backends(tmp_path):
+    assert isinstance(create_state("memory://"), InMemoryState)
+    sqlite_state = create_state(f"sqlite:///{tmp_path / 'state.sqlite3'}")
+    assert isinstance(sqlite_state, SQLiteState)
+    sqlite_state.close()
+    with pytest.raises(ValueError):
+        create_state("redis://localhost:6379/0")
+
+    class FakeRedis(InMemoryState):
+        pass
+
+    register_backend("fake", lambda url: FakeRedis())
+    assert isinstance(create_state("fake://cache"), SharedState)
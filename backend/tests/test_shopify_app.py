@@ -1,13 +1,21 @@
+import asyncio
 import base64
 from datetime import datetime, timezone
+from io import BytesIO
+import hashlib
+import hmac
 import os
 import pathlib
+import subprocess
 import sys
+import time
 
+import httpx
 import jwt
 import pytest
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
 from fastapi import HTTPException
+from fastapi.testclient import TestClient
 
 BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
 sys.path.append(str(BACKEND_DIR))
@@ -17,8 +25,10 @@ os.environ.setdefault(
     "SUPABASE_SERVICE_KEY",
     "eyJhbGciOiJIUzI1NiIsInR5cCI6IkpXVCJ9.eyJpc3MiOiJ0ZXN0In0.c2ln",
 )
+os.environ.setdefault("SHOPIFY_STATE_URL", "memory://")
 
 from shopify_app import (
+    app,
     _shop_from_host_param,
     _is_valid_shop_domain,
     _shop_from_session_token,
@@ -27,7 +37,20 @@ from shopify_app import (
     _make_oauth_state,
     _verify_oauth_state,
     _shopify_app_origin,
+    _SERVER_TIMINGS,
+    _format_server_timing,
+    _profile_signature,
+    _upstream_call,
+    _check_rate_limit,
 )
+import shopify_app
+from adaptive_limit import AIMDLimit
+from catalog_export import CatalogExporter, CatalogIndex
+from fair_queue import FairScheduler
+from shared_state import SQLiteState
+from shopify_settings import ShopifySettings
+from storage import LocalStore
+from webhook_queue import WebhookQueue
 
 
 def test_shop_from_host_param_valid_admin_url():
@@ -201,3 +224,609 @@ def test_shopify_app_origin_invalid():
 @patch("shopify_app.SHOPIFY_APP_URL", "")
 def test_shopify_app_origin_empty():
     assert _shopify_app_origin() == ""
+
+
+def test_metrics_endpoint_exposes_request_histogram():
+    client = TestClient(app)
+    assert client.get("/shopify/health").status_code == 200
+    response = client.get("/shopify/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'shopify_http_request_duration_seconds_count{method="GET",route="/shopify/health",status="200"}' in response.text
+
+
+@patch("shopify_app.SHOPIFY_METRICS_TOKEN", "scrape-token")
+def test_metrics_endpoint_requires_configured_token():
+    client = TestClient(app)
+    assert client.get("/shopify/metrics").status_code == 401
+    response = client.get("/shopify/metrics", headers={"Authorization": "Bearer scrape-token"})
+    assert response.status_code == 200
+
+
+def test_responses_carry_server_timing_header():
+    client = TestClient(app)
+    response = client.get("/shopify/health")
+    assert "total;dur=" in response.headers["server-timing"]
+
+
+def test_upstream_call_records_named_server_timing_span():
+    token = _SERVER_TIMINGS.set({})
+    try:
+        with _upstream_call("supabase_postgrest", phase="shop_lookup") as span:
+            span["status"] = 200
+        timings = _SERVER_TIMINGS.get()
+    finally:
+        _SERVER_TIMINGS.reset(token)
+    assert set(timings) == {"shop_lookup"}
+    assert _format_server_timing({"shop_lookup": 0.0125}, 0.02) == "shop_lookup;dur=12.5, total;dur=20.0"
+
+
+def test_signed_profile_request_is_captured_and_downloadable(tmp_path):
+    with patch("shopify_app.SHOPIFY_PROFILE_SECRET", "profile-secret"), patch(
+        "shopify_app.SHOPIFY_PROFILE_DIR", str(tmp_path)
+    ):
+        client = TestClient(app)
+        unsigned = client.get("/shopify/health")
+        assert "x-nudio-profile-id" not in unsigned.headers
+
+        expires = int(time.time()) + 60
+        signed = client.get(
+            "/shopify/health", headers={"X-Nudio-Profile": _profile_signature("/shopify/health", expires)}
+        )
+        profile_id = signed.headers["x-nudio-profile-id"]
+        assert (tmp_path / f"{profile_id}.prof").is_file()
+
+        for header in (
+            "nope",
+            _profile_signature(profile_id, int(time.time()) - 1),
+            _profile_signature(profile_id, int(time.time()) + 86400),
+            _profile_signature("/shopify/health", expires),
+        ):
+            forbidden = client.get(f"/shopify/debug/profiles/{profile_id}", headers={"X-Nudio-Profile": header})
+            assert forbidden.status_code == 401
+        download = client.get(
+            f"/shopify/debug/profiles/{profile_id}",
+            headers={"X-Nudio-Profile": _profile_signature(profile_id, expires)},
+        )
+        assert download.status_code == 200
+        assert download.content
+
+
+def _signed_webhook(body, secret="secret"):
+    digest = hmac.new(secret.encode("utf-8"), body, hashlib.sha256).digest()
+    return base64.b64encode(digest).decode("utf-8")
+
+
+@patch("shopify_app.SHOPIFY_API_SECRET", "secret")
+@patch("shopify_app._delete_shop_record")
+def test_shop_redact_webhook_is_queued_and_deduplicated(mock_delete, tmp_path):
+    body = b'{"shop_domain": "test.myshopify.com"}'
+    headers = {
+        "X-Shopify-Hmac-Sha256": _signed_webhook(body),
+        "X-Shopify-Shop-Domain": "test.myshopify.com",
+        "X-Shopify-Topic": "shop/redact",
+        "X-Shopify-Webhook-Id": "b54557e4-bdd9-4b37-8a5f-bf7d70bcd043",
+    }
+    queue = WebhookQueue(tmp_path / "webhooks.sqlite3")
+    with patch("shopify_app._WEBHOOK_QUEUE", queue):
+        client = TestClient(app)
+        assert client.post("/shopify/webhooks/shop/redact", content=body, headers=headers).json() == {"ok": True}
+        assert client.post("/shopify/webhooks/shop/redact", content=body, headers=headers).status_code == 200
+    mock_delete.assert_not_called()
+    assert queue.pending_count() == 1
+    assert queue.claim()[0].shop == "test.myshopify.com"
+
+
+@patch("shopify_app.SHOPIFY_API_SECRET", "secret")
+def test_webhook_with_bad_signature_is_rejected(tmp_path):
+    queue = WebhookQueue(tmp_path / "webhooks.sqlite3")
+    with patch("shopify_app._WEBHOOK_QUEUE", queue):
+        client = TestClient(app)
+        response = client.post(
+            "/shopify/webhooks/app/uninstalled",
+            content=b"{}",
+            headers={"X-Shopify-Hmac-Sha256": "bogus", "X-Shopify-Shop-Domain": "test.myshopify.com"},
+        )
+    assert response.status_code == 401
+    assert queue.pending_count() == 0
+
+
+@patch("shopify_app.RATE_LIMIT_MAX_REQUESTS", 2)
+def test_rate_limit_is_shared_through_state_backend(tmp_path):
+    # Two workers on one host open the same file; the limit applies to their combined traffic.
+    path = tmp_path / "state.sqlite3"
+    with patch("shopify_app._SHARED_STATE", SQLiteState(path)):
+        asyncio.run(_check_rate_limit("test.myshopify.com", "product_upload"))
+    with patch("shopify_app._SHARED_STATE", SQLiteState(path)):
+        asyncio.run(_check_rate_limit("test.myshopify.com", "product_upload"))
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(_check_rate_limit("test.myshopify.com", "product_upload"))
+        asyncio.run(_check_rate_limit("test.myshopify.com", "convert_heic"))
+    assert exc.value.status_code == 429
+
+
+def test_import_needs_no_credentials_and_defers_heavy_modules():
+    env = {key: value for key, value in os.environ.items() if not key.startswith("SUPABASE_")}
+    env["SHOPIFY_API_KEY"] = "from-env"
+    code = (
+        "import sys, shopify_app; "
+        "from shopify_settings import ShopifySettings; "
+        "print(shopify_app.SHOPIFY_API_KEY); "
+        "shopify_app.create_app(ShopifySettings(state_url='memory://')); "
+        "print(sorted(m for m in ('supabase', 'PIL', 'pillow_heif') if m in sys.modules))"
+    )
+    completed = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    # Importing applies defaults only; the environment is read when an app is created
+    assert completed.stdout.strip().splitlines()[-2:] == ["None", "[]"]
+
+
+@pytest.fixture
+def restore_settings():
+    yield
+    shopify_app._apply_settings(app.state.settings)
+
+
+def test_app_publishes_its_settings_when_it_starts(restore_settings, tmp_path):
+    settings = ShopifySettings(
+        supabase_url="https://factory.supabase.co",
+        supabase_service_key="key",
+        metrics_token="factory-token",
+        state_url="memory://",
+        webhook_queue_path=str(tmp_path / "webhooks.sqlite3"),
+        catalog_index_path=str(tmp_path / "catalog.sqlite3"),
+    )
+    factory_app = shopify_app.create_app(settings)
+    assert factory_app.state.settings is settings
+    assert shopify_app.SHOPIFY_METRICS_TOKEN != "factory-token"
+    with TestClient(factory_app) as client:
+        assert client.get("/shopify/metrics").status_code == 401
+        assert client.get("/shopify/metrics", headers={"Authorization": "Bearer factory-token"}).status_code == 200
+    assert shopify_app.SUPABASE_FUNCTION_BASE == "https://factory.supabase.co/functions/v1"
+
+
+def test_lifespan_refuses_to_start_without_supabase(restore_settings):
+    with pytest.raises(RuntimeError, match="SUPABASE_URL"):
+        with TestClient(shopify_app.create_app(ShopifySettings(state_url="memory://"))):
+            pass
+
+
+def test_settings_from_env_parses_types():
+    settings = ShopifySettings.from_env(
+        {"SHOPIFY_TEST_BILLING": "yes", "SHOPIFY_PROFILE_KEEP": "5", "SHOPIFY_STATE_URL": "", "SHOPIFY_APP_HANDLE": " nudio "}
+    )
+    assert settings.test_billing is True
+    assert settings.profile_keep == 5
+    assert settings.state_url == ShopifySettings().state_url
+    assert settings.app_handle == "nudio"
+    assert settings.missing_required() == ["SUPABASE_URL", "SUPABASE_SERVICE_KEY"]
+
+
+def _session_headers(shop="test.myshopify.com"):
+    now = int(datetime.now(timezone.utc).timestamp())
+    token = jwt.encode(
+        {"iss": f"https://{shop}/admin", "dest": f"https://{shop}", "aud": "api_key", "sub": "1", "exp": now + 60, "iat": now},
+        "secret",
+        algorithm="HS256",
+    )
+    return {"Authorization": f"Bearer {token}"}
+
+
+_USAGE_SUBSCRIPTIONS = [
+    {
+        "name": "Nudio (Product Studio)",
+        "lineItems": [{"id": "gid://shopify/AppSubscriptionLineItem/1", "plan": {"pricingDetails": {"__typename": "AppUsagePricing"}}}],
+    }
+]
+
+
+def _edge_function(
+    status=200, content=b'{"image": "data:image/png;base64,AAAA"}', delay=0.0, calls=None, drop_after=None
+):
+    real_client = httpx.AsyncClient
+
+    async def chunks():
+        # An async body keeps the mock response unread, like a real network stream.
+        for offset in range(0, len(content), 16384):
+            if drop_after is not None and offset >= drop_after:
+                raise httpx.ReadError("connection reset")
+            yield content[offset : offset + 16384]
+
+    async def handler(request):
+        if calls is not None:
+            calls.append("started")
+        await asyncio.sleep(delay)
+        if calls is not None:
+            calls.append("finished")
+        return httpx.Response(status, content=chunks(), headers={"Content-Type": "application/json"})
+
+    transport = httpx.MockTransport(handler)
+    return patch("shopify_app.httpx.AsyncClient", lambda **kwargs: real_client(transport=transport, **kwargs))
+
+
+@pytest.fixture
+def optimize_upstreams():
+    with patch("shopify_app.SHOPIFY_API_KEY", "api_key"), patch("shopify_app.SHOPIFY_API_SECRET", "secret"), patch(
+        "shopify_app.SUPABASE_FUNCTION_BASE", "https://example.supabase.co/functions/v1"
+    ), patch("shopify_app._get_shop_record", return_value={"access_token": "shpat"}), patch(
+        "shopify_app._shopify_active_subscriptions", AsyncMock(return_value=_USAGE_SUBSCRIPTIONS)
+    ), patch(
+        "shopify_app._create_usage_record", AsyncMock(return_value="gid://shopify/AppUsageRecord/9")
+    ) as create_usage:
+        yield create_usage
+
+
+def test_optimize_listing_adds_usage_record_to_body(optimize_upstreams):
+    with _edge_function():
+        response = TestClient(app).post("/shopify/optimize-listing", json={"imageBase64": "AAAA"}, headers=_session_headers())
+    assert response.status_code == 200
+    assert response.json() == {"image": "data:image/png;base64,AAAA", "usageRecordId": "gid://shopify/AppUsageRecord/9"}
+
+
+def test_optimize_listing_stream_relays_body_then_bills(optimize_upstreams):
+    upstream_body = b'{"image": "data:image/png;base64,' + b"A" * 65536 + b'"}'
+    with _edge_function(content=upstream_body):
+        response = TestClient(app).post(
+            "/shopify/optimize-listing?stream=true", json={"imageBase64": "AAAA"}, headers=_session_headers()
+        )
+    assert response.status_code == 200
+    assert response.content == upstream_body
+    assert response.headers["content-type"] == "application/json"
+    assert "x-nudio-usage-record-id" not in response.headers
+    assert "edge_function;dur=" in response.headers["server-timing"]
+    optimize_upstreams.assert_awaited_once()
+
+
+def test_optimize_listing_stream_does_not_bill_a_body_cut_off_midway(optimize_upstreams):
+    upstream_body = b'{"image": "data:image/png;base64,' + b"A" * 65536 + b'"}'
+    with _edge_function(content=upstream_body, drop_after=16384), pytest.raises(httpx.ReadError):
+        TestClient(app).post(
+            "/shopify/optimize-listing?stream=true", json={"imageBase64": "AAAA"}, headers=_session_headers()
+        )
+    optimize_upstreams.assert_not_awaited()
+
+
+def test_optimize_listing_stream_closes_upstream_when_client_leaves_before_the_body():
+    async def body():
+        yield b"{}"
+
+    async def scenario():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: httpx.Response(200, content=body())))
+        upstream = await client.send(client.build_request("POST", "https://edge.test/optimize-listing"), stream=True)
+        bill = AsyncMock()
+        relayed = shopify_app._relay_optimize_response(client, upstream, bill)
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            # The disconnect lands while the response headers are being written.
+            await asyncio.sleep(0)
+
+        await relayed({"type": "http"}, receive, send)
+        return client, upstream, bill
+
+    client, upstream, bill = asyncio.run(scenario())
+    assert upstream.is_closed and client.is_closed
+    bill.assert_not_awaited()
+
+
+def test_optimize_listing_stream_does_not_bill_failed_upstream(optimize_upstreams):
+    with _edge_function(status=422, content=b'{"error": "unsupported image"}'):
+        response = TestClient(app).post(
+            "/shopify/optimize-listing?stream=true", json={"imageBase64": "AAAA"}, headers=_session_headers()
+        )
+    assert response.status_code == 422
+    assert response.json() == {"detail": {"error": "unsupported image"}}
+    optimize_upstreams.assert_not_awaited()
+
+
+def test_optimize_listing_overlaps_edge_call_with_subscription_check(optimize_upstreams):
+    async def slow_subscriptions(shop, access_token):
+        await asyncio.sleep(0.3)
+        return _USAGE_SUBSCRIPTIONS
+
+    with _edge_function(delay=0.3), patch("shopify_app._shopify_active_subscriptions", slow_subscriptions):
+        started = time.perf_counter()
+        response = TestClient(app).post("/shopify/optimize-listing", json={"imageBase64": "AAAA"}, headers=_session_headers())
+        elapsed = time.perf_counter() - started
+    assert response.status_code == 200
+    assert elapsed < 0.55
+
+
+def test_optimize_listing_cancels_edge_call_when_shop_is_not_eligible(optimize_upstreams):
+    calls = []
+    with _edge_function(delay=5.0, calls=calls), patch(
+        "shopify_app._shopify_active_subscriptions", AsyncMock(return_value=[])
+    ):
+        started = time.perf_counter()
+        response = TestClient(app).post("/shopify/optimize-listing", json={"imageBase64": "AAAA"}, headers=_session_headers())
+        elapsed = time.perf_counter() - started
+    assert response.status_code == 402
+    assert elapsed < 2.0
+    assert calls == ["started"]
+    optimize_upstreams.assert_not_awaited()
+
+
+def test_optimize_listing_sheds_load_with_retry_after(optimize_upstreams):
+    scheduler = FairScheduler(global_limit=1, shop_limit=1, max_queue_depth=0, max_shop_queue_depth=0)
+    calls = []
+
+    async def occupy():
+        scheduler.admit("busy.myshopify.com")
+
+    asyncio.run(occupy())
+    with _edge_function(calls=calls), patch("shopify_app._EDGE_SCHEDULER", scheduler):
+        response = TestClient(app).post("/shopify/optimize-listing", json={"imageBase64": "AAAA"}, headers=_session_headers())
+    assert response.status_code == 503
+    assert int(response.headers["retry-after"]) >= 1
+    assert response.json()["detail"]["reason"] == "queue_full"
+    assert calls == []
+    optimize_upstreams.assert_not_awaited()
+
+
+def test_overloaded_edge_function_shrinks_the_concurrency_limit(optimize_upstreams):
+    limiter = AIMDLimit(initial_limit=8, min_limit=2, max_limit=32)
+    scheduler = FairScheduler(global_limit=8, shop_limit=4, max_queue_depth=10, max_shop_queue_depth=10)
+    with _edge_function(status=503, content=b'{"error": "overloaded"}'), patch(
+        "shopify_app._EDGE_LIMIT", limiter
+    ), patch("shopify_app._EDGE_SCHEDULER", scheduler):
+        response = TestClient(app).post("/shopify/optimize-listing", json={"imageBase64": "AAAA"}, headers=_session_headers())
+    assert response.status_code == 503
+    assert limiter.limit == 6
+    assert scheduler.global_limit == 6
+    assert scheduler.in_flight == 0
+
+
+def test_rejected_and_streamed_calls_leave_the_latency_baseline_alone(optimize_upstreams):
+    limiter = AIMDLimit(initial_limit=8, min_limit=2, max_limit=32)
+    with patch("shopify_app._EDGE_LIMIT", limiter):
+        client = TestClient(app)
+        with _edge_function(status=400, content=b'{"error": "bad image"}'):
+            client.post("/shopify/optimize-listing", json={"imageBase64": "AAAA"}, headers=_session_headers())
+        with _edge_function():
+            client.post("/shopify/optimize-listing?stream=true", json={"imageBase64": "AAAA"}, headers=_session_headers())
+        assert limiter.baseline is None
+        with _edge_function():
+            client.post("/shopify/optimize-listing", json={"imageBase64": "AAAA"}, headers=_session_headers())
+    assert limiter.baseline is not None
+
+
+PNG_BASE64 = base64.b64encode(b"\x89PNG\r\n\x1a\n" + b"0" * 64).decode()
+
+
+class FakeMediaApi:
+    """Answers the batch upload GraphQL mutations and records what was sent."""
+
+    def __init__(self, failing_product=None):
+        self.calls = []
+        self.failing_product = failing_product
+
+    async def __call__(self, shop, access_token, query, variables=None, phase=None):
+        self.calls.append((phase, variables))
+        if phase == "media_stage":
+            targets = [
+                {
+                    "url": "https://staged.example.com/upload",
+                    "resourceUrl": f"https://staged.example.com/{item['filename']}",
+                    "parameters": [{"name": "key", "value": item["filename"]}],
+                }
+                for item in variables["input"]
+            ]
+            return {"data": {"stagedUploadsCreate": {"stagedTargets": targets, "userErrors": []}}}
+        if phase == "media_create":
+            if variables["productId"].endswith(str(self.failing_product)):
+                errors = [{"field": ["media", "0", "originalSource"], "message": "Bad image", "code": "INVALID"}]
+                media = [None] + [{"id": "gid://shopify/MediaImage/2", "status": "UPLOADED"}] * (len(variables["media"]) - 1)
+                return {"data": {"productCreateMedia": {"media": media, "mediaUserErrors": errors}}}
+            media = [
+                {"id": f"gid://shopify/MediaImage/{variables['productId'].rsplit('/', 1)[1]}-{n}", "status": "UPLOADED"}
+                for n in range(len(variables["media"]))
+            ]
+            return {"data": {"productCreateMedia": {"media": media, "mediaUserErrors": []}}}
+        if phase == "media_reorder":
+            return {"data": {"productReorderMedia": {"job": {"id": "gid://shopify/Job/1"}, "mediaUserErrors": []}}}
+        raise AssertionError(phase)
+
+
+def _staged_storage(uploads):
+    real_client = httpx.AsyncClient
+
+    def handler(request):
+        uploads.append(request.url.host)
+        return httpx.Response(204)
+
+    return patch("shopify_app.httpx.AsyncClient", lambda **kwargs: real_client(transport=httpx.MockTransport(handler), **kwargs))
+
+
+@pytest.fixture
+def batch_upstreams():
+    with patch("shopify_app.SHOPIFY_API_KEY", "api_key"), patch("shopify_app.SHOPIFY_API_SECRET", "secret"), patch(
+        "shopify_app._get_shop_record", return_value={"access_token": "shpat"}
+    ):
+        yield
+
+
+def test_batch_upload_uses_one_stage_one_create_and_one_reorder_per_product(batch_upstreams):
+    api = FakeMediaApi()
+    uploads = []
+    images = [
+        {"product_id": "1", "image_base64": PNG_BASE64, "make_primary": True},
+        {"product_id": "1", "image_base64": f"data:image/jpeg;base64,{PNG_BASE64}"},
+        {"product_id": "2", "image_base64": PNG_BASE64, "alt": "Side"},
+    ]
+    with patch("shopify_app._shopify_graphql", api), _staged_storage(uploads):
+        response = TestClient(app).post("/shopify/products/images/batch", json={"images": images}, headers=_session_headers())
+    assert response.status_code == 200
+    body = response.json()
+    assert body["succeeded"] == 3 and body["failed"] == 0
+    assert body["results"][0] == {
+        "index": 0,
+        "product_id": "1",
+        "ok": True,
+        "media_id": "gid://shopify/MediaImage/1-0",
+        "status": "UPLOADED",
+        "reordered": True,
+    }
+    phases = [phase for phase, _ in api.calls]
+    assert phases.count("media_stage") == 1
+    assert phases.count("media_create") == 2
+    assert phases.count("media_reorder") == 1
+    stage_input = api.calls[0][1]["input"]
+    assert [item["mimeType"] for item in stage_input] == ["image/png", "image/jpeg", "image/png"]
+    reorder = next(variables for phase, variables in api.calls if phase == "media_reorder")
+    assert reorder == {"id": "gid://shopify/Product/1", "moves": [{"id": "gid://shopify/MediaImage/1-0", "newPosition": "0"}]}
+    assert len(uploads) == 3
+
+
+def test_batch_upload_reports_per_image_failures(batch_upstreams):
+    api = FakeMediaApi(failing_product=7)
+    images = [
+        {"product_id": "7", "image_base64": PNG_BASE64},
+        {"product_id": "7", "image_base64": PNG_BASE64},
+        {"product_id": "8", "image_base64": ""},
+    ]
+    with patch("shopify_app._shopify_graphql", api), _staged_storage([]):
+        response = TestClient(app).post("/shopify/products/images/batch", json={"images": images}, headers=_session_headers())
+    results = response.json()["results"]
+    assert [result["ok"] for result in results] == [False, True, False]
+    assert results[0]["error"] == "Bad image"
+    assert results[2]["error"] == "Missing image_base64."
+
+
+def test_batch_upload_rejects_oversized_batches(batch_upstreams):
+    images = [{"product_id": "1", "image_base64": PNG_BASE64}] * 26
+    response = TestClient(app).post("/shopify/products/images/batch", json={"images": images}, headers=_session_headers())
+    assert response.status_code == 400
+
+
+def test_catalog_export_endpoints_start_report_and_list(batch_upstreams, tmp_path):
+    async def graphql(shop, access_token, query, variables=None, phase=None):
+        if phase == "bulk_export":
+            return {"data": {"bulkOperationRunQuery": {"bulkOperation": {"id": "gid://shopify/BulkOperation/1"}}}}
+        return {"data": {"node": {"id": "gid://shopify/BulkOperation/1", "status": "COMPLETED", "url": None}}}
+
+    async def access_token(shop):
+        return "shpat"
+
+    index = CatalogIndex(tmp_path / "catalog.sqlite3")
+    index.write_batch("test.myshopify.com", "seed", [("gid://shopify/Product/1", "Mug", "mug", "ACTIVE", None)], [])
+    exporter = CatalogExporter(index, graphql, access_token, poll_interval=0)
+    with patch("shopify_app._CATALOG_INDEX", index), patch("shopify_app._CATALOG_EXPORTER", exporter):
+        client = TestClient(app)
+        assert client.get("/shopify/catalog/export", headers=_session_headers()).status_code == 404
+        listed = client.get("/shopify/catalog/products", headers=_session_headers()).json()
+        assert [product["title"] for product in listed["products"]] == ["Mug"]
+        started = client.post("/shopify/catalog/export", headers=_session_headers())
+        assert started.status_code == 202
+        assert started.json()["bulk_operation_id"] == "gid://shopify/BulkOperation/1"
+        status = client.get("/shopify/catalog/export", headers=_session_headers()).json()
+    assert status["id"] == started.json()["id"]
+    assert status["status"] in ("submitted", "completed")
+
+
+def _cdn_image(width=2400, height=1600, fmt="JPEG", calls=None):
+    from PIL import Image
+
+    buffer = BytesIO()
+    Image.new("RGB", (width, height), (200, 40, 90)).save(buffer, format=fmt)
+    real_client = httpx.AsyncClient
+
+    def handler(request):
+        if calls is not None:
+            calls.append(str(request.url))
+        return httpx.Response(200, content=buffer.getvalue(), headers={"Content-Type": "image/jpeg"})
+
+    transport = httpx.MockTransport(handler)
+    return patch("shopify_app.httpx.AsyncClient", lambda **kwargs: real_client(transport=transport, **kwargs))
+
+
+@patch("shopify_app.SHOPIFY_API_SECRET", "secret")
+def test_thumb_resizes_negotiates_format_and_caches(tmp_path):
+    from PIL import Image
+
+    src = "https://cdn.shopify.com/s/files/1/mug.jpg?v=1"
+    calls = []
+    with patch("shopify_app.SHOPIFY_THUMB_CACHE_DIR", str(tmp_path)), _cdn_image(calls=calls):
+        client = TestClient(app)
+        url = shopify_app._thumb_url(src, 300)
+        webp = client.get(url, headers={"Accept": "image/avif,image/webp,*/*"})
+        cached = client.get(url, headers={"Accept": "image/webp"})
+        jpeg = client.get(url, headers={"Accept": "image/*"})
+        revalidated = client.get(url, headers={"Accept": "image/webp", "If-None-Match": webp.headers["etag"]})
+    assert webp.headers["content-type"] == "image/webp"
+    assert webp.headers["cache-control"] == shopify_app.THUMB_CACHE_CONTROL
+    assert webp.headers["vary"] == "Accept"
+    assert Image.open(BytesIO(webp.content)).size == (320, 213)
+    assert (webp.headers["x-nudio-thumb-cache"], cached.headers["x-nudio-thumb-cache"]) == ("miss", "hit")
+    assert jpeg.headers["content-type"] == "image/jpeg"
+    assert Image.open(BytesIO(jpeg.content)).format == "JPEG"
+    assert revalidated.status_code == 304
+    assert len(calls) == 2
+
+
+@patch("shopify_app.SHOPIFY_API_SECRET", "secret")
+def test_thumb_rejects_unsigned_and_foreign_urls(tmp_path):
+    client = TestClient(app)
+    src = "https://cdn.shopify.com/s/files/1/mug.jpg"
+    assert client.get("/shopify/images/thumb", params={"src": src, "w": 160, "sig": "bogus"}).status_code == 401
+    foreign = "https://evil.example.com/a.jpg"
+    response = client.get(
+        "/shopify/images/thumb", params={"src": foreign, "w": 160, "sig": shopify_app._thumb_signature(foreign, 160)}
+    )
+    assert response.status_code == 400
+
+
+@patch("shopify_app.SHOPIFY_API_SECRET", "secret")
+def test_product_images_include_signed_thumb_urls():
+    images = {"images": [{"id": 1, "src": "https://cdn.shopify.com/s/files/1/mug.jpg"}, {"id": 2, "src": "http://x"}]}
+    with patch("shopify_app.SHOPIFY_API_KEY", "api_key"), patch(
+        "shopify_app._get_shop_record", return_value={"access_token": "shpat"}
+    ), patch("shopify_app._shopify_rest", AsyncMock(return_value=images)):
+        body = TestClient(app).get("/shopify/products/1/images", headers=_session_headers()).json()
+    assert body["images"][0]["thumb_url"] == shopify_app._thumb_url("https://cdn.shopify.com/s/files/1/mug.jpg")
+    assert "thumb_url" not in body["images"][1]
+
+
+def test_optimize_listing_url_delivery_stores_result_and_serves_signed_link(optimize_upstreams, tmp_path):
+    image = "data:image/png;base64," + base64.b64encode(b"optimized-png").decode("ascii")
+    store = LocalStore(tmp_path, base_url="/shopify/results", secret="secret")
+    with _edge_function(content=('{"success": true, "image": "%s"}' % image).encode()), patch(
+        "shopify_app._RESULT_STORE", store
+    ), patch("shopify_app.SHOPIFY_RESULT_URL_SECRET", "secret"):
+        client = TestClient(app)
+        response = client.post(
+            "/shopify/optimize-listing?delivery=url",
+            json={"imageBase64": "data:image/png;base64,AAAA"},
+            headers=_session_headers(),
+        )
+        body = response.json()
+        assert "image" not in body
+        assert body["imageUrl"].startswith("/shopify/results/results/")
+        served = client.get(body["imageUrl"])
+        tampered = client.get(body["imageUrl"].replace("sig=", "sig=0"))
+    assert served.status_code == 200
+    assert served.content == b"optimized-png"
+    assert served.headers["content-type"] == "image/png"
+    assert served.headers["cache-control"] == "public, max-age=31536000, immutable"
+    assert tampered.status_code == 401
+
+
+def test_optimize_listing_url_delivery_needs_a_result_url_secret(optimize_upstreams, tmp_path):
+    store = LocalStore(tmp_path, base_url="/shopify/results", secret="")
+    key = store.put(b"optimized-png", "image/png").key
+    with _edge_function(), patch("shopify_app._RESULT_STORE", store), patch(
+        "shopify_app.SHOPIFY_RESULT_URL_SECRET", ""
+    ):
+        client = TestClient(app)
+        response = client.post(
+            "/shopify/optimize-listing?delivery=url",
+            json={"imageBase64": "data:image/png;base64,AAAA"},
+            headers=_session_headers(),
+        )
+        # A link signed with an empty key must not be honoured either
+        forged = client.get(store.signed_url(key, 60))
+    assert response.status_code == 400
+    assert "SHOPIFY_RESULT_URL_SECRET" in response.json()["detail"]
+    assert forged.status_code == 404
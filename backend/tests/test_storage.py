@@ -0,0 +1,87 @@
+import pathlib
+import sys
+import time
+
+import pytest
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from storage import LocalStore, SupabaseStore, create_store, decode_data_url, is_valid_key, register_backend
+
+
+def test_put_is_content_addressed_and_idempotent(tmp_path):
+    store = LocalStore(tmp_path, base_url="https://app.example/results", secret="s")
+    first = store.put(b"png-bytes", "image/png")
+    second = store.put(b"png-bytes", "image/png")
+    assert first == second
+    assert is_valid_key(first.key) and first.key.endswith(".png")
+    assert store.read(first.key) == b"png-bytes"
+    assert len(list(tmp_path.rglob("*.png"))) == 1
+
+
+def test_signed_url_verifies_and_is_stable_within_window(tmp_path):
+    store = LocalStore(tmp_path, base_url="/results", secret="s")
+    key = store.put(b"data", "image/webp").key
+    url = store.signed_url(key, 3600)
+    assert url == store.signed_url(key, 3600)
+    assert url.startswith(f"/results/{key}?expires=")
+    query = dict(part.split("=") for part in url.split("?", 1)[1].split("&"))
+    assert store.verify(key, int(query["expires"]), query["sig"])
+    assert not store.verify(key, int(query["expires"]), "0" * 64)
+    assert not store.verify(key, int(time.time()) - 1, store._signature(key, int(time.time()) - 1))
+    assert not LocalStore(tmp_path, secret="other").verify(key, int(query["expires"]), query["sig"])
+
+
+def test_local_store_rejects_path_traversal(tmp_path):
+    with pytest.raises(KeyError):
+        LocalStore(tmp_path).path("../../etc/passwd")
+
+
+def test_decode_data_url():
+    assert decode_data_url("data:image/jpeg;base64,aGk=") == (b"hi", "image/jpeg")
+    assert decode_data_url("aGk=") == (b"hi", "image/png")
+
+
+class FakeBucket:
+    def __init__(self):
+        self.files = {}
+
+    def list(self, folder, options):
+        return [{"name": key.rsplit("/", 1)[1]} for key in self.files if key.startswith(folder + "/")]
+
+    def upload(self, key, data, options):
+        self.files[key] = (data, options["content-type"])
+
+    def download(self, key):
+        return self.files[key][0]
+
+    def create_signed_url(self, key, expires_in):
+        return {"signedURL": f"https://cdn.example/{key}?token=t&ttl={expires_in}"}
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.bucket = FakeBucket()
+        self.storage = self
+
+    def from_(self, name):
+        return self.bucket
+
+
+def test_supabase_store_uploads_once_and_signs():
+    client = FakeSupabase()
+    store = SupabaseStore("results", client)
+    key = store.put(b"img", "image/png").key
+    client.bucket.upload = lambda *args: pytest.fail("uploaded twice")
+    assert store.put(b"img", "image/png").key == key
+    assert store.read(key) == b"img"
+    assert store.signed_url(key, 60) == f"https://cdn.example/{key}?token=t&ttl=60"
+
+
+def test_create_store_resolves_schemes(tmp_path):
+    assert isinstance(create_store(f"file://{tmp_path}"), LocalStore)
+    register_backend("fake", lambda url, **options: SupabaseStore("b", FakeSupabase()))
+    assert isinstance(create_store("fake://anything"), SupabaseStore)
+    with pytest.raises(ValueError):
+        create_store("ftp://nope")
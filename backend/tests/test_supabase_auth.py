@@ -0,0 +1,108 @@
+import asyncio
+import pathlib
+import sys
+import time
+
+import httpx
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import ec
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from supabase_auth import TokenVerifier
+
+SECRET = "super-secret-jwt-token-with-at-least-32-characters"
+JWKS_URL = "https://project.supabase.co/auth/v1/.well-known/jwks.json"
+
+
+def _claims(**overrides):
+    claims = {
+        "sub": "user-1",
+        "email": "seller@example.com",
+        "role": "authenticated",
+        "aud": "authenticated",
+        "session_id": "session-1",
+        "exp": int(time.time()) + 3600,
+    }
+    claims.update(overrides)
+    return claims
+
+
+def _ec_key(kid):
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    jwk = jwt.algorithms.ECAlgorithm.to_jwk(private_key.public_key(), as_dict=True)
+    jwk.update({"kid": kid, "alg": "ES256", "use": "sig"})
+    return private_key, jwk
+
+
+def _jwks_verifier(jwks, fetches, **options):
+    def handler(request):
+        fetches.append(str(request.url))
+        return httpx.Response(200, json={"keys": list(jwks)})
+
+    transport = httpx.MockTransport(handler)
+    return TokenVerifier(jwks_url=JWKS_URL, http_client=lambda: httpx.AsyncClient(transport=transport), **options)
+
+
+def test_hs256_tokens_are_verified_locally_and_cached():
+    verifier = TokenVerifier(jwt_secret=SECRET)
+    token = jwt.encode(_claims(), SECRET, algorithm="HS256")
+
+    first = asyncio.run(verifier.verify(token))
+    assert first.user.id == "user-1"
+    assert first.user.email == "seller@example.com"
+    verifier.jwt_secret = "rotated"
+    # Served from the identity cache without checking the signature again.
+    assert asyncio.run(verifier.verify(token)) is first
+
+
+def test_bad_tokens_are_rejected():
+    verifier = TokenVerifier(jwt_secret=SECRET)
+    expired = jwt.encode(_claims(exp=int(time.time()) - 60), SECRET, algorithm="HS256")
+    wrong_audience = jwt.encode(_claims(aud="anon"), SECRET, algorithm="HS256")
+    forged = jwt.encode(_claims(), "another-secret-that-is-also-long-enough", algorithm="HS256")
+
+    for token in (expired, wrong_audience, forged, "not-a-jwt"):
+        with pytest.raises(jwt.InvalidTokenError):
+            asyncio.run(verifier.verify(token))
+
+
+def test_tokens_without_a_local_key_defer_to_remote_check():
+    token = jwt.encode(_claims(), SECRET, algorithm="HS256")
+    assert asyncio.run(TokenVerifier().verify(token)) is None
+
+
+def test_jwks_keys_are_fetched_once_and_refreshed_on_rotation():
+    old_key, old_jwk = _ec_key("old")
+    new_key, new_jwk = _ec_key("new")
+    jwks, fetches = [old_jwk], []
+    verifier = _jwks_verifier(jwks, fetches, jwks_min_refresh_seconds=0)
+
+    async def scenario():
+        first = await verifier.verify(jwt.encode(_claims(sub="a"), old_key, algorithm="ES256", headers={"kid": "old"}))
+        second = await verifier.verify(jwt.encode(_claims(sub="b"), old_key, algorithm="ES256", headers={"kid": "old"}))
+        jwks.append(new_jwk)
+        rotated = await verifier.verify(jwt.encode(_claims(sub="c"), new_key, algorithm="ES256", headers={"kid": "new"}))
+        return first, second, rotated
+
+    first, second, rotated = asyncio.run(scenario())
+    assert (first.user.id, second.user.id, rotated.user.id) == ("a", "b", "c")
+    assert fetches == [JWKS_URL, JWKS_URL]
+
+
+def test_unknown_kid_is_rejected_without_refetching_too_often():
+    key, jwk = _ec_key("known")
+    stranger, _ = _ec_key("stranger")
+    fetches = []
+    verifier = _jwks_verifier([jwk], fetches, jwks_min_refresh_seconds=60)
+
+    async def scenario():
+        await verifier.refresh_jwks()
+        for _ in range(3):
+            with pytest.raises(jwt.InvalidTokenError):
+                await verifier.verify(jwt.encode(_claims(), stranger, algorithm="ES256", headers={"kid": "stranger"}))
+
+    asyncio.run(scenario())
+    assert len(fetches) == 1
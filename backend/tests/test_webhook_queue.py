@@ -0,0 +1,82 @@
+import asyncio
+import pathlib
+import sys
+import time
+
+BACKEND_DIR = pathlib.Path(__file__).resolve().parents[1]
+sys.path.append(str(BACKEND_DIR))
+
+from webhook_queue import WebhookConsumer, WebhookQueue
+
+
+def test_enqueue_deduplicates_webhook_id_within_window(tmp_path):
+    queue = WebhookQueue(tmp_path / "q.sqlite3")
+    assert queue.enqueue("wh-1", "a.myshopify.com", "shop/redact", "delete_shop", b"{}") is True
+    assert queue.enqueue("wh-1", "a.myshopify.com", "shop/redact", "delete_shop", b"{}") is False
+    assert queue.enqueue("", "a.myshopify.com", "shop/redact", "delete_shop", b"{}") is True
+    assert queue.enqueue("", "a.myshopify.com", "shop/redact", "delete_shop", b"{}") is True
+    assert queue.pending_count() == 3
+
+
+def test_duplicate_outside_window_is_accepted(tmp_path):
+    queue = WebhookQueue(tmp_path / "q.sqlite3", dedupe_window_seconds=0.0)
+    queue.enqueue("wh-1", "a.myshopify.com", "app/uninstalled", "delete_shop", b"{}")
+    time.sleep(0.01)
+    assert queue.enqueue("wh-1", "a.myshopify.com", "app/uninstalled", "delete_shop", b"{}") is True
+
+
+def test_claim_returns_one_delivery_per_shop_in_order(tmp_path):
+    queue = WebhookQueue(tmp_path / "q.sqlite3")
+    queue.enqueue("1", "a.myshopify.com", "app/uninstalled", "delete_shop", b"")
+    queue.enqueue("2", "a.myshopify.com", "shop/redact", "delete_shop", b"")
+    queue.enqueue("3", "b.myshopify.com", "shop/redact", "delete_shop", b"")
+    first = queue.claim()
+    assert [(d.webhook_id, d.shop) for d in first] == [("1", "a.myshopify.com"), ("3", "b.myshopify.com")]
+    # Shop a still has a delivery in flight, so its next one waits.
+    assert queue.claim() == []
+    queue.complete(first[0].id)
+    assert [d.webhook_id for d in queue.claim()] == ["2"]
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    queue = WebhookQueue(tmp_path / "q.sqlite3", lease_seconds=0.0)
+    queue.enqueue("1", "a.myshopify.com", "app/uninstalled", "delete_shop", b"")
+    assert len(queue.claim()) == 1
+    time.sleep(0.01)
+    assert [d.webhook_id for d in queue.claim()] == ["1"]
+
+
+def test_consumer_retries_failures_and_keeps_shop_order(tmp_path):
+    queue = WebhookQueue(tmp_path / "q.sqlite3")
+    queue.enqueue("1", "a.myshopify.com", "app/uninstalled", "delete_shop", b"")
+    queue.enqueue("2", "a.myshopify.com", "shop/redact", "delete_shop", b"")
+    seen = []
+    failures = {"1": 1}
+
+    async def handler(delivery):
+        seen.append(delivery.webhook_id)
+        if failures.get(delivery.webhook_id):
+            failures[delivery.webhook_id] -= 1
+            raise RuntimeError("supabase down")
+
+    consumer = WebhookConsumer(queue, handler, base_backoff=0.0)
+    asyncio.run(consumer.drain())
+    assert seen == ["1", "1", "2"]
+    assert queue.pending_count() == 0
+
+
+def test_consumer_gives_up_after_max_attempts(tmp_path):
+    queue = WebhookQueue(tmp_path / "q.sqlite3")
+    queue.enqueue("1", "a.myshopify.com", "app/uninstalled", "delete_shop", b"")
+    queue.enqueue("2", "a.myshopify.com", "shop/redact", "delete_shop", b"")
+    seen = []
+
+    async def handler(delivery):
+        seen.append(delivery.webhook_id)
+        if delivery.webhook_id == "1":
+            raise RuntimeError("bad payload")
+
+    consumer = WebhookConsumer(queue, handler, max_attempts=2, base_backoff=0.0)
+    asyncio.run(consumer.drain())
+    assert seen == ["1", "1", "2"]
+    assert queue.pending_count() == 0
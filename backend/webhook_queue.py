@@ -0,0 +1,279 @@
+"""Durable local queue for Shopify webhook deliveries.
+
+Webhook routes verify the HMAC, persist the delivery here and acknowledge
+immediately; ``WebhookConsumer`` does the Supabase work in the background.
+
+- Deliveries live in SQLite (WAL, ``synchronous=FULL``) so an acknowledged
+  webhook survives a restart.
+- ``X-Shopify-Webhook-Id`` is unique per delivery and reused by Shopify on
+  retries, so a repeat id inside the dedupe window is dropped.
+- Deliveries for one shop are processed strictly in arrival order; a failed
+  delivery blocks later ones for that shop until it succeeds or gives up.
+  Different shops are processed concurrently.
+- Rows are claimed with a lease, so several workers can share one file
+  without processing a delivery twice.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from metrics import REGISTRY
+
+WEBHOOK_DELIVERIES = REGISTRY.counter(
+    "shopify_webhook_deliveries_total",
+    "Webhook deliveries by outcome (queued, duplicate, processed, retried, failed).",
+    ("outcome",),
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS webhook_deliveries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    webhook_id TEXT,
+    shop TEXT NOT NULL,
+    topic TEXT NOT NULL,
+    action TEXT NOT NULL,
+    payload BLOB,
+    received_at REAL NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    claimed_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS webhook_deliveries_webhook_id ON webhook_deliveries (webhook_id);
+CREATE INDEX IF NOT EXISTS webhook_deliveries_status ON webhook_deliveries (status, shop, id);
+"""
+
+
+@dataclass(frozen=True)
+class WebhookDelivery:
+    id: int
+    webhook_id: str | None
+    shop: str
+    topic: str
+    action: str
+    payload: bytes
+    attempts: int
+
+
+class WebhookQueue:
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        dedupe_window_seconds: float = 86400.0,
+        lease_seconds: float = 300.0,
+    ):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.dedupe_window_seconds = dedupe_window_seconds
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None, timeout=30.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def enqueue(self, webhook_id: str | None, shop: str, topic: str, action: str, payload: bytes) -> bool:
+        """Persist a delivery; returns False when ``webhook_id`` was already seen in the window."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if webhook_id:
+                    seen = self._conn.execute(
+                        "SELECT 1 FROM webhook_deliveries WHERE webhook_id = ? AND received_at >= ? LIMIT 1",
+                        (webhook_id, now - self.dedupe_window_seconds),
+                    ).fetchone()
+                    if seen:
+                        self._conn.execute("COMMIT")
+                        WEBHOOK_DELIVERIES.inc(outcome="duplicate")
+                        return False
+                self._conn.execute(
+                    "INSERT INTO webhook_deliveries (webhook_id, shop, topic, action, payload, received_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (webhook_id or None, shop, topic, action, payload, now),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        WEBHOOK_DELIVERIES.inc(outcome="queued")
+        return True
+
+    def claim(self, limit: int = 100) -> list[WebhookDelivery]:
+        """Lease the oldest due delivery of every shop that has nothing in flight."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Expired leases belong to a worker that died mid-delivery.
+                self._conn.execute(
+                    "UPDATE webhook_deliveries SET status = 'pending', claimed_at = NULL "
+                    "WHERE status = 'processing' AND claimed_at < ?",
+                    (now - self.lease_seconds,),
+                )
+                rows = self._conn.execute(
+                    """
+                    SELECT id, webhook_id, shop, topic, action, payload, attempts
+                    FROM webhook_deliveries AS d
+                    WHERE status = 'pending'
+                      AND next_attempt_at <= ?
+                      AND id = (SELECT MIN(id) FROM webhook_deliveries
+                                WHERE shop = d.shop AND status IN ('pending', 'processing'))
+                    ORDER BY id
+                    LIMIT ?
+                    """,
+                    (now, limit),
+                ).fetchall()
+                if rows:
+                    self._conn.executemany(
+                        "UPDATE webhook_deliveries SET status = 'processing', claimed_at = ? WHERE id = ?",
+                        [(now, row[0]) for row in rows],
+                    )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return [WebhookDelivery(*row) for row in rows]
+
+    def complete(self, delivery_id: int) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE webhook_deliveries SET status = 'done', payload = NULL, claimed_at = NULL WHERE id = ?",
+                (delivery_id,),
+            )
+
+    def fail(self, delivery_id: int, error: str, retry_at: float | None) -> None:
+        """Record a failed attempt; ``retry_at=None`` gives up on the delivery."""
+        with self._lock:
+            if retry_at is None:
+                self._conn.execute(
+                    "UPDATE webhook_deliveries SET status = 'failed', attempts = attempts + 1, "
+                    "claimed_at = NULL, last_error = ? WHERE id = ?",
+                    (error, delivery_id),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE webhook_deliveries SET status = 'pending', attempts = attempts + 1, "
+                    "claimed_at = NULL, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                    (retry_at, error, delivery_id),
+                )
+
+    def prune(self) -> int:
+        """Drop finished deliveries once they fall out of the dedupe window."""
+        cutoff = time.time() - self.dedupe_window_seconds
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM webhook_deliveries WHERE status IN ('done', 'failed') AND received_at < ?",
+                (cutoff,),
+            )
+        return cursor.rowcount
+
+    def pending_count(self) -> int:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) FROM webhook_deliveries WHERE status IN ('pending', 'processing')"
+            ).fetchone()
+        return int(row[0])
+
+
+class WebhookConsumer:
+    """Background task draining a ``WebhookQueue`` with per-shop ordering."""
+
+    def __init__(
+        self,
+        queue: WebhookQueue,
+        handler: Callable[[WebhookDelivery], Awaitable[None]],
+        poll_interval: float = 2.0,
+        max_attempts: int = 8,
+        base_backoff: float = 2.0,
+    ):
+        self.queue = queue
+        self.handler = handler
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.base_backoff = base_backoff
+        self._wakeup = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._last_prune = 0.0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="shopify-webhook-consumer")
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    async def drain(self) -> int:
+        """Process everything currently due; returns the number of deliveries handled."""
+        handled = 0
+        while True:
+            batch = await asyncio.to_thread(self.queue.claim)
+            if not batch:
+                return handled
+            await asyncio.gather(*(self._process(delivery) for delivery in batch))
+            handled += len(batch)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.drain()
+                if time.monotonic() - self._last_prune > 3600:
+                    self._last_prune = time.monotonic()
+                    await asyncio.to_thread(self.queue.prune)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logging.exception("webhook_consumer_failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def _process(self, delivery: WebhookDelivery) -> None:
+        try:
+            await self.handler(delivery)
+        except Exception as exc:
+            attempts = delivery.attempts + 1
+            if attempts >= self.max_attempts:
+                retry_at = None
+                WEBHOOK_DELIVERIES.inc(outcome="failed")
+            else:
+                retry_at = time.time() + self.base_backoff * (2 ** delivery.attempts)
+                WEBHOOK_DELIVERIES.inc(outcome="retried")
+            logging.warning(
+                "webhook_delivery_failed id=%s shop=%s topic=%s attempts=%s err=%s",
+                delivery.id,
+                delivery.shop,
+                delivery.topic,
+                attempts,
+                exc,
+            )
+            await asyncio.to_thread(self.queue.fail, delivery.id, str(exc), retry_at)
+            return
+        await asyncio.to_thread(self.queue.complete, delivery.id)
+        WEBHOOK_DELIVERIES.inc(outcome="processed")
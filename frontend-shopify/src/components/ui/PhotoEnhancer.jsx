@@ -1629,7 +1629,7 @@ export function PhotoEnhancer({
                     className="rounded-2xl overflow-hidden border border-white/10 bg-black/30 hover:border-white/30 transition"
                   >
                     <img
-                      src={image.src}
+                      src={image.thumb_url ? buildBackendUrl(image.thumb_url) : image.src}
                       alt={image.alt || "Shopify product"}
                       className="w-full h-28 object-cover"
                       loading="lazy"
@@ -0,0 +1,105 @@
+-- Atomic listing quota for the listing API (backend/listing_quota.py).
+--
+-- reserve_listing_quota checks the limit and takes a slot in one locked
+-- statement, so concurrent requests cannot both pass the last free slot.
+-- The API then saves the listing and commits the reservation in one call to
+-- save_listing_with_quota (*_save_listing_with_quota.sql), or calls
+-- refund_listing_quota if generation fails. Reservations that are neither
+-- committed nor refunded (e.g. a crashed worker) are handed back by the
+-- user's next reserve call once they expire.
+
+create table if not exists public.listing_quota_reservations (
+  id uuid primary key default gen_random_uuid(),
+  user_id uuid not null references public.profiles(id) on delete cascade,
+  status text not null default 'reserved' check (status in ('reserved', 'committed', 'refunded')),
+  created_at timestamptz not null default now(),
+  expires_at timestamptz not null
+);
+
+create index if not exists listing_quota_reservations_pending_idx
+  on public.listing_quota_reservations (user_id, expires_at)
+  where status = 'reserved';
+
+alter table public.listing_quota_reservations enable row level security;
+
+create or replace function public.reserve_listing_quota(p_user_id uuid, p_ttl_seconds integer default 300)
+returns table (
+  allowed boolean,
+  is_premium boolean,
+  reservation_id uuid,
+  listings_used integer,
+  listings_limit integer,
+  remaining integer
+)
+language plpgsql
+security definer
+set search_path = public
+as $$
+#variable_conflict use_column
+declare
+  v_profile public.profiles%rowtype;
+  v_expired integer;
+  v_used integer;
+  v_reservation uuid;
+begin
+  select * into v_profile from public.profiles where id = p_user_id for update;
+  if not found then
+    return;
+  end if;
+
+  -- Premium listings are counted by save_listing_with_quota, after they succeed
+  if v_profile.is_premium then
+    return query select true, true, null::uuid, v_profile.listings_used, v_profile.listings_limit, null::integer;
+    return;
+  end if;
+
+  with expired as (
+    update public.listing_quota_reservations
+       set status = 'refunded'
+     where user_id = p_user_id and status = 'reserved' and expires_at < now()
+    returning 1
+  )
+  select count(*) into v_expired from expired;
+  v_used := greatest(v_profile.listings_used - v_expired, 0);
+
+  if v_used >= v_profile.listings_limit then
+    if v_expired > 0 then
+      update public.profiles set listings_used = v_used where id = p_user_id;
+    end if;
+    return query select false, false, null::uuid, v_used, v_profile.listings_limit, 0;
+    return;
+  end if;
+
+  insert into public.listing_quota_reservations (user_id, expires_at)
+  values (p_user_id, now() + make_interval(secs => p_ttl_seconds))
+  returning id into v_reservation;
+  update public.profiles set listings_used = v_used + 1 where id = p_user_id;
+
+  return query select true, false, v_reservation, v_used + 1, v_profile.listings_limit,
+    v_profile.listings_limit - v_used - 1;
+end;
+$$;
+
+create or replace function public.refund_listing_quota(p_user_id uuid, p_reservation_id uuid)
+returns boolean
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+  update public.listing_quota_reservations
+     set status = 'refunded'
+   where id = p_reservation_id and user_id = p_user_id and status = 'reserved';
+  if not found then
+    return false;
+  end if;
+  update public.profiles set listings_used = greatest(listings_used - 1, 0) where id = p_user_id;
+  return true;
+end;
+$$;
+
+-- These take a user id as an argument, so only the service role may call them
+revoke execute on function public.reserve_listing_quota(uuid, integer) from public, anon, authenticated;
+revoke execute on function public.refund_listing_quota(uuid, uuid) from public, anon, authenticated;
+grant execute on function public.reserve_listing_quota(uuid, integer) to service_role;
+grant execute on function public.refund_listing_quota(uuid, uuid) to service_role;
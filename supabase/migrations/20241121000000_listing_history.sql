@@ -0,0 +1,12 @@
+-- Listing history pagination (GET /api/listings/history).
+--
+-- has_image lets the history page say which listings have an image without
+-- selecting optimized_image_url, which holds a multi-megabyte data URL on
+-- rows created before results moved to object storage. The index serves the
+-- newest-first keyset query on (created_at, id).
+
+alter table public.listings
+  add column if not exists has_image boolean generated always as (optimized_image_url is not null) stored;
+
+create index if not exists listings_user_created_at_id_idx
+  on public.listings (user_id, created_at desc, id desc);
@@ -0,0 +1,42 @@
+-- Save a listing and commit its quota reservation in one transaction
+-- (backend/listing_quota.py, ListingQuota.save).
+--
+-- Inserting the listing and committing the reservation as two calls left a
+-- gap: a failed commit followed by a refund kept the listing but gave the
+-- slot back. Here either both happen or neither does. A reservation that is
+-- no longer held (refunded, or expired and handed back) raises instead of
+-- saving a listing nobody paid for.
+
+create or replace function public.save_listing_with_quota(
+  p_user_id uuid,
+  p_reservation_id uuid,
+  p_listing jsonb
+)
+returns void
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+  if p_reservation_id is null then
+    -- Premium: hold no reservation, but usage is still counted
+    update public.profiles set listings_used = listings_used + 1 where id = p_user_id;
+  else
+    update public.listing_quota_reservations
+       set status = 'committed'
+     where id = p_reservation_id and user_id = p_user_id and status = 'reserved';
+    if not found then
+      raise exception 'listing quota reservation % is no longer held', p_reservation_id
+        using errcode = 'P0002';
+    end if;
+  end if;
+
+  insert into public.listings (id, user_id, original_description, optimized_description, optimized_image_url, created_at)
+  select r.id, p_user_id, r.original_description, r.optimized_description, r.optimized_image_url,
+         coalesce(r.created_at, now())
+    from jsonb_populate_record(null::public.listings, p_listing) as r;
+end;
+$$;
+
+revoke execute on function public.save_listing_with_quota(uuid, uuid, jsonb) from public, anon, authenticated;
+grant execute on function public.save_listing_with_quota(uuid, uuid, jsonb) to service_role;